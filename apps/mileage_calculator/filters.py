@@ -0,0 +1,19 @@
+'''
+Фильтры API калькулятора пробега.
+'''
+import django_filters
+
+from .models import TrainDailyRecord
+
+
+class TrainDailyRecordFilter(django_filters.FilterSet):
+    '''Фильтры ежедневных записей: поезд, тип поезда, депо и период дат.'''
+
+    class Meta:
+        model = TrainDailyRecord
+        fields = {
+            'train': ['exact'],
+            'record_date': ['exact', 'gte', 'lte'],
+            'train__type': ['exact'],
+            'train__depot': ['exact']
+        }
@@ -0,0 +1,87 @@
+'''
+Команда для сравнения сериализации больших списков ежедневных записей.
+'''
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from apps.mileage_calculator.models import Depot, Train, TrainDailyRecord
+from apps.mileage_calculator.renderers import FastJSONRenderer
+from apps.mileage_calculator.serializers import TrainDailyRecordSerializer, TrainDailyRecordRowSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнение TrainDailyRecordSerializer и облегченного представления записей на N строках'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Количество записей (по умолчанию 10000)')
+        parser.add_argument('--repeat', type=int, default=3, help='Число повторов, учитывается лучшее время')
+        parser.add_argument('--trains', type=int, default=100, help='Количество поездов для тестовых данных')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        # Тестовые данные создаются в транзакции и откатываются после замеров
+        with transaction.atomic():
+            self.create_records(rows, options['trains'])
+            queryset = TrainDailyRecord.objects.filter(train__name__startswith='BENCH-').order_by('-record_date', 'train_id')
+            field_names = TrainDailyRecordSerializer.Meta.fields
+
+            def serializer_path():
+                records = TrainDailyRecordSerializer.optimize_queryset(queryset, field_names)
+                return JSONRenderer().render(TrainDailyRecordSerializer(records, many=True).data)
+
+            def row_path():
+                records = TrainDailyRecordRowSerializer.row_queryset(queryset, field_names)
+                return FastJSONRenderer().render(TrainDailyRecordRowSerializer(records, many=True).data)
+
+            serializer_time, serializer_output = self.measure(serializer_path, options['repeat'])
+            row_time, row_output = self.measure(row_path, options['repeat'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'Записей: {rows}')
+        self.stdout.write(f'TrainDailyRecordSerializer + JSONRenderer: {serializer_time * 1000:.1f} мс')
+        self.stdout.write(f'TrainDailyRecordRowSerializer + FastJSONRenderer: {row_time * 1000:.1f} мс')
+        if row_time:
+            self.stdout.write(f'Ускорение: x{serializer_time / row_time:.1f}')
+        if serializer_output == row_output:
+            self.stdout.write(self.style.SUCCESS('Вывод совпадает побайтно'))
+        else:
+            self.stdout.write(self.style.ERROR('Вывод различается'))
+
+    def create_records(self, rows, trains_count):
+        depot = Depot.objects.create(name='BENCH-Депо')
+        trains = Train.objects.bulk_create([
+            Train(name=f'BENCH-{index:04d}', type='Ласточка', depot=depot)
+            for index in range(trains_count)])
+        days = -(-rows // trains_count)
+        start = date.today() - timedelta(days=days)
+        records = []
+        for offset in range(days):
+            for train_index, train in enumerate(trains):
+                if len(records) == rows:
+                    break
+                records.append(TrainDailyRecord(
+                    train=train,
+                    record_date=start + timedelta(days=offset),
+                    total_mileage=100000 + offset * 500 + train_index,
+                    daily_mileage=500,
+                    last_to_date=start,
+                    last_to_type='ТО-1',
+                    last_block_date=start,
+                    mileage_since_to=offset * 500,
+                    days_since_to=offset,
+                    avg_mileage=500.0 + train_index / 7,
+                    indicator_color='green'))
+        TrainDailyRecord.objects.bulk_create(records, batch_size=2000)
+
+    def measure(self, path, repeat):
+        '''Лучшее время из repeat запусков и результат последнего.'''
+        best = None
+        output = None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            output = path()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
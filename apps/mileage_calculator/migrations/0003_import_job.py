@@ -0,0 +1,156 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mileage_calculator", "0002_make_daily_mileage_optional"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает"),
+                            ("running", "Выполняется"),
+                            ("completed", "Завершена"),
+                            ("failed", "Ошибка"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "task_id",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        null=True,
+                        verbose_name="ID задачи Celery",
+                    ),
+                ),
+                (
+                    "error_message",
+                    models.TextField(
+                        blank=True, null=True, verbose_name="Сообщение об ошибке"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время запуска"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время завершения"
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        upload_to="imports/%Y/%m/%d/", verbose_name="Файл импорта"
+                    ),
+                ),
+                (
+                    "format",
+                    models.CharField(
+                        choices=[
+                            ("xlsx", "Excel 2007+"),
+                            ("xls", "Excel 97-2003"),
+                            ("csv", "CSV"),
+                            ("parquet", "Parquet"),
+                        ],
+                        max_length=10,
+                        verbose_name="Формат файла",
+                    ),
+                ),
+                (
+                    "sheet_name",
+                    models.CharField(
+                        default="Sheet1", max_length=255, verbose_name="Название листа"
+                    ),
+                ),
+                (
+                    "skip_rows",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Пропуск строк"
+                    ),
+                ),
+                (
+                    "update_existing",
+                    models.BooleanField(
+                        default=False, verbose_name="Обновлять существующие записи"
+                    ),
+                ),
+                (
+                    "partial_commit",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Фиксировать каждый пакет отдельно: ошибка не откатывает уже импортированные пакеты",
+                        verbose_name="Частичная фиксация",
+                    ),
+                ),
+                (
+                    "rows_read",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Прочитано строк"
+                    ),
+                ),
+                (
+                    "created_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Создано записей"
+                    ),
+                ),
+                (
+                    "updated_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Обновлено записей"
+                    ),
+                ),
+                (
+                    "errors_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Ошибок в строках"
+                    ),
+                ),
+                (
+                    "errors",
+                    models.JSONField(
+                        blank=True, default=list, verbose_name="Ошибки строк"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Задача импорта",
+                "verbose_name_plural": "Задачи импорта",
+                "db_table": "mileage_calculator_import_job",
+                "ordering": ["-created_at"],
+                "abstract": False,
+            },
+        ),
+    ]
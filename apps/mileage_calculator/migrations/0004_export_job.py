@@ -0,0 +1,135 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mileage_calculator", "0003_import_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает"),
+                            ("running", "Выполняется"),
+                            ("completed", "Завершена"),
+                            ("failed", "Ошибка"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "task_id",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        null=True,
+                        verbose_name="ID задачи Celery",
+                    ),
+                ),
+                (
+                    "error_message",
+                    models.TextField(
+                        blank=True, null=True, verbose_name="Сообщение об ошибке"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время запуска"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время завершения"
+                    ),
+                ),
+                (
+                    "filters_hash",
+                    models.CharField(
+                        db_index=True, max_length=64, verbose_name="Хеш фильтров"
+                    ),
+                ),
+                (
+                    "filters",
+                    models.JSONField(default=dict, verbose_name="Фильтры экспорта"),
+                ),
+                (
+                    "format",
+                    models.CharField(
+                        choices=[
+                            ("xlsx", "Excel 2007+"),
+                            ("csv", "CSV"),
+                            ("parquet", "Parquet"),
+                        ],
+                        default="xlsx",
+                        max_length=10,
+                        verbose_name="Формат файла",
+                    ),
+                ),
+                (
+                    "include_calculations",
+                    models.BooleanField(
+                        default=True, verbose_name="Включать расчетные поля"
+                    ),
+                ),
+                (
+                    "data_fingerprint",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Количество записей и время последнего изменения на момент выгрузки",
+                        max_length=100,
+                        verbose_name="Отпечаток данных",
+                    ),
+                ),
+                (
+                    "rows_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Выгружено строк"
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        blank=True,
+                        null=True,
+                        upload_to="exports/%Y/%m/%d/",
+                        verbose_name="Файл экспорта",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Задача экспорта",
+                "verbose_name_plural": "Задачи экспорта",
+                "db_table": "mileage_calculator_export_job",
+                "ordering": ["-created_at"],
+                "abstract": False,
+            },
+        ),
+    ]
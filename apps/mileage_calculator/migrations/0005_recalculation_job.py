@@ -0,0 +1,142 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mileage_calculator", "0004_export_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecalculationJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает"),
+                            ("running", "Выполняется"),
+                            ("completed", "Завершена"),
+                            ("failed", "Ошибка"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "task_id",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        null=True,
+                        verbose_name="ID задачи Celery",
+                    ),
+                ),
+                (
+                    "error_message",
+                    models.TextField(
+                        blank=True, null=True, verbose_name="Сообщение об ошибке"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время запуска"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время завершения"
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[
+                            ("train", "Поезд"),
+                            ("depot", "Депо"),
+                            ("fleet", "Парк"),
+                        ],
+                        max_length=10,
+                        verbose_name="Область пересчета",
+                    ),
+                ),
+                (
+                    "dedup_key",
+                    models.CharField(
+                        db_index=True,
+                        help_text="Хеш области и периода: повторный запрос присоединяется к выполняющейся задаче",
+                        max_length=64,
+                        verbose_name="Ключ дедупликации",
+                    ),
+                ),
+                (
+                    "train_ids",
+                    models.JSONField(
+                        blank=True, default=list, verbose_name="ID поездов"
+                    ),
+                ),
+                ("start_date", models.DateField(verbose_name="Начало периода")),
+                ("end_date", models.DateField(verbose_name="Конец периода")),
+                (
+                    "trains_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Пересчитано поездов"
+                    ),
+                ),
+                (
+                    "updated_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Обновлено записей"
+                    ),
+                ),
+                (
+                    "depot",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recalculation_jobs",
+                        to="mileage_calculator.depot",
+                        verbose_name="Депо",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Задача пересчета",
+                "verbose_name_plural": "Задачи пересчета",
+                "db_table": "mileage_calculator_recalculation_job",
+                "ordering": ["-created_at"],
+                "abstract": False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="recalculationjob",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["pending", "running"])),
+                fields=("dedup_key",),
+                name="unique_active_recalculation_job",
+            ),
+        ),
+    ]
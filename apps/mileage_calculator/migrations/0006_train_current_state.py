@@ -0,0 +1,189 @@
+# Generated by Django 4.2.9 on 2026-10-18 17:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+STATE_FIELDS = [
+    "record_date",
+    "total_mileage",
+    "daily_mileage",
+    "mileage_since_to",
+    "mileage_to_to",
+    "days_since_to",
+    "avg_mileage",
+    "last_to_date",
+    "last_to_type",
+    "last_block_date",
+    "last_kp_measure_date",
+    "planned_to_date",
+    "indicator_color",
+    "mileage_indicator_color",
+]
+
+
+def fill_current_state(apps, schema_editor):
+    """Заполнение текущего состояния из последних записей поездов."""
+    TrainDailyRecord = apps.get_model("mileage_calculator", "TrainDailyRecord")
+    TrainCurrentState = apps.get_model("mileage_calculator", "TrainCurrentState")
+
+    latest_date = (
+        TrainDailyRecord.objects.filter(train_id=OuterRef("train_id"))
+        .order_by("-record_date")
+        .values("record_date")[:1]
+    )
+    rows = (
+        TrainDailyRecord.objects.filter(record_date=Subquery(latest_date))
+        .values("id", "train_id", *STATE_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+    now = timezone.now()
+    batch = []
+    for row in rows:
+        batch.append(TrainCurrentState(latest_record_id=row.pop("id"), updated_at=now, **row))
+        if len(batch) >= 1000:
+            TrainCurrentState.objects.bulk_create(batch)
+            batch = []
+    TrainCurrentState.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mileage_calculator", "0005_recalculation_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrainCurrentState",
+            fields=[
+                (
+                    "train",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="current_state",
+                        serialize=False,
+                        to="mileage_calculator.train",
+                        verbose_name="Поезд",
+                    ),
+                ),
+                ("record_date", models.DateField(verbose_name="Дата последней записи")),
+                ("total_mileage", models.BigIntegerField(verbose_name="Общий пробег")),
+                (
+                    "daily_mileage",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="Дневной пробег"
+                    ),
+                ),
+                (
+                    "mileage_since_to",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Пробег с последнего ТО"
+                    ),
+                ),
+                (
+                    "mileage_to_to",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Пробег до следующего ТО"
+                    ),
+                ),
+                (
+                    "days_since_to",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="Дней с последнего ТО"
+                    ),
+                ),
+                (
+                    "avg_mileage",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Средний пробег"
+                    ),
+                ),
+                (
+                    "last_to_date",
+                    models.DateField(
+                        blank=True, null=True, verbose_name="Дата последнего ТО"
+                    ),
+                ),
+                (
+                    "last_to_type",
+                    models.CharField(
+                        blank=True,
+                        max_length=10,
+                        null=True,
+                        verbose_name="Вид последнего ТО",
+                    ),
+                ),
+                (
+                    "last_block_date",
+                    models.DateField(
+                        blank=True, null=True, verbose_name="Дата последнего блока"
+                    ),
+                ),
+                (
+                    "last_kp_measure_date",
+                    models.DateField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Дата последних измерений КП",
+                    ),
+                ),
+                (
+                    "planned_to_date",
+                    models.DateField(
+                        blank=True, null=True, verbose_name="Плановая дата ТО"
+                    ),
+                ),
+                (
+                    "indicator_color",
+                    models.CharField(
+                        blank=True,
+                        max_length=20,
+                        null=True,
+                        verbose_name="Цветовой индикатор",
+                    ),
+                ),
+                (
+                    "mileage_indicator_color",
+                    models.CharField(
+                        blank=True,
+                        max_length=20,
+                        null=True,
+                        verbose_name="Индикатор по пробегу",
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата обновления"),
+                ),
+                (
+                    "latest_record",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="mileage_calculator.traindailyrecord",
+                        verbose_name="Последняя запись",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Текущее состояние поезда",
+                "verbose_name_plural": "Текущие состояния поездов",
+                "db_table": "mileage_calculator_train_current_state",
+                "indexes": [
+                    models.Index(
+                        fields=["record_date"], name="mileage_cal_record__f09563_idx"
+                    ),
+                    models.Index(
+                        fields=["planned_to_date"],
+                        name="mileage_cal_planned_54c70d_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_current_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mileage_calculator", "0006_train_current_state"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="traindailyrecord",
+            index=models.Index(
+                fields=["record_date", "train", "id"],
+                name="mileage_cal_record__aff72a_idx",
+            ),
+        ),
+    ]
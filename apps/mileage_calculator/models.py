@@ -4,10 +4,16 @@
 '''
 Модели для системы калькулятора пробега.
 '''
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import date, timedelta
+import time
 
 class Depot(models.Model):
     '''Модель депо.'''
@@ -28,6 +34,51 @@ class Depot(models.Model):
     def __str__(self):
         return self.name
 
+    
+    @staticmethod
+    def train_count_annotations():
+        '''
+        Условные агрегаты по поездам депо для annotate().
+
+        Всего, активных, с ручным и автоматическим пробегом и по каждому типу поезда.
+        '''
+        annotations = {
+            'trains_count': models.Count('trains'),
+            'active_trains_count': models.Count('trains', filter = models.Q(trains__is_active = True)),
+            'manual_trains_count': models.Count('trains', filter = models.Q(trains__is_manual_mileage = True)),
+            'automatic_trains_count': models.Count('trains', filter = models.Q(trains__is_manual_mileage = False))}
+        for index, (train_type, _) in enumerate(Train.TRAIN_TYPES):
+            annotations[f'type_{index}_trains_count'] = models.Count('trains', filter = models.Q(trains__type = train_type))
+        return annotations
+
+    
+    @classmethod
+    def with_train_counts(cls):
+        '''Депо со счетчиками поездов, вычисленными в одном запросе.'''
+        return cls.objects.annotate(**cls.train_count_annotations())
+
+    
+    def train_counts(self):
+        '''
+        Счетчики поездов депо.
+
+        Берутся из аннотаций with_train_counts(); у неаннотированного депо
+        вычисляются одним агрегатным запросом и сохраняются в объекте.
+        '''
+        annotations = self.train_count_annotations()
+        if not all(hasattr(self, name) for name in annotations):
+            values = Depot.objects.filter(pk = self.pk).annotate(**annotations).values(*annotations).get()
+            for name, value in values.items():
+                setattr(self, name, value)
+        return {
+            'trains_count': self.trains_count,
+            'active_trains_count': self.active_trains_count,
+            'manual_trains_count': self.manual_trains_count,
+            'automatic_trains_count': self.automatic_trains_count,
+            'trains_by_type': {
+                train_type: getattr(self, f'type_{index}_trains_count')
+                for index, (train_type, _) in enumerate(Train.TRAIN_TYPES)}}
+
 
 
 class Train(models.Model):
@@ -67,16 +118,29 @@ class Train(models.Model):
         """Возвращает последнюю запись пробега для поезда."""
         return self.daily_records.order_by('-record_date').first()
     
+    @property
+    def current_snapshot(self):
+        """
+        Текущее состояние поезда из TrainCurrentState.
+
+        Если состояние не заполнено (записи вставлены в обход модели),
+        возвращается последняя запись - у обоих одинаковые имена полей.
+        """
+        try:
+            return self.current_state
+        except ObjectDoesNotExist:
+            return self.latest_record
+    
     @property
     def latest_total_mileage(self):
         """Возвращает последний общий пробег поезда."""
-        latest = self.latest_record
+        latest = self.current_snapshot
         return latest.total_mileage if latest else None
     
     @property
     def next_block_date(self):
         """Возвращает дату следующего блока для поезда."""
-        latest = self.latest_record
+        latest = self.current_snapshot
         if latest and latest.last_block_date:
             return latest.last_block_date + timedelta(days=45)
         return None
@@ -84,7 +148,7 @@ class Train(models.Model):
     @property
     def next_kp_date(self):
         """Возвращает дату следующего КП для поезда."""
-        latest = self.latest_record
+        latest = self.current_snapshot
         if latest and latest.last_kp_measure_date:
             return latest.last_kp_measure_date + timedelta(days=30)
         return None
@@ -92,7 +156,7 @@ class Train(models.Model):
     @property
     def days_since_last_to(self):
         """Возвращает количество дней с последнего ТО."""
-        latest = self.latest_record
+        latest = self.current_snapshot
         if latest and latest.last_to_date:
             return (date.today() - latest.last_to_date).days
         return None
@@ -121,6 +185,9 @@ class TrainDailyRecord(models.Model):
         ('IS510', 'IS510'),
         ('IS520', 'IS520'),
         ('IS530', 'IS530')]
+    # Интервалы до следующего блока и следующего измерения КП
+    BLOCK_INTERVAL = timedelta(days = 45)
+    KP_INTERVAL = timedelta(days = 30)
     train = models.ForeignKey(Train, on_delete = models.CASCADE, related_name = 'daily_records', verbose_name = 'Поезд')
     record_date = models.DateField(verbose_name = 'Дата записи', help_text = 'Дата записи данных')
     total_mileage = models.BigIntegerField(validators = [
@@ -183,7 +250,12 @@ class TrainDailyRecord(models.Model):
             models.Index(fields = [
                 'last_to_date']),
             models.Index(fields = [
-                'planned_to_date'])]
+                'planned_to_date']),
+            # Ключ keyset-пагинации записей (RecordKeysetPagination)
+            models.Index(fields = [
+                'record_date',
+                'train',
+                'id'])]
 
     
     def __str__(self):
@@ -193,14 +265,14 @@ class TrainDailyRecord(models.Model):
     def next_block_date(self):
         '''Дата следующего блока (45 дней после последнего).'''
         if self.last_block_date:
-            return self.last_block_date + timedelta(days = 45)
+            return self.last_block_date + self.BLOCK_INTERVAL
         return None
 
     @property
     def next_kp_date(self):
         '''Дата следующего КП (30 дней после последнего).'''
         if self.last_kp_measure_date:
-            return self.last_kp_measure_date + timedelta(days = 30)
+            return self.last_kp_measure_date + self.KP_INTERVAL
         return None
 
     @property
@@ -222,49 +294,511 @@ class TrainDailyRecord(models.Model):
             return self.record_date + timedelta(days = int(days_to_to))
         return None
 
-    def save(self, *args, **kwargs):
-        '''Переопределяем save для автоматических расчетов.'''
-        # Импорт здесь для избежания циклических импортов
-        from .services.calculation_service import MileageCalculationService
-        
-        # Базовые расчеты
-        if self.train:
-            train_type = self.train.type
-            
-            # Расчет пробега с последнего ТО
-            if self.last_to_mileage and self.total_mileage:
-                self.mileage_since_to = self.total_mileage - self.last_to_mileage
-            
-            # Расчет остатка до ТО
-            if self.mileage_since_to is not None:
-                if train_type == 'Сапсан':
-                    self.mileage_to_to = max(0, 25000 - self.mileage_since_to)
-                else:
-                    self.mileage_to_to = max(0, 25000 - self.mileage_since_to)
-            
-            # Расчет дней с ТО
-            if self.last_to_date:
-                self.days_since_to = (self.record_date - self.last_to_date).days
-            
-            # Расчет цветовых индикаторов
-            if self.days_since_to is not None:
-                if self.days_since_to < 45:
-                    self.indicator_color = 'green'
-                elif 45 <= self.days_since_to <= 55:
-                    self.indicator_color = 'yellow'
-                else:
-                    self.indicator_color = 'red'
-            
-            if self.mileage_since_to is not None:
-                if self.mileage_since_to < 23000:
-                    self.mileage_indicator_color = 'green'
-                elif 23000 <= self.mileage_since_to < 25000:
-                    self.mileage_indicator_color = 'yellow'
+    def save(self, *args, train_type=None, **kwargs):
+        '''
+        Переопределяем save для автоматических расчетов.
+
+        Тип поезда берется из train_type, из уже загруженного self.train
+        или из TrainTypeCache - без отдельного запроса к поезду на каждую запись.
+        '''
+        if self.train_id:
+            if train_type is None:
+                if TrainDailyRecord.train.is_cached(self):
+                    train_type = self.train.type
                 else:
-                    self.mileage_indicator_color = 'red'
+                    train_type = TrainTypeCache.get_type(self.train_id)
+            self.apply_calculations(train_type)
+
+        with transaction.atomic(savepoint = False):
+            super().save(*args, **kwargs)
+            TrainCurrentState.record_saved(self)
+
+    def apply_calculations(self, train_type):
+        '''Расчет производных полей записи (формулы 3-5 и цветовые индикаторы).'''
+        # Расчет пробега с последнего ТО
+        if self.last_to_mileage and self.total_mileage:
+            self.mileage_since_to = self.total_mileage - self.last_to_mileage
+        
+        # Расчет остатка до ТО
+        if self.mileage_since_to is not None:
+            if train_type == 'Сапсан':
+                self.mileage_to_to = max(0, 25000 - self.mileage_since_to)
+            else:
+                self.mileage_to_to = max(0, 25000 - self.mileage_since_to)
+        
+        # Расчет дней с ТО
+        if self.last_to_date:
+            self.days_since_to = (self.record_date - self.last_to_date).days
+        
+        # Расчет цветовых индикаторов
+        if self.days_since_to is not None:
+            if self.days_since_to < 45:
+                self.indicator_color = 'green'
+            elif 45 <= self.days_since_to <= 55:
+                self.indicator_color = 'yellow'
+            else:
+                self.indicator_color = 'red'
+        
+        if self.mileage_since_to is not None:
+            if self.mileage_since_to < 23000:
+                self.mileage_indicator_color = 'green'
+            elif 23000 <= self.mileage_since_to < 25000:
+                self.mileage_indicator_color = 'yellow'
+            else:
+                self.mileage_indicator_color = 'red'
+
+    @classmethod
+    def bulk_save_with_calculations(cls, records, batch_size = 500):
+        '''
+        Расчет производных полей и вставка несохраненных записей через bulk_create.
+
+        Типы поездов разрешаются одним запросом для всех записей.
+
+        Returns:
+            Список созданных записей
+        '''
+        records = list(records)
+        if not records:
+            return []
+        train_types = TrainTypeCache.get_types({record.train_id for record in records})
+        for record in records:
+            record.apply_calculations(train_types.get(record.train_id))
+        with transaction.atomic(savepoint = False):
+            created = cls.objects.bulk_create(records, batch_size = batch_size)
+            TrainCurrentState.refresh(train_types)
+        return created
+
+
+
+class TrainCurrentState(models.Model):
+    '''
+    Текущее состояние поезда - копия полей его последней записи.
+
+    Обновляется в той же транзакции, что и запись, поэтому списки поездов
+    и сводки читают состояние одним соединением вместо подзапроса на поезд.
+    '''
+    STATE_FIELDS = [
+        'record_date',
+        'total_mileage',
+        'daily_mileage',
+        'mileage_since_to',
+        'mileage_to_to',
+        'days_since_to',
+        'avg_mileage',
+        'last_to_date',
+        'last_to_type',
+        'last_block_date',
+        'last_kp_measure_date',
+        'planned_to_date',
+        'indicator_color',
+        'mileage_indicator_color']
+    train = models.OneToOneField(Train, on_delete = models.CASCADE, primary_key = True, related_name = 'current_state', verbose_name = 'Поезд')
+    latest_record = models.ForeignKey(TrainDailyRecord, on_delete = models.SET_NULL, null = True, blank = True, related_name = '+', verbose_name = 'Последняя запись')
+    record_date = models.DateField(verbose_name = 'Дата последней записи')
+    total_mileage = models.BigIntegerField(verbose_name = 'Общий пробег')
+    daily_mileage = models.IntegerField(null = True, blank = True, verbose_name = 'Дневной пробег')
+    mileage_since_to = models.BigIntegerField(null = True, blank = True, verbose_name = 'Пробег с последнего ТО')
+    mileage_to_to = models.BigIntegerField(null = True, blank = True, verbose_name = 'Пробег до следующего ТО')
+    days_since_to = models.IntegerField(null = True, blank = True, verbose_name = 'Дней с последнего ТО')
+    avg_mileage = models.FloatField(null = True, blank = True, verbose_name = 'Средний пробег')
+    last_to_date = models.DateField(null = True, blank = True, verbose_name = 'Дата последнего ТО')
+    last_to_type = models.CharField(max_length = 10, null = True, blank = True, verbose_name = 'Вид последнего ТО')
+    last_block_date = models.DateField(null = True, blank = True, verbose_name = 'Дата последнего блока')
+    last_kp_measure_date = models.DateField(null = True, blank = True, verbose_name = 'Дата последних измерений КП')
+    planned_to_date = models.DateField(null = True, blank = True, verbose_name = 'Плановая дата ТО')
+    indicator_color = models.CharField(max_length = 20, null = True, blank = True, verbose_name = 'Цветовой индикатор')
+    mileage_indicator_color = models.CharField(max_length = 20, null = True, blank = True, verbose_name = 'Индикатор по пробегу')
+    updated_at = models.DateTimeField(auto_now = True, verbose_name = 'Дата обновления')
+    
+    class Meta:
+        verbose_name = 'Текущее состояние поезда'
+        verbose_name_plural = 'Текущие состояния поездов'
+        db_table = 'mileage_calculator_train_current_state'
+        indexes = [
+            models.Index(fields = [
+                'record_date']),
+            models.Index(fields = [
+                'planned_to_date'])]
+
+    
+    def __str__(self):
+        return f'''{self.train_id} - {self.record_date}'''
+
+    @classmethod
+    def _upsert_sql(cls, select_sql):
+        '''INSERT ... ON CONFLICT DO UPDATE текущего состояния из строк select_sql.'''
+        columns = ', '.join(cls.STATE_FIELDS)
+        updates = ', '.join(f'{field} = excluded.{field}' for field in [
+            'latest_record_id',
+            'updated_at'] + cls.STATE_FIELDS)
+        return f'''
+            INSERT INTO {cls._meta.db_table} (train_id, latest_record_id, updated_at, {columns})
+            {select_sql}
+            ON CONFLICT (train_id) DO UPDATE SET {updates}
+        '''
+
+    @classmethod
+    def record_saved(cls, record):
+        '''
+        Обновление состояния после сохранения записи одним запросом.
+
+        Состояние заменяется, только если запись не старее текущей. Если
+        сохраненная запись была последней и сдвинулась назад по дате,
+        состояние перечитывается из записей.
+        '''
+        from django.db import connection
+        
+        placeholders = ', '.join(['%s'] * len(cls.STATE_FIELDS))
+        sql = cls._upsert_sql(f'SELECT %s, %s, %s, {placeholders} WHERE 1 = 1') + f'''
+            WHERE {cls._meta.db_table}.record_date <= excluded.record_date
+        '''
+        params = [record.train_id, record.id, timezone.now()] + [getattr(record, field) for field in cls.STATE_FIELDS]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.rowcount:
+                return
+        if cls.objects.filter(train_id = record.train_id, latest_record_id = record.id).exists():
+            cls.refresh([record.train_id])
+
+    @classmethod
+    def refresh(cls, train_ids):
+        '''
+        Перечитывание состояния поездов из их последних записей.
+
+        Выполняется одним INSERT ... SELECT ... ON CONFLICT DO UPDATE
+        (PostgreSQL и SQLite 3.24+).
+        '''
+        from django.db import connection
+        
+        train_ids = list(train_ids)
+        if not train_ids:
+            return
+        record_table = TrainDailyRecord._meta.db_table
+        source_columns = ', '.join(f'r.{field}' for field in cls.STATE_FIELDS)
+        placeholders = ', '.join(['%s'] * len(train_ids))
+        sql = cls._upsert_sql(f'''
+            SELECT r.train_id, r.id, %s, {source_columns}
+            FROM {record_table} r
+            WHERE r.train_id IN ({placeholders})
+              AND r.record_date = (
+                  SELECT MAX(latest.record_date) FROM {record_table} latest
+                  WHERE latest.train_id = r.train_id
+              )
+        ''')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [timezone.now()] + train_ids)
+
+    @classmethod
+    def record_deleted(cls, record):
+        '''Перечитывание состояния при удалении последней записи поезда.'''
+        states = cls.objects.filter(train_id = record.train_id)
+        if states.filter(record_date = record.record_date).exists():
+            cls.refresh([record.train_id])
+            # Состояние осталось прежним - других записей у поезда нет
+            states.filter(record_date = record.record_date).delete()
+
+
+class BackgroundJob(models.Model):
+    '''Базовая модель фоновой задачи со статусом выполнения.'''
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_COMPLETED, 'Завершена'),
+        (STATUS_FAILED, 'Ошибка')]
+    ACTIVE_STATUSES = [
+        STATUS_PENDING,
+        STATUS_RUNNING]
+    status = models.CharField(max_length = 20, choices = STATUS_CHOICES, default = STATUS_PENDING, db_index = True, verbose_name = 'Статус')
+    task_id = models.CharField(max_length = 255, null = True, blank = True, verbose_name = 'ID задачи Celery')
+    error_message = models.TextField(null = True, blank = True, verbose_name = 'Сообщение об ошибке')
+    created_at = models.DateTimeField(auto_now_add = True, verbose_name = 'Дата создания')
+    started_at = models.DateTimeField(null = True, blank = True, verbose_name = 'Время запуска')
+    finished_at = models.DateTimeField(null = True, blank = True, verbose_name = 'Время завершения')
+    
+    class Meta:
+        abstract = True
+        ordering = [
+            '-created_at']
+
+    @property
+    def is_finished(self):
+        '''Задача завершена успешно или с ошибкой.'''
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
+
+    def mark_running(self, task_id = None):
+        '''Отметка о запуске задачи.'''
+        self.status = self.STATUS_RUNNING
+        self.task_id = task_id or self.task_id
+        self.started_at = timezone.now()
+        self.save(update_fields = [
+            'status',
+            'task_id',
+            'started_at'])
+
+    def mark_completed(self, **fields):
+        '''Отметка об успешном завершении с итоговыми полями.'''
+        self._finish(self.STATUS_COMPLETED, fields)
+
+    def mark_failed(self, message, **fields):
+        '''Отметка о завершении с ошибкой.'''
+        fields['error_message'] = message
+        self._finish(self.STATUS_FAILED, fields)
+
+    @classmethod
+    def fail_stale(cls, queryset, timeout):
+        '''
+        Перевод зависших задач в ошибку.
+
+        Задача зависла, если ожидает запуска или выполняется дольше timeout:
+        воркер упал или сообщение потеряно, и сама она уже не завершится.
+
+        Args:
+            queryset: Задачи, среди которых ищутся зависшие
+            timeout: timedelta - допустимое время ожидания и выполнения
+
+        Returns:
+            Количество переведенных в ошибку задач
+        '''
+        now = timezone.now()
+        cutoff = now - timeout
+        stale = (
+            Q(status = cls.STATUS_PENDING, created_at__lt = cutoff)
+            | Q(status = cls.STATUS_RUNNING, started_at__lt = cutoff)
+            | Q(status = cls.STATUS_RUNNING, started_at__isnull = True, created_at__lt = cutoff))
+        return queryset.filter(stale).update(
+            status = cls.STATUS_FAILED,
+            finished_at = now,
+            error_message = f'Задача не завершилась за {timeout}')
+
+    def _finish(self, status, fields):
+        for field, value in fields.items():
+            setattr(self, field, value)
+        self.status = status
+        self.finished_at = timezone.now()
+        self.save(update_fields = [
+            'status',
+            'finished_at'] + list(fields))
+
+
+
+class ImportJob(BackgroundJob):
+    '''Фоновый импорт файла с записями пробега.'''
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel 2007+'),
+        ('xls', 'Excel 97-2003'),
+        ('csv', 'CSV'),
+        ('parquet', 'Parquet')]
+    PROGRESS_FIELDS = [
+        'rows_read',
+        'created_count',
+        'updated_count',
+        'errors_count']
+    # Сколько сообщений об ошибках строк сохраняется в задаче
+    MAX_STORED_ERRORS = 1000
+    file = models.FileField(upload_to = 'imports/%Y/%m/%d/', verbose_name = 'Файл импорта')
+    format = models.CharField(max_length = 10, choices = FORMAT_CHOICES, verbose_name = 'Формат файла')
+    sheet_name = models.CharField(max_length = 255, default = 'Sheet1', verbose_name = 'Название листа')
+    skip_rows = models.PositiveIntegerField(default = 0, verbose_name = 'Пропуск строк')
+    update_existing = models.BooleanField(default = False, verbose_name = 'Обновлять существующие записи')
+    partial_commit = models.BooleanField(default = False, verbose_name = 'Частичная фиксация', help_text = 'Фиксировать каждый пакет отдельно: ошибка не откатывает уже импортированные пакеты')
+    rows_read = models.PositiveIntegerField(default = 0, verbose_name = 'Прочитано строк')
+    created_count = models.PositiveIntegerField(default = 0, verbose_name = 'Создано записей')
+    updated_count = models.PositiveIntegerField(default = 0, verbose_name = 'Обновлено записей')
+    errors_count = models.PositiveIntegerField(default = 0, verbose_name = 'Ошибок в строках')
+    errors = models.JSONField(default = list, blank = True, verbose_name = 'Ошибки строк')
+    
+    class Meta(BackgroundJob.Meta):
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = 'Задачи импорта'
+        db_table = 'mileage_calculator_import_job'
+
+    
+    def __str__(self):
+        return f'''Импорт {self.id} ({self.get_status_display()})'''
+
+    @property
+    def progress_cache_key(self):
+        return f'''import_job_progress_{self.id}'''
+
+    def add_chunk_results(self, rows_read, results):
+        '''Учет результатов импорта пакета строк.'''
+        self.rows_read += rows_read
+        self.created_count += results['created']
+        self.updated_count += results['updated']
+        self.errors_count += len(results['errors'])
+        free_slots = self.MAX_STORED_ERRORS - len(self.errors)
+        if free_slots > 0:
+            self.errors = self.errors + results['errors'][:free_slots]
+        self.save_progress()
+
+    def save_progress(self):
+        '''
+        Сохранение прогресса для опроса клиентом.
+
+        Внутри общей транзакции строка задачи не видна другим соединениям,
+        поэтому прогресс дополнительно публикуется через кеш.
+        '''
+        from django.core.cache import cache
+        from django.db import connection
+        
+        if connection.in_atomic_block:
+            cache.set(self.progress_cache_key, self.get_progress(), 3600)
+        else:
+            self.save(update_fields = self.PROGRESS_FIELDS + [
+                'errors'])
+
+    def get_progress(self):
+        '''Текущие счетчики прогресса.'''
+        return {field: getattr(self, field) for field in self.PROGRESS_FIELDS}
+
+    def get_live_progress(self):
+        '''Прогресс с учетом данных, опубликованных выполняющейся задачей.'''
+        from django.core.cache import cache
+        
+        if self.status == self.STATUS_RUNNING:
+            return cache.get(self.progress_cache_key) or self.get_progress()
+        return self.get_progress()
+
+
+
+class ExportJob(BackgroundJob):
+    '''Фоновый экспорт записей с сохранением файла для повторных запросов.'''
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel 2007+'),
+        ('csv', 'CSV'),
+        ('parquet', 'Parquet')]
+    filters_hash = models.CharField(max_length = 64, db_index = True, verbose_name = 'Хеш фильтров')
+    filters = models.JSONField(default = dict, verbose_name = 'Фильтры экспорта')
+    format = models.CharField(max_length = 10, choices = FORMAT_CHOICES, default = 'xlsx', verbose_name = 'Формат файла')
+    include_calculations = models.BooleanField(default = True, verbose_name = 'Включать расчетные поля')
+    data_fingerprint = models.CharField(max_length = 100, blank = True, default = '', verbose_name = 'Отпечаток данных', help_text = 'Количество записей и время последнего изменения на момент выгрузки')
+    rows_count = models.PositiveIntegerField(default = 0, verbose_name = 'Выгружено строк')
+    file = models.FileField(upload_to = 'exports/%Y/%m/%d/', null = True, blank = True, verbose_name = 'Файл экспорта')
+    
+    class Meta(BackgroundJob.Meta):
+        verbose_name = 'Задача экспорта'
+        verbose_name_plural = 'Задачи экспорта'
+        db_table = 'mileage_calculator_export_job'
+
+    
+    def __str__(self):
+        return f'''Экспорт {self.id} ({self.get_status_display()})'''
+
+    @property
+    def has_artifact(self):
+        '''Файл экспорта сформирован и существует в хранилище.'''
+        return self.status == self.STATUS_COMPLETED and bool(self.file) and self.file.storage.exists(self.file.name)
+
+
+
+class RecalculationJob(BackgroundJob):
+    '''Фоновый пересчет записей поезда, депо или всего парка.'''
+    SCOPE_TRAIN = 'train'
+    SCOPE_DEPOT = 'depot'
+    SCOPE_FLEET = 'fleet'
+    SCOPE_CHOICES = [
+        (SCOPE_TRAIN, 'Поезд'),
+        (SCOPE_DEPOT, 'Депо'),
+        (SCOPE_FLEET, 'Парк')]
+    scope = models.CharField(max_length = 10, choices = SCOPE_CHOICES, verbose_name = 'Область пересчета')
+    dedup_key = models.CharField(max_length = 64, db_index = True, verbose_name = 'Ключ дедупликации', help_text = 'Хеш области и периода: повторный запрос присоединяется к выполняющейся задаче')
+    depot = models.ForeignKey(Depot, on_delete = models.CASCADE, null = True, blank = True, related_name = 'recalculation_jobs', verbose_name = 'Депо')
+    train_ids = models.JSONField(default = list, blank = True, verbose_name = 'ID поездов')
+    start_date = models.DateField(verbose_name = 'Начало периода')
+    end_date = models.DateField(verbose_name = 'Конец периода')
+    trains_count = models.PositiveIntegerField(default = 0, verbose_name = 'Пересчитано поездов')
+    updated_count = models.PositiveIntegerField(default = 0, verbose_name = 'Обновлено записей')
+    
+    class Meta(BackgroundJob.Meta):
+        verbose_name = 'Задача пересчета'
+        verbose_name_plural = 'Задачи пересчета'
+        db_table = 'mileage_calculator_recalculation_job'
+        constraints = [
+            models.UniqueConstraint(fields = [
+                'dedup_key'], condition = models.Q(status__in = BackgroundJob.ACTIVE_STATUSES), name = 'unique_active_recalculation_job')]
+
+    
+    def __str__(self):
+        return f'''Пересчет {self.id} ({self.get_status_display()})'''
+
+
+class TrainTypeCache:
+    '''
+    Кеш типов поездов в общем кеше Django (доступен всем процессам).
+
+    Ключи версионируются: invalidate() без аргументов увеличивает версию и тем
+    самым сбрасывает типы всех поездов во всех процессах. Поезд сбрасывается
+    сигналами post_save/post_delete модели Train, массовые update() по поездам
+    должны вызывать invalidate() явно.
+    '''
+    VERSION_KEY = 'train_type:version'
+    CACHE_TIMEOUT = 24 * 3600
+
+    @staticmethod
+    def cache_key(train_id):
+        return f'train_type:{train_id}'
+
+    @classmethod
+    def _version(cls):
+        '''Текущая версия ключей; при отсутствии - новая, не совпадающая с прежними.'''
+        version = cache.get(cls.VERSION_KEY)
+        if version is None:
+            cache.add(cls.VERSION_KEY, int(time.time()), None)
+            version = cache.get(cls.VERSION_KEY)
+        return version
+
+    @classmethod
+    def get_type(cls, train_id):
+        '''Тип поезда по ID.'''
+        return cls.get_types([train_id]).get(train_id)
+
+    @classmethod
+    def get_types(cls, train_ids):
+        '''Типы поездов {train_id: type}; недостающие загружаются одним запросом.'''
+        train_ids = list(train_ids)
+        version = cls._version()
+        cached = cache.get_many([cls.cache_key(train_id) for train_id in train_ids], version = version)
+        types = {}
+        missing = []
+        for train_id in train_ids:
+            key = cls.cache_key(train_id)
+            if key in cached:
+                types[train_id] = cached[key]
+            else:
+                missing.append(train_id)
+        if missing:
+            loaded = dict(Train.objects.filter(id__in = missing).values_list('id', 'type'))
+            cache.set_many(
+                {cls.cache_key(train_id): train_type for train_id, train_type in loaded.items()},
+                cls.CACHE_TIMEOUT,
+                version = version)
+            types.update(loaded)
+        return {train_id: types.get(train_id) for train_id in train_ids}
+
+    @classmethod
+    def invalidate(cls, train_id = None):
+        '''Сброс кеша для поезда или целиком (сменой версии ключей).'''
+        if train_id is not None:
+            cache.delete(cls.cache_key(train_id), version = cls._version())
+            return
+        try:
+            cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            cache.add(cls.VERSION_KEY, int(time.time()), None)
+
 
-        super().save(*args, **kwargs)
+@receiver(post_save, sender = Train)
+@receiver(post_delete, sender = Train)
+def invalidate_train_type_cache(sender, instance, **kwargs):
+    '''Сброс кеша типа поезда при изменении или удалении поезда.'''
+    TrainTypeCache.invalidate(instance.id)
 
-    if None:
-        __classcell__ = None
 
+@receiver(post_delete, sender = TrainDailyRecord)
+def refresh_train_current_state(sender, instance, **kwargs):
+    '''Перечитывание состояния поезда при удалении его последней записи.'''
+    TrainCurrentState.record_deleted(instance)
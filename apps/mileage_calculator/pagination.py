@@ -0,0 +1,201 @@
+'''
+Пагинация API калькулятора пробега.
+'''
+import base64
+import json
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RecordKeysetPagination(BasePagination):
+    '''
+    Keyset-пагинация записей по ключу (record_date, train_id, id), от новых к старым.
+
+    Страница выбирается условием по ключу последней записи предыдущей страницы,
+    без OFFSET и без COUNT(*), поэтому время ответа не зависит от глубины.
+    Сортировка из параметра ordering в этом режиме не применяется.
+    '''
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Неверный курсор'
+    max_page_size = 500
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE
+        self.max_page_size = getattr(settings, 'RECORDS_CURSOR_MAX_PAGE_SIZE', self.max_page_size)
+
+    @classmethod
+    def is_requested(cls, request):
+        '''Включен ли режим курсора: параметр pagination=cursor или переданный курсор.'''
+        return (request.query_params.get('pagination') == 'cursor'
+                or cls.cursor_query_param in request.query_params)
+
+    @staticmethod
+    def encode_cursor(position, reverse):
+        payload = json.dumps({
+            'd': position[0].isoformat(),
+            't': position[1],
+            'i': position[2],
+            'r': reverse
+        }, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        '''Позиция и направление из курсора запроса; (None, False) - первая страница.'''
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position = (date.fromisoformat(payload['d']), int(payload['t']), int(payload['i']))
+            return position, bool(payload['r'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    @staticmethod
+    def position_filter(position, after):
+        '''
+        Условие (record_date, train_id, id) < позиции (after=True) либо > позиции.
+
+        Избыточное условие по record_date ограничивает диапазон индекса
+        (record_date, train, id): по одной дизъюнкции планировщик его не выделяет.
+        '''
+        record_date, train_id, record_id = position
+        op = 'lt' if after else 'gt'
+        return Q(**{f'record_date__{op}e': record_date}) & (
+            Q(**{f'record_date__{op}': record_date})
+            | Q(record_date=record_date, **{f'train_id__{op}': train_id})
+            | Q(record_date=record_date, train_id=train_id, **{f'id__{op}': record_id})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        if reverse:
+            queryset = queryset.order_by('record_date', 'train_id', 'id')
+        else:
+            queryset = queryset.order_by('-record_date', '-train_id', '-id')
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position, after=not reverse))
+
+        # Лишняя запись показывает, есть ли страница дальше по направлению выборки
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        return results
+
+    @staticmethod
+    def record_position(record):
+        return record.record_date, record.train_id, record.id
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        cursor = self.encode_cursor(self.record_position(self.page[-1]), reverse=False)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        cursor = self.encode_cursor(self.record_position(self.page[0]), reverse=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema
+            }
+        }
+
+
+class RecordPagination(PageNumberPagination):
+    '''
+    Постраничная пагинация записей с переключением на keyset-режим.
+
+    По умолчанию - номера страниц с общим числом записей; с параметром
+    pagination=cursor (или cursor=...) - RecordKeysetPagination.
+    '''
+    keyset_class = RecordKeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.is_requested(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        return parameters + [
+            {
+                'name': 'pagination',
+                'required': False,
+                'in': 'query',
+                'description': 'cursor - keyset-пагинация без подсчета общего числа записей',
+                'schema': {'type': 'string', 'enum': ['cursor']}
+            },
+            {
+                'name': RecordKeysetPagination.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Курсор страницы из ссылок next/previous',
+                'schema': {'type': 'string'}
+            },
+            {
+                'name': RecordKeysetPagination.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Размер страницы в режиме курсора',
+                'schema': {'type': 'integer'}
+            }
+        ]
@@ -0,0 +1,99 @@
+'''
+Рендереры API калькулятора пробега.
+'''
+import csv
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''
+    JSON-рендерер на orjson с тем же компактным выводом, что JSONRenderer.
+
+    Без установленного orjson, а также при запросе отступов (indent)
+    используется стандартный JSONRenderer.
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default)
+        # Как JSONRenderer: U+2028 и U+2029 экранируются для встраивания в JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class StreamRenderer(BaseRenderer):
+    '''
+    Основа рендереров потоковой выгрузки.
+
+    stream() кодирует строки по одной и отдает их пачками по batch_size строк;
+    render() кодирует готовые данные (например, ответ об ошибке) целиком.
+    '''
+
+    def encode_header(self, field_names):
+        return b''
+
+    def encode_item(self, field_names, item):
+        raise NotImplementedError
+
+    def stream(self, field_names, items, batch_size=1000):
+        '''Генератор байтовых пачек по batch_size строк.'''
+        batch = [self.encode_header(field_names)]
+        for item in items:
+            batch.append(self.encode_item(field_names, item))
+            if len(batch) >= batch_size:
+                yield b''.join(batch)
+                batch = []
+        if batch:
+            yield b''.join(batch)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        field_names = list(items[0]) if items else []
+        return b''.join(self.stream(field_names, items))
+
+
+class NDJSONRenderer(StreamRenderer):
+    '''NDJSON: по одному JSON-объекту на строку.'''
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def __init__(self):
+        self.json_renderer = FastJSONRenderer()
+
+    def encode_item(self, field_names, item):
+        return self.json_renderer.render(item) + b'\n'
+
+
+class CSVRenderer(StreamRenderer):
+    '''CSV с заголовком из имен полей; пустые значения - пустые ячейки.'''
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    class Echo:
+        '''Буфер csv.writer, возвращающий записанную строку.'''
+        def write(self, value):
+            return value
+
+    def __init__(self):
+        self.writer = csv.writer(self.Echo())
+
+    def encode_header(self, field_names):
+        return self.writer.writerow(field_names).encode(self.charset)
+
+    def encode_item(self, field_names, item):
+        return self.writer.writerow([
+            '' if item.get(name) is None else item.get(name) for name in field_names
+        ]).encode(self.charset)
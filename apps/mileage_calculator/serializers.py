@@ -5,17 +5,22 @@
 Сериализаторы для API калькулятора пробега.
 '''
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.db import transaction
 from django.utils import timezone
 from datetime import date, timedelta
-from .models import Depot, Train, TrainDailyRecord
+from .models import Depot, Train, TrainDailyRecord, ImportJob, ExportJob, RecalculationJob
 from .services.calculation_service import MileageCalculationService
+from .services.bulk_calculation_service import BulkCalculationService
 from .services.analytics_service import AnalyticsService
 
 class DepotSerializer(serializers.ModelSerializer):
     '''Сериализатор депо.'''
     trains_count = serializers.SerializerMethodField()
     active_trains_count = serializers.SerializerMethodField()
+    manual_trains_count = serializers.SerializerMethodField()
+    automatic_trains_count = serializers.SerializerMethodField()
+    trains_by_type = serializers.SerializerMethodField()
     
     class Meta:
         model = Depot
@@ -23,7 +28,10 @@ class DepotSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'trains_count',
-            'active_trains_count']
+            'active_trains_count',
+            'manual_trains_count',
+            'automatic_trains_count',
+            'trains_by_type']
 
     
     def validate_name(self, value):
@@ -37,12 +45,27 @@ class DepotSerializer(serializers.ModelSerializer):
     
     def get_trains_count(self, obj):
         '''Общее количество поездов.'''
-        return obj.trains.count()
+        return obj.train_counts()['trains_count']
 
     
     def get_active_trains_count(self, obj):
         '''Количество активных поездов.'''
-        return obj.trains.filter(is_active=True).count()
+        return obj.train_counts()['active_trains_count']
+
+    
+    def get_manual_trains_count(self, obj):
+        '''Количество поездов с ручным вводом пробега.'''
+        return obj.train_counts()['manual_trains_count']
+
+    
+    def get_automatic_trains_count(self, obj):
+        '''Количество поездов с автоматическим пробегом.'''
+        return obj.train_counts()['automatic_trains_count']
+
+    
+    def get_trains_by_type(self, obj):
+        '''Количество поездов по типам.'''
+        return obj.train_counts()['trains_by_type']
 
 
 
@@ -73,29 +96,83 @@ class TrainSerializer(serializers.ModelSerializer):
 
     
     def get_records_count(self, obj):
-        '''Количество записей.'''
+        '''Количество записей (аннотация records_count, если есть).'''
+        records_count = getattr(obj, 'records_count', None)
+        if records_count is not None:
+            return records_count
         return obj.daily_records.count()
 
     
+    def _latest(self, obj):
+        '''Текущее состояние поезда; без записей - None без запроса.'''
+        if getattr(obj, 'records_count', None) == 0:
+            return None
+        return obj.current_snapshot
+
+    
     def get_latest_record_date(self, obj):
-        '''Дата последней записи.'''
-        latest = obj.daily_records.order_by('-record_date').first()
+        '''Дата последней записи (из текущего состояния поезда).'''
+        latest = self._latest(obj)
         if latest:
             return latest.record_date.isoformat()
         return None
 
     
     def get_latest_total_mileage(self, obj):
-        '''Последний общий пробег.'''
-        latest = obj.daily_records.order_by('-record_date').first()
+        '''Последний общий пробег (из текущего состояния поезда).'''
+        latest = self._latest(obj)
         if latest:
             return latest.total_mileage
         return None
 
 
 
-class TrainDailyRecordSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    '''
+    Выбор полей ответа параметрами запроса ?fields= и ?omit= (через запятую).
+
+    Действует только для чтения (GET/HEAD/OPTIONS).
+    '''
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = set(self.requested_field_names(self.context.get('request'), list(self.fields)))
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+
+    
+    @staticmethod
+    def parse_field_list(value):
+        return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+    
+    @classmethod
+    def requested_field_names(cls, request, available):
+        '''Поля ответа в порядке available с учетом ?fields= и ?omit=.'''
+        if request is None or request.method not in SAFE_METHODS:
+            return list(available)
+        fields = cls.parse_field_list(request.query_params.get('fields'))
+        omit = cls.parse_field_list(request.query_params.get('omit'))
+        unknown = sorted(set(fields + omit) - set(available))
+        if unknown:
+            raise serializers.ValidationError({'fields': f'Неизвестные поля: {", ".join(unknown)}'})
+        return [
+            name for name in available
+            if (not fields or name in fields) and name not in omit
+        ]
+
+
+
+class TrainDailyRecordSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     '''Базовый сериализатор ежедневных записей.'''
+    # Колонки модели для вычисляемых и связанных полей ответа
+    FIELD_COLUMNS = {
+        'train_name': ['train__name'],
+        'train_type': ['train__type'],
+        'depot_name': ['train__depot__name'],
+        'next_block_date': ['last_block_date'],
+        'next_kp_date': ['last_kp_measure_date']}
     train_name = serializers.CharField(source='train.name', read_only=True)
     train_type = serializers.CharField(source='train.type', read_only=True)
     depot_name = serializers.CharField(source='train.depot.name', read_only=True)
@@ -184,6 +261,136 @@ class TrainDailyRecordSerializer(serializers.ModelSerializer):
         
         return data
 
+    
+    def update(self, instance, validated_data):
+        '''Обновление записи с распространением правки на последующие дни.'''
+        old_train_id = instance.train_id
+        old_date = instance.record_date
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        with transaction.atomic():
+            record = super().update(instance, validated_data)
+            changes = {}
+            BulkCalculationService.track_change(changes, record.train_id, min(old_date, record.record_date), changed_fields)
+            if old_train_id != record.train_id:
+                BulkCalculationService.track_change(changes, old_train_id, old_date, ['record_date'])
+            if changes:
+                BulkCalculationService.propagate_changes(changes)
+                record.refresh_from_db()
+        return record
+
+    
+    @classmethod
+    def optimize_queryset(cls, queryset, field_names):
+        '''
+        Выборка только колонок, нужных для полей ответа.
+
+        Соединения с поездом и депо добавляются, только если запрошены их поля.
+        '''
+        columns = {'id'}
+        for name in field_names:
+            columns.update(cls.FIELD_COLUMNS.get(name, [name]))
+        related = set()
+        for column in list(columns):
+            parts = column.split('__')
+            for depth in range(1, len(parts)):
+                columns.add('__'.join(parts[:depth]))
+            if len(parts) > 1:
+                related.add('__'.join(parts[:-1]))
+        # Достаточно самых глубоких связей: train__depot включает train
+        related = [path for path in related if not any(other.startswith(path + '__') for other in related)]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+
+
+class TrainDailyRecordRowSerializer(serializers.BaseSerializer):
+    '''
+    Облегченное представление записей для больших списков (только чтение).
+
+    Сериализует строки values_list() из row_queryset() в тот же JSON, что
+    TrainDailyRecordSerializer: модели не создаются, а колонка и преобразование
+    каждого поля подготовлены заранее по полям TrainDailyRecordSerializer.
+    '''
+    # Колонки ключа записи: всегда выбираются для keyset-пагинации
+    KEY_COLUMNS = ['id', 'record_date', 'train_id']
+    # Вычисляемые поля: колонка и функция значения
+    COMPUTED_FIELDS = {
+        'next_block_date': ('last_block_date', lambda value: value + TrainDailyRecord.BLOCK_INTERVAL),
+        'next_kp_date': ('last_kp_measure_date', lambda value: value + TrainDailyRecord.KP_INTERVAL)}
+    _field_encoders = None
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        field_encoders = self.field_encoders()
+        names = TrainDailyRecordSerializer.requested_field_names(self.context.get('request'), list(field_encoders))
+        columns = self.row_columns(names)
+        self.encoders = [
+            (name, columns.index(field_encoders[name][0]), field_encoders[name][1])
+            for name in names]
+
+    
+    @classmethod
+    def compile_field(cls, name, field):
+        '''Колонка values_list() и преобразование значения (None - без преобразования).'''
+        compute = None
+        if name in cls.COMPUTED_FIELDS:
+            column, compute = cls.COMPUTED_FIELDS[name]
+        elif isinstance(field, serializers.PrimaryKeyRelatedField):
+            return f'{field.source}_id', None
+        else:
+            column = '__'.join(field.source_attrs)
+        convert = None
+        if isinstance(field, (serializers.DateField, serializers.DateTimeField)):
+            convert = field.to_representation
+        if compute and convert:
+            return column, lambda value: convert(compute(value))
+        return column, compute or convert
+
+    
+    @classmethod
+    def field_encoders(cls):
+        '''Колонка и преобразование для каждого поля TrainDailyRecordSerializer.'''
+        if cls._field_encoders is None:
+            cls._field_encoders = {
+                name: cls.compile_field(name, field)
+                for name, field in TrainDailyRecordSerializer().fields.items()}
+        return cls._field_encoders
+
+    
+    @classmethod
+    def row_columns(cls, field_names):
+        '''Колонки выборки: ключ записи и колонки полей, без повторов.'''
+        columns = list(cls.KEY_COLUMNS)
+        field_encoders = cls.field_encoders()
+        for name in field_names:
+            column = field_encoders[name][0]
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    
+    @classmethod
+    def row_queryset(cls, queryset, field_names):
+        '''Выборка строк для полей ответа; связи соединяются только для их полей.'''
+        return queryset.values_list(*cls.row_columns(field_names), named=True)
+
+    
+    @property
+    def field_names(self):
+        return [name for name, _, _ in self.encoders]
+
+    
+    def to_representation(self, row):
+        data = {}
+        for name, index, convert in self.encoders:
+            value = row[index]
+            data[name] = value if value is None or convert is None else convert(value)
+        return data
+
 
 
 class TrainDailyRecordDetailSerializer(TrainDailyRecordSerializer):
@@ -241,7 +448,8 @@ class TrainDailyRecordCreateSerializer(serializers.ModelSerializer):
         """Создание записи с автоматическими расчетами."""
         with transaction.atomic():
             record = TrainDailyRecord.objects.create(**validated_data)
-            MileageCalculationService.calculate_all_metrics(record, force_recalculate=True)
+            # Расчет новой записи и последующих дней от ее общего пробега
+            BulkCalculationService.recalculate_train(record.train, record.record_date)
             record.refresh_from_db()
             return record
 
@@ -292,15 +500,20 @@ class MaintenancePredictionSerializer(serializers.Serializer):
 
 class ExcelImportSerializer(serializers.Serializer):
     '''Сериализатор для импорта Excel файлов.'''
-    file = serializers.FileField(help_text = 'Excel файл (.xlsx или .xls) с данными')
+    file = serializers.FileField(help_text = 'Файл с данными (.xlsx, .xls, .csv или .parquet)')
+    format = serializers.ChoiceField(choices = [
+        ('xlsx', 'Excel 2007+'),
+        ('xls', 'Excel 97-2003'),
+        ('csv', 'CSV'),
+        ('parquet', 'Parquet')], required = False, help_text = 'Формат файла (по умолчанию - по расширению)')
     sheet_name = serializers.CharField(required = False, default = 'Sheet1', help_text = 'Название листа (по умолчанию Sheet1)')
     skip_rows = serializers.IntegerField(required = False, default = 0, min_value = 0, help_text = 'Количество строк для пропуска сверху')
     update_existing = serializers.BooleanField(required = False, default = False, help_text = 'Обновлять существующие записи')
     
     def validate_file(self, value):
         """Валидация файла."""
-        if not value.name.endswith(('.xlsx', '.xls')):
-            raise serializers.ValidationError('Файл должен быть в формате Excel (.xlsx или .xls)')
+        if not value.name.lower().endswith(('.xlsx', '.xls', '.csv', '.parquet')):
+            raise serializers.ValidationError('Файл должен быть в формате Excel (.xlsx или .xls), CSV или Parquet')
         if value.size > 10485760:  # 10 MB
             raise serializers.ValidationError('Размер файла не должен превышать 10 МБ')
         return value
@@ -316,7 +529,131 @@ class ExcelExportSerializer(serializers.Serializer):
     include_calculations = serializers.BooleanField(required = False, default = True, help_text = 'Включать расчетные поля')
     format = serializers.ChoiceField(choices = [
         ('xlsx', 'Excel 2007+'),
-        ('xls', 'Excel 97-2003')], default = 'xlsx', help_text = 'Формат файла')
+        ('xls', 'Excel 97-2003'),
+        ('csv', 'CSV'),
+        ('parquet', 'Parquet')], default = 'xlsx', help_text = 'Формат файла')
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    '''Сериализатор фоновой задачи импорта.'''
+    # Лимит размера файла для фонового импорта
+    MAX_FILE_SIZE = 209715200  # 200 MB
+    format = serializers.ChoiceField(choices = ImportJob.FORMAT_CHOICES, required = False, help_text = 'Формат файла (по умолчанию - по расширению)')
+    
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id',
+            'status',
+            'file',
+            'format',
+            'sheet_name',
+            'skip_rows',
+            'update_existing',
+            'partial_commit',
+            'rows_read',
+            'created_count',
+            'updated_count',
+            'errors_count',
+            'errors',
+            'error_message',
+            'created_at',
+            'started_at',
+            'finished_at']
+        read_only_fields = [
+            'status',
+            'rows_read',
+            'created_count',
+            'updated_count',
+            'errors_count',
+            'errors',
+            'error_message',
+            'created_at',
+            'started_at',
+            'finished_at']
+        extra_kwargs = {
+            'file': {
+                'write_only': True } }
+
+    
+    def validate_file(self, value):
+        """Валидация файла."""
+        if not value.name.lower().endswith(('.xlsx', '.xls', '.csv', '.parquet')):
+            raise serializers.ValidationError('Файл должен быть в формате Excel (.xlsx или .xls), CSV или Parquet')
+        if value.size > self.MAX_FILE_SIZE:
+            raise serializers.ValidationError('Размер файла не должен превышать 200 МБ')
+        return value
+
+    
+    def validate(self, data):
+        if not data.get('format'):
+            from .services.excel_service import ExcelService
+            data['format'] = ExcelService.detect_format(data['file'].name)
+        return data
+
+    
+    def to_representation(self, instance):
+        '''Счетчики выполняющейся задачи берутся из опубликованного прогресса.'''
+        data = super().to_representation(instance)
+        data.update(instance.get_live_progress())
+        return data
+
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    '''Сериализатор фоновой задачи экспорта.'''
+    download_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ExportJob
+        fields = [
+            'id',
+            'status',
+            'format',
+            'include_calculations',
+            'filters',
+            'rows_count',
+            'error_message',
+            'download_url',
+            'created_at',
+            'started_at',
+            'finished_at']
+        read_only_fields = fields
+
+    
+    def get_download_url(self, obj):
+        '''Ссылка на скачивание готового файла.'''
+        if not obj.has_artifact:
+            return None
+        from django.urls import reverse
+        url = reverse('mileage_calculator:export-job-download', args = [
+            obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class RecalculationJobSerializer(serializers.ModelSerializer):
+    '''Сериализатор фоновой задачи пересчета.'''
+    
+    class Meta:
+        model = RecalculationJob
+        fields = [
+            'id',
+            'status',
+            'scope',
+            'depot',
+            'train_ids',
+            'start_date',
+            'end_date',
+            'trains_count',
+            'updated_count',
+            'error_message',
+            'created_at',
+            'started_at',
+            'finished_at']
+        read_only_fields = fields
+
+
 
 
 class TrainAnalyticsSerializer(serializers.Serializer):
@@ -0,0 +1,472 @@
+'''
+Сервис пакетного пересчета расчетных полей ежедневных записей.
+Формулы 1-12 вычисляются над колонками pandas/NumPy сразу для всего окна записей.
+'''
+from datetime import timedelta
+from itertools import groupby
+import heapq
+from operator import itemgetter
+import logging
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class BulkCalculationService:
+    '''Колоночный движок пересчета записей поезда.'''
+
+    # Окно среднего пробега (формула 6)
+    AVG_WINDOW_DAYS = 90
+    # Лимит пробега до ТО (формулы 4, 7)
+    TO_MILEAGE_LIMIT = 25000
+    # Лимиты ТО-L и ТО-N для Сапсан (формулы 11, 12)
+    SAPSAN_TO_L_LIMIT = 25000
+    SAPSAN_TO_N_LIMIT = 150000
+    # Размер пакета для bulk_update
+    UPDATE_BATCH_SIZE = 500
+    # Размер пакета чтения потокового курсора
+    STREAM_CHUNK_SIZE = 2000
+    # Минимум записей на часть параллельного пересчета
+    PARTITION_MIN_RECORDS = 5000
+
+    # Поля, загружаемые из базы для расчета
+    LOAD_FIELDS = [
+        'id', 'train_id', 'record_date', 'total_mileage', 'daily_mileage',
+        'last_to_mileage', 'last_to_date', 'to_l_mileage', 'to_n_mileage',
+        'mileage_since_to', 'mileage_to_to', 'days_since_to', 'avg_mileage',
+        'planned_to_date', 'indicator_color', 'mileage_indicator_color'
+    ]
+
+    # Поля, которые движок записывает обратно в базу
+    CALCULATED_FIELDS = [
+        'total_mileage', 'daily_mileage', 'mileage_since_to', 'mileage_to_to',
+        'days_since_to', 'avg_mileage', 'planned_to_date', 'indicator_color',
+        'mileage_indicator_color'
+    ]
+
+    @classmethod
+    def recalculate_train(cls, train, start_date=None, end_date=None, anchor_start=True):
+        '''
+        Пересчет записей поезда за период одним чтением и одним bulk_update.
+
+        Args:
+            train: Поезд
+            start_date: Начало окна пересчета (по умолчанию - вся история)
+            end_date: Конец окна пересчета (по умолчанию - без ограничения)
+            anchor_start: Первая строка окна сохраняет свой общий пробег
+
+        Returns:
+            Количество измененных записей
+        '''
+        from ..models import TrainDailyRecord
+
+        queryset = TrainDailyRecord.objects.filter(train_id=train.id)
+        if start_date:
+            # История для формул 2 и 6 подгружается тем же запросом
+            queryset = queryset.filter(
+                record_date__gte=start_date - timedelta(days=cls.AVG_WINDOW_DAYS)
+            )
+        if end_date:
+            queryset = queryset.filter(record_date__lte=end_date)
+
+        rows = list(queryset.order_by('record_date').values_list(*cls.LOAD_FIELDS))
+        if not rows:
+            return 0
+
+        frame = cls.build_frame(rows)
+        calculated = cls.compute_frame(frame, train.type, start_date, anchor_start)
+
+        with transaction.atomic():
+            updated_count = cls.write_frame(frame, calculated)
+
+        from .calculation_service import MileageCalculationService
+        MileageCalculationService.clear_calculation_cache(train.id)
+
+        logger.info(f'Пакетный пересчет поезда {train.id}: изменено {updated_count} из {len(rows)} записей')
+        return updated_count
+
+    @classmethod
+    def recalculate_fleet(cls, start_date, end_date, depot_id=None, train_ids=None, chunk_size=None):
+        '''
+        Пересчет записей всех активных поездов одним потоковым запросом.
+
+        Записи читаются через iterator(), группируются по поезду в памяти,
+        а измененные строки записываются пакетами bulk_update.
+
+        Args:
+            start_date: Начало окна пересчета
+            end_date: Конец окна пересчета
+            depot_id: Ограничение по депо
+            train_ids: Ограничение по списку поездов
+            chunk_size: Размер пакета чтения курсора
+
+        Returns:
+            Dict {train_id: отчет по поезду}
+        '''
+        from ..models import Train, TrainDailyRecord
+
+        chunk_size = chunk_size or cls.STREAM_CHUNK_SIZE
+
+        trains = Train.objects.filter(is_active=True)
+        records = TrainDailyRecord.objects.filter(
+            train__is_active=True,
+            record_date__gte=start_date - timedelta(days=cls.AVG_WINDOW_DAYS),
+            record_date__lte=end_date
+        )
+        if depot_id:
+            trains = trains.filter(depot_id=depot_id)
+            records = records.filter(train__depot_id=depot_id)
+        if train_ids is not None:
+            trains = trains.filter(id__in=train_ids)
+            records = records.filter(train_id__in=train_ids)
+
+        report = {
+            train_id: {
+                'train_id': train_id,
+                'train_name': train_name,
+                'updated_count': 0,
+                'records_count': 0,
+                'status': 'success'
+            }
+            for train_id, train_name in trains.values_list('id', 'name')
+        }
+
+        stream = records.order_by('train_id', 'record_date').values_list(
+            *cls.LOAD_FIELDS, 'train__type'
+        ).iterator(chunk_size=chunk_size)
+
+        pending = []
+        type_index = len(cls.LOAD_FIELDS)
+        for train_id, group in groupby(stream, key=itemgetter(1)):
+            rows = list(group)
+            train_report = report.get(train_id)
+            if train_report is None:
+                continue
+            train_report['records_count'] = len(rows)
+            try:
+                frame = cls.build_frame([row[:type_index] for row in rows])
+                calculated = cls.compute_frame(frame, rows[0][type_index], start_date)
+                changed = cls.changed_records(frame, calculated)
+            except Exception as exc:
+                logger.error(f'Ошибка пакетного пересчета поезда {train_id}: {exc}')
+                train_report.update({'status': 'error', 'error': str(exc)})
+                continue
+
+            train_report['updated_count'] = len(changed)
+            pending.extend(changed)
+            if len(pending) >= cls.UPDATE_BATCH_SIZE:
+                cls._flush(pending)
+                pending = []
+
+        cls._flush(pending)
+
+        from .calculation_service import MileageCalculationService
+        for train_id in report:
+            MileageCalculationService.clear_calculation_cache(train_id)
+
+        total_updated = sum(r['updated_count'] for r in report.values())
+        logger.info(f'Пакетный пересчет парка: {len(report)} поездов, изменено {total_updated} записей')
+        return report
+
+    @classmethod
+    def partition_fleet(cls, start_date, end_date, partitions, depot_id=None):
+        '''
+        Разбиение активных поездов на части с близким числом записей.
+
+        Поезда распределяются жадно (LPT): самый большой поезд - в наименее
+        загруженную часть. Число частей ограничено так, чтобы на каждую
+        приходилось не меньше PARTITION_MIN_RECORDS записей.
+
+        Returns:
+            Список списков ID поездов, без пустых частей
+        '''
+        from django.db.models import Count, Q
+        from ..models import Train
+
+        trains = Train.objects.filter(is_active=True)
+        if depot_id:
+            trains = trains.filter(depot_id=depot_id)
+        sizes = trains.annotate(records_count=Count('daily_records', filter=Q(
+            daily_records__record_date__gte=start_date - timedelta(days=cls.AVG_WINDOW_DAYS),
+            daily_records__record_date__lte=end_date
+        ))).order_by().values_list('id', 'records_count')
+        sizes = sorted(sizes, key=lambda item: (-item[1], item[0]))
+
+        total_records = sum(count for _, count in sizes)
+        partitions = max(1, min(partitions, len(sizes), total_records // cls.PARTITION_MIN_RECORDS))
+
+        heap = [(0, index) for index in range(partitions)]
+        parts = [[] for _ in range(partitions)]
+        for train_id, count in sizes:
+            load, index = heapq.heappop(heap)
+            parts[index].append(train_id)
+            heapq.heappush(heap, (load + count, index))
+        return [part for part in parts if part]
+
+    @classmethod
+    def propagate_from(cls, train, from_date, anchor_start=True):
+        '''
+        Прямое распространение правки исторической записи.
+
+        Пересчитывается только хвост истории поезда начиная с from_date:
+        по формуле 1 он зависит от исправленного общего пробега.
+
+        Returns:
+            Количество измененных записей
+        '''
+        return cls.recalculate_train(train, from_date, None, anchor_start)
+
+    @staticmethod
+    def track_change(changes, train_id, record_date, changed_fields):
+        '''
+        Учет изменения записи в словаре {train_id: (from_date, anchor_start)}.
+
+        Для каждого поезда хранится самая ранняя измененная дата. Если изменен
+        общий пробег, исправленная запись становится опорной; если только
+        суточный пробег или дата - ее общий пробег пересчитывается от предыдущей.
+        '''
+        changed_fields = set(changed_fields)
+        if not changed_fields & {'total_mileage', 'daily_mileage', 'record_date'}:
+            return changes
+
+        anchor_start = 'total_mileage' in changed_fields and 'record_date' not in changed_fields
+        current = changes.get(train_id)
+        if current is None or record_date < current[0]:
+            changes[train_id] = (record_date, anchor_start)
+        elif record_date == current[0]:
+            changes[train_id] = (record_date, current[1] and anchor_start)
+        return changes
+
+    @classmethod
+    def propagate_changes(cls, changes):
+        '''
+        Пересчет хвостов истории для набора поездов.
+
+        Args:
+            changes: Dict {train_id: (from_date, anchor_start)} из track_change
+
+        Returns:
+            Dict {train_id: количество измененных записей}
+        '''
+        from ..models import Train
+
+        if not changes:
+            return {}
+
+        trains = Train.objects.in_bulk(list(changes))
+        report = {}
+        for train_id, (from_date, anchor_start) in changes.items():
+            train = trains.get(train_id)
+            if train is None:
+                continue
+            report[train_id] = cls.propagate_from(train, from_date, anchor_start)
+        return report
+
+    @classmethod
+    def _flush(cls, records):
+        '''Запись накопленного пакета в отдельной транзакции.'''
+        if records:
+            with transaction.atomic():
+                cls.bulk_write(records)
+
+    @classmethod
+    def build_frame(cls, rows):
+        '''Построение DataFrame из кортежей values_list(*LOAD_FIELDS).'''
+        frame = pd.DataFrame.from_records(rows, columns=cls.LOAD_FIELDS)
+        return frame.astype(object).where(frame.notna(), None)
+
+    @classmethod
+    def compute_frame(cls, frame, train_type, start_date=None, anchor_start=True):
+        '''
+        Расчет формул 1-12 для записей одного поезда.
+
+        Строки раньше start_date используются только как история для формул 2 и 6
+        и не изменяются. Первая строка окна служит опорной для формулы 1,
+        если anchor_start; иначе ее общий пробег продолжает цепочку истории.
+        Формулы 8 и 9 хранятся как свойства модели и здесь не пересчитываются.
+
+        Returns:
+            DataFrame с рассчитанными колонками, отсортированный по дате
+        '''
+        df = frame.sort_values('record_date', kind='stable').reset_index(drop=True)
+        dates = pd.to_datetime(df['record_date'])
+        if start_date:
+            in_window = (dates >= pd.Timestamp(start_date)).to_numpy()
+        else:
+            in_window = np.ones(len(df), dtype=bool)
+
+        total = cls._numeric(df['total_mileage'])
+        daily = cls._numeric(df['daily_mileage'])
+
+        # Формула 1: общий пробег = предыдущий общий пробег + суточный пробег.
+        # Опорные строки (история, первая строка окна, строки без суточного пробега,
+        # строки после пропущенных дней) сохраняют свой общий пробег и начинают
+        # новую цепочку накопления: через пропуск предыдущий день неизвестен.
+        after_gap = (dates.diff() != pd.Timedelta(days=1)).to_numpy()
+        is_anchor = ~in_window | daily.isna().to_numpy() | after_gap
+        first_in_window = np.argmax(in_window) if in_window.any() else None
+        if first_in_window is not None and anchor_start:
+            is_anchor[first_in_window] = True
+        is_anchor[0] = True
+        segment = pd.Series(is_anchor).cumsum()
+        base = total.where(is_anchor).groupby(segment).transform('first')
+        increments = daily.where(~is_anchor, 0.0).groupby(segment).cumsum()
+        total = base + increments
+
+        # Формула 2: суточный пробег = общий пробег сегодня - общий пробег вчера
+        derived_daily = (total - total.shift(1)).clip(lower=0)
+        daily = daily.where(daily.notna(), derived_daily)
+
+        # Формула 3: пробег от ТО (как в TrainDailyRecord.save)
+        last_to_mileage = cls._numeric(df['last_to_mileage'])
+        has_to_mileage = (last_to_mileage > 0) & (total > 0)
+        mileage_since_to = (total - last_to_mileage).where(
+            has_to_mileage, cls._numeric(df['mileage_since_to'])
+        )
+
+        # Формула 4: остаток до ТО
+        mileage_to_to = (cls.TO_MILEAGE_LIMIT - mileage_since_to).clip(lower=0).where(
+            mileage_since_to.notna(), cls._numeric(df['mileage_to_to'])
+        )
+
+        # Формула 5: дней с последнего ТО
+        last_to_date = pd.to_datetime(df['last_to_date'])
+        days_since_to = (dates - last_to_date).dt.days.astype('float64').where(
+            last_to_date.notna(), cls._numeric(df['days_since_to'])
+        )
+
+        # Формула 6: средний пробег за 90 дней без учета простоев
+        working_daily = daily.where(daily > 0)
+        avg_mileage = (
+            pd.Series(working_daily.to_numpy(), index=dates)
+            .rolling(f'{cls.AVG_WINDOW_DAYS}D', closed='both')
+            .mean()
+            .round(2)
+            .fillna(0.0)
+            .to_numpy()
+        )
+        avg_mileage = pd.Series(avg_mileage)
+
+        # Формула 7: плановая дата ТО
+        remaining = cls.TO_MILEAGE_LIMIT - mileage_since_to
+        has_plan = (avg_mileage > 0) & mileage_since_to.notna()
+        days_to_to = np.trunc((remaining / avg_mileage.where(has_plan)).clip(lower=0))
+        planned = dates + pd.to_timedelta(days_to_to.fillna(0), unit='D')
+        existing_planned = pd.to_datetime(df['planned_to_date'])
+        planned_to_date = planned.where(has_plan, existing_planned)
+
+        # Цветовые индикаторы
+        indicator_color = pd.Series(np.select(
+            [days_since_to < 45, days_since_to <= 55, days_since_to.notna()],
+            ['green', 'yellow', 'red'],
+            default=None
+        ), dtype=object).where(days_since_to.notna(), df['indicator_color'])
+        mileage_indicator_color = pd.Series(np.select(
+            [mileage_since_to < 23000, mileage_since_to < 25000, mileage_since_to.notna()],
+            ['green', 'yellow', 'red'],
+            default=None
+        ), dtype=object).where(mileage_since_to.notna(), df['mileage_indicator_color'])
+
+        result = pd.DataFrame({
+            'id': df['id'],
+            'record_date': df['record_date'],
+            'in_window': in_window,
+            'total_mileage': cls._to_python(total, 'int'),
+            'daily_mileage': cls._to_python(daily, 'int'),
+            'mileage_since_to': cls._to_python(mileage_since_to, 'int'),
+            'mileage_to_to': cls._to_python(mileage_to_to, 'int'),
+            'days_since_to': cls._to_python(days_since_to, 'int'),
+            'avg_mileage': cls._to_python(avg_mileage, 'float'),
+            'planned_to_date': cls._to_python(planned_to_date, 'date'),
+            'indicator_color': indicator_color.where(indicator_color.notna(), None),
+            'mileage_indicator_color': mileage_indicator_color.where(mileage_indicator_color.notna(), None),
+        })
+
+        # Формулы 10-12: пробеги ТО-L и ТО-N для Сапсан
+        if train_type == 'Сапсан':
+            to_l_mileage = cls._numeric(df['to_l_mileage'])
+            to_n_mileage = cls._numeric(df['to_n_mileage'])
+            from_to_l = (total - to_l_mileage).where((to_l_mileage > 0) & (total > 0))
+            to_to_l = (cls.SAPSAN_TO_L_LIMIT - from_to_l).clip(lower=0)
+            to_to_n = (cls.SAPSAN_TO_N_LIMIT + to_n_mileage - total).clip(lower=0).where(
+                (to_n_mileage > 0) & (total > 0)
+            )
+            result['sapsan_mileage_from_to_l'] = cls._to_python(from_to_l, 'int')
+            result['sapsan_mileage_to_to_l'] = cls._to_python(to_to_l, 'int')
+            result['sapsan_mileage_to_to_n'] = cls._to_python(to_to_n, 'int')
+
+        return result
+
+    @classmethod
+    def write_frame(cls, frame, calculated):
+        '''Запись измененных строк окна одним вызовом bulk_update.'''
+        records = cls.changed_records(frame, calculated)
+        cls.bulk_write(records)
+        return len(records)
+
+    @classmethod
+    def changed_records(cls, frame, calculated):
+        '''Экземпляры записей окна, у которых изменились расчетные поля.'''
+        from ..models import TrainDailyRecord
+
+        original = frame.set_index('id')
+        calculated = calculated.set_index('id')
+        original = original.loc[calculated.index]
+
+        changed = np.zeros(len(calculated), dtype=bool)
+        for field in cls.CALCULATED_FIELDS:
+            changed |= cls._differs(original[field], calculated[field])
+        changed &= calculated['in_window'].to_numpy()
+
+        if not changed.any():
+            return []
+
+        now = timezone.now()
+        rows = calculated[changed].reset_index()[['id'] + cls.CALCULATED_FIELDS]
+        train_ids = original['train_id'].to_numpy()[changed]
+        return [
+            TrainDailyRecord(updated_at=now, train_id=int(train_id), **row)
+            for train_id, row in zip(train_ids, rows.to_dict('records'))
+        ]
+
+    @classmethod
+    def bulk_write(cls, records):
+        '''Запись расчетных полей пакетами по UPDATE_BATCH_SIZE и обновление текущего состояния поездов.'''
+        from ..models import TrainDailyRecord, TrainCurrentState
+
+        if records:
+            TrainDailyRecord.objects.bulk_update(
+                records, cls.CALCULATED_FIELDS + ['updated_at'], batch_size=cls.UPDATE_BATCH_SIZE
+            )
+            TrainCurrentState.refresh({record.train_id for record in records})
+
+    @staticmethod
+    def _numeric(series):
+        '''Приведение колонки к float64 с NaN вместо None.'''
+        return pd.to_numeric(series, errors='coerce').astype('float64').reset_index(drop=True)
+
+    @staticmethod
+    def _to_python(series, kind):
+        '''Приведение рассчитанной колонки к python-значениям для ORM.'''
+        series = pd.Series(series).reset_index(drop=True)
+        if kind == 'int':
+            values = [None if pd.isna(v) else int(round(v)) for v in series]
+        elif kind == 'float':
+            values = [None if pd.isna(v) else float(v) for v in series]
+        else:
+            values = [None if pd.isna(v) else pd.Timestamp(v).date() for v in series]
+        return pd.Series(values, dtype=object)
+
+    @staticmethod
+    def _differs(left, right):
+        '''Поэлементное сравнение колонок с учетом None.'''
+        left_values = left.to_numpy(dtype=object)
+        right_values = right.to_numpy(dtype=object)
+        return np.array([
+            not (a == b or (a is None and b is None))
+            for a, b in zip(left_values, right_values)
+        ], dtype=bool)
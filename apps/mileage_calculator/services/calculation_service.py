@@ -114,14 +114,14 @@ class MileageCalculationService:
         '''Формула 6: Средний пробег за заданное количество дней'''
         from ..models import TrainDailyRecord
         
-        cache_key = f'avg_mileage_{train.id}_{days}'
+        if not current_date:
+            current_date = date.today()
+            
+        cache_key = f'avg_mileage_{train.id}_{current_date.isoformat()}_{days}'
         cached_result = cache.get(cache_key)
         if cached_result:
             return cached_result
             
-        if not current_date:
-            current_date = date.today()
-            
         start_date = current_date - timedelta(days=days)
         
         records = TrainDailyRecord.objects.filter(
@@ -360,8 +360,15 @@ class MileageCalculationService:
             cache.clear()
 
     @staticmethod
-    def recalculate_all_fields(record):
-        '''Пересчет всех полей записи'''
+    def bulk_calculate_for_train(train, start_date, end_date):
+        '''Пакетный пересчет всех записей поезда за период'''
+        from .bulk_calculation_service import BulkCalculationService
+
+        return BulkCalculationService.recalculate_train(train, start_date, end_date)
+
+    @staticmethod
+    def recalculate_all_fields(record, avg_mileage=None):
+        '''Пересчет всех полей записи (avg_mileage можно передать заранее рассчитанным)'''
         train_type = record.train.type
         
         # Основные расчеты
@@ -370,9 +377,11 @@ class MileageCalculationService:
         record.days_since_to = MileageCalculationService.calculate_days_since_to(record)
         
         # Средний пробег
-        record.avg_mileage = MileageCalculationService.calculate_average_mileage(
-            record.train, record.record_date
-        )
+        if avg_mileage is None:
+            avg_mileage = MileageCalculationService.calculate_average_mileage(
+                record.train, record.record_date
+            )
+        record.avg_mileage = avg_mileage
         
         # Плановая дата ТО
         if record.avg_mileage and record.mileage_since_to is not None:
@@ -387,20 +396,23 @@ class MileageCalculationService:
         return record 
 
     @staticmethod
-    def calculate_all_metrics(record, force_recalculate=False):
-        '''Расчет всех метрик для записи'''
+    def calculate_all_metrics(record, force_recalculate=False, avg_mileage=None):
+        '''Расчет всех метрик для записи (avg_mileage можно передать заранее рассчитанным)'''
         if not record:
             return {}
             
         try:
             train_type = record.train.type
             
+            if avg_mileage is None:
+                avg_mileage = MileageCalculationService.calculate_average_mileage(record.train, record.record_date)
+            
             # Основные расчеты
             metrics = {
                 'mileage_since_to': MileageCalculationService.calculate_mileage_since_to(record),
                 'mileage_to_to': MileageCalculationService.calculate_mileage_to_to(record, train_type),
                 'days_since_to': MileageCalculationService.calculate_days_since_to(record),
-                'avg_mileage': MileageCalculationService.calculate_average_mileage(record.train, record.record_date),
+                'avg_mileage': avg_mileage,
                 'indicator_color': MileageCalculationService.calculate_indicator_color(record),
                 'mileage_indicator_color': MileageCalculationService.calculate_mileage_indicator_color(record),
                 'next_block_date': MileageCalculationService.calculate_next_block_date(record),
@@ -1,15 +1,21 @@
 """
 Сервис для работы с Excel файлами.
-Импорт и экспорт данных калькулятора пробега.
+Импорт и экспорт данных калькулятора пробега (Excel, CSV, Parquet).
 """
 import pandas as pd
+import csv
 import io
+import tempfile
 from typing import Dict, Any
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
 from django.db import transaction
+from django.db.models import CharField, Max
+from django.db.models.functions import Cast, Length
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 import logging
-from apps.mileage_calculator.models import Train, TrainDailyRecord
+from apps.mileage_calculator.models import Train, TrainDailyRecord, TrainCurrentState
+from apps.mileage_calculator.services.bulk_calculation_service import BulkCalculationService
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +45,53 @@ class ExcelService:
         'Ручная индикация ТО': 'manual_indicator_next_to'
     }
     
+    # Поля записи и приведение типов при импорте (даты уже обработаны)
+    IMPORT_FIELD_TYPES = {
+        'total_mileage': int,
+        'daily_mileage': int,
+        'last_to_mileage': int,
+        'last_to_date': None,
+        'last_to_type': str,
+        'next_to_type': str,
+        'last_block_date': None,
+        'last_kp_measure_date': None,
+        'inspection_counter': int,
+        'to_l_mileage': int,
+        'to_n_mileage': int,
+        'is510_mileage': int,
+        'is520_mileage': int,
+        'is530_mileage': int,
+        'manual_indicator_train': bool,
+        'manual_indicator_next_to': bool
+    }
+    
+    # Производные поля, пересчитываемые при обновлении записей
+    IMPORT_DERIVED_FIELDS = [
+        'mileage_since_to', 'mileage_to_to', 'days_since_to',
+        'indicator_color', 'mileage_indicator_color', 'updated_at'
+    ]
+    
+    # Размер пакета запросов импорта
+    IMPORT_BATCH_SIZE = 1000
+    # Размер пакета чтения CSV и Parquet при импорте
+    IMPORT_CHUNK_SIZE = 10000
+    # Значения, считающиеся пустыми при импорте
+    IMPORT_NA_VALUES = ['', 'N/A', 'NULL', 'null', '-']
+    
+    # Поддерживаемые форматы файлов импорта и экспорта
+    TABULAR_FORMATS = ['xlsx', 'xls', 'csv', 'parquet']
+    # MIME-типы файлов экспорта
+    EXPORT_CONTENT_TYPES = {
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'csv': 'text/csv; charset=utf-8',
+        'parquet': 'application/vnd.apache.parquet'
+    }
+    
+    # Размер пакета чтения курсора при экспорте
+    EXPORT_CHUNK_SIZE = 2000
+    # Размер файла экспорта, после которого он сбрасывается на диск
+    EXPORT_SPOOL_MAX_SIZE = 10 * 1024 * 1024
+    
     # Колонки для экспорта
     EXPORT_COLUMNS = [
         ('train__name', 'Поезд'),
@@ -68,91 +121,427 @@ class ExcelService:
         ('manual_indicator_next_to', 'Ручная индикация ТО')
     ]
 
+    # Расчетные колонки, исключаемые при include_calculations=False
+    CALCULATED_EXPORT_FIELDS = [
+        'planned_to_date', 'mileage_since_to', 'mileage_to_to',
+        'days_since_to', 'avg_mileage'
+    ]
+    
+    # Максимальная ширина колонки Excel
+    MAX_COLUMN_WIDTH = 50
+
+    @classmethod
+    def get_export_columns(cls, include_calculations=True):
+        """Колонки экспорта с учетом флага расчетных полей."""
+        if include_calculations:
+            return list(cls.EXPORT_COLUMNS)
+        return [
+            (field, header) for field, header in cls.EXPORT_COLUMNS
+            if field not in cls.CALCULATED_EXPORT_FIELDS
+        ]
+
     @classmethod
-    def export_to_excel(cls, queryset, filename='vsm_data.xlsx'):
-        """Экспорт данных в Excel файл."""
+    def export_to_excel(cls, queryset, filename='vsm_data.xlsx', include_calculations=True, format='xlsx'):
+        """
+        Потоковый экспорт данных в Excel файл.
+        
+        Записи читаются через iterator() и пишутся в книгу openpyxl в режиме
+        write-only во временный файл, поэтому память не растет с числом строк.
+        Формат xls не поддерживается openpyxl - такой файл выгружается как xlsx.
+        """
         try:
-            # Простой экспорт без сложной логики
-            data = list(queryset.values(
-                'train__name',
-                'record_date', 
-                'total_mileage',
-                'daily_mileage'
-            ))
+            if format != 'xlsx':
+                logger.warning(f'Формат {format} не поддерживается, экспорт выполняется в xlsx')
+                filename = f'{filename.rsplit(".", 1)[0]}.xlsx'
             
-            df = pd.DataFrame(data)
+            columns = cls.get_export_columns(include_calculations)
+            buffer = cls._write_workbook(queryset, columns)
             
-            # Создаем HTTP ответ
-            response = HttpResponse(
+            return FileResponse(
+                buffer,
+                as_attachment=True,
+                filename=filename,
                 content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
             )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            
-            # Записываем в буфер
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Данные VSM', index=False)
-            
-            response.write(buffer.getvalue())
-            return response
             
         except Exception as e:
             logger.error(f'Ошибка экспорта в Excel: {e}')
             raise
 
+    @classmethod
+    def _write_workbook(cls, queryset, columns, target=None, sheet_name='Данные VSM'):
+        """
+        Запись строк queryset в книгу write-only.
+        
+        Returns:
+            Файл target (по умолчанию временный) с книгой, позиционированный на начало
+        """
+        from openpyxl import Workbook
+        
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(sheet_name)
+        cls._format_excel_sheet(worksheet, columns, cls._column_widths(queryset, columns))
+        
+        rows = queryset.values_list(*[field for field, _ in columns]).iterator(
+            chunk_size=cls.EXPORT_CHUNK_SIZE
+        )
+        for row in rows:
+            worksheet.append(row)
+        
+        buffer = target or tempfile.SpooledTemporaryFile(max_size=cls.EXPORT_SPOOL_MAX_SIZE)
+        workbook.save(buffer)
+        buffer.seek(0)
+        return buffer
+
+    @classmethod
+    def write_export(cls, queryset, target, include_calculations=True, format='xlsx'):
+        """
+        Запись экспорта в двоичный файл target (для сохраняемых артефактов).
+        
+        Форматы и колонки совпадают с export_data.
+        """
+        columns = cls.get_export_columns(include_calculations)
+        if format == 'csv':
+            cls._write_csv(queryset, columns, target)
+        elif format == 'parquet':
+            cls._write_parquet(queryset, columns, target)
+        else:
+            cls._write_workbook(queryset, columns, target)
+
+    @classmethod
+    def _write_csv(cls, queryset, columns, target):
+        """Запись строк queryset в CSV."""
+        text = io.TextIOWrapper(target, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow([header for _, header in columns])
+        rows = queryset.values_list(*[field for field, _ in columns]).iterator(
+            chunk_size=cls.EXPORT_CHUNK_SIZE
+        )
+        for row in rows:
+            writer.writerow(['' if value is None else value for value in row])
+        text.flush()
+        text.detach()
+
+    @classmethod
+    def _write_parquet(cls, queryset, columns, target):
+        """Запись строк queryset в Parquet группами по EXPORT_CHUNK_SIZE."""
+        pa, pq = cls._import_pyarrow()
+        
+        schema = pa.schema([
+            (header, cls._arrow_type(pa, queryset.model, field)) for field, header in columns
+        ])
+        writer = pq.ParquetWriter(target, schema)
+        rows = queryset.values_list(*[field for field, _ in columns]).iterator(
+            chunk_size=cls.EXPORT_CHUNK_SIZE
+        )
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= cls.EXPORT_CHUNK_SIZE:
+                writer.write_table(cls._arrow_table(pa, schema, batch))
+                batch = []
+        if batch:
+            writer.write_table(cls._arrow_table(pa, schema, batch))
+        writer.close()
+
+    @classmethod
+    def export_data(cls, queryset, filename='vsm_data.xlsx', include_calculations=True, format='xlsx'):
+        """Экспорт данных в выбранном формате (xlsx, xls, csv, parquet)."""
+        filename = f'{filename.rsplit(".", 1)[0]}.{format}'
+        if format == 'csv':
+            return cls.export_to_csv(queryset, filename, include_calculations)
+        if format == 'parquet':
+            return cls.export_to_parquet(queryset, filename, include_calculations)
+        return cls.export_to_excel(queryset, filename, include_calculations, format)
+
+    @classmethod
+    def export_to_csv(cls, queryset, filename='vsm_data.csv', include_calculations=True):
+        """
+        Потоковый экспорт данных в CSV.
+        
+        Строки формируются генератором по мере чтения курсора.
+        """
+        columns = cls.get_export_columns(include_calculations)
+        
+        class Echo:
+            """Буфер csv.writer, возвращающий записанную строку."""
+            def write(self, value):
+                return value
+        
+        def generate():
+            writer = csv.writer(Echo())
+            yield writer.writerow([header for _, header in columns])
+            rows = queryset.values_list(*[field for field, _ in columns]).iterator(
+                chunk_size=cls.EXPORT_CHUNK_SIZE
+            )
+            for row in rows:
+                yield writer.writerow(['' if value is None else value for value in row])
+        
+        response = StreamingHttpResponse(generate(), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @classmethod
+    def export_to_parquet(cls, queryset, filename='vsm_data.parquet', include_calculations=True):
+        """
+        Экспорт данных в Parquet.
+        
+        Записи пишутся группами строк по EXPORT_CHUNK_SIZE во временный файл.
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=cls.EXPORT_SPOOL_MAX_SIZE)
+        cls._write_parquet(queryset, cls.get_export_columns(include_calculations), buffer)
+        buffer.seek(0)
+        
+        return FileResponse(
+            buffer,
+            as_attachment=True,
+            filename=filename,
+            content_type='application/vnd.apache.parquet'
+        )
+
+    @classmethod
+    def _arrow_table(cls, pa, schema, rows):
+        """Таблица pyarrow из пакета кортежей values_list."""
+        values = list(zip(*rows))
+        return pa.Table.from_arrays(
+            [pa.array(column, type=schema.field(index).type) for index, column in enumerate(values)],
+            schema=schema
+        )
+
+    @classmethod
+    def _arrow_type(cls, pa, model, lookup):
+        """Тип колонки pyarrow по полю модели (с учетом связей через __)."""
+        *relations, name = lookup.split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        internal_type = model._meta.get_field(name).get_internal_type()
+        return {
+            'DateField': pa.date32(),
+            'DateTimeField': pa.timestamp('us', tz='UTC'),
+            'IntegerField': pa.int64(),
+            'BigIntegerField': pa.int64(),
+            'PositiveIntegerField': pa.int64(),
+            'FloatField': pa.float64(),
+            'BooleanField': pa.bool_(),
+        }.get(internal_type, pa.string())
+
+    @classmethod
+    def _import_pyarrow(cls):
+        """Загрузка pyarrow - необязательной зависимости для Parquet."""
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValidationError('Для работы с Parquet требуется пакет pyarrow')
+        return pyarrow, pyarrow.parquet
+
+    @classmethod
+    def detect_format(cls, filename, default='xlsx'):
+        """Формат файла по расширению."""
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        return extension if extension in cls.TABULAR_FORMATS else default
+
+    @classmethod
+    def import_from_file(cls, file, format=None, sheet_name='Sheet1', skip_rows=0, update_existing=False):
+        """Импорт данных из файла Excel, CSV или Parquet."""
+        format = format or cls.detect_format(getattr(file, 'name', '') or '')
+        if format == 'csv':
+            return cls.import_from_csv(file, skip_rows=skip_rows, update_existing=update_existing)
+        if format == 'parquet':
+            return cls.import_from_parquet(file, update_existing=update_existing)
+        return cls.import_from_excel(
+            file, sheet_name=sheet_name, skip_rows=skip_rows, update_existing=update_existing
+        )
+
     @classmethod 
-    def import_from_excel(cls, file, sheet_name='Sheet1', skip_rows=0, update_existing=False):
+    def import_from_excel(cls, file, sheet_name='Sheet1', skip_rows=0, update_existing=False, chunk_size=None):
         """
         Импорт данных из Excel файла.
         
+        Лист xlsx читается потоково пакетами по chunk_size строк.
+        
         Args:
             file: Файл для импорта
             sheet_name: Имя листа
             skip_rows: Количество строк для пропуска
             update_existing: Обновлять ли существующие записи
+            chunk_size: Размер пакета строк
             
         Returns:
             Dict с результатами импорта
         """
         try:
-            # Читаем Excel файл
-            df = pd.read_excel(
-                file, 
-                sheet_name=sheet_name, 
-                skiprows=skip_rows,
-                na_values=['', 'N/A', 'NULL', 'null', '-']
+            format = cls.detect_format(getattr(file, 'name', '') or '')
+            if format != 'xls':
+                format = 'xlsx'
+            chunks = cls.iter_import_chunks(
+                file, format, sheet_name=sheet_name, skip_rows=skip_rows, chunk_size=chunk_size
             )
+            results = cls._import_chunks(chunks, update_existing)
             
-            logger.info(f'Прочитано {len(df)} строк из Excel файла')
-            
-            # Проверяем обязательные колонки
-            required_columns = ['Поезд', 'Дата', 'Общий пробег', 'Суточный пробег']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                raise ValidationError(f'Отсутствуют обязательные колонки: {missing_columns}')
+            logger.info(f'Прочитано {results["total_processed"]} строк из Excel файла')
+            logger.info(f'Импорт завершен: создано {results["created"]}, обновлено {results["updated"]}')
+            return results
             
-            # Маппинг колонок
-            column_mapping = {}
-            for excel_col, model_field in cls.IMPORT_COLUMNS_MAPPING.items():
-                if excel_col in df.columns:
-                    column_mapping[excel_col] = model_field
-                    
-            df = df.rename(columns=column_mapping)
+        except Exception as e:
+            logger.error(f'Ошибка импорта из Excel: {e}')
+            raise
+
+    @classmethod
+    def import_from_csv(cls, file, skip_rows=0, update_existing=False, chunk_size=None):
+        """
+        Импорт данных из CSV файла пакетами по chunk_size строк.
+        
+        Returns:
+            Dict с результатами импорта
+        """
+        try:
+            chunks = cls.iter_import_chunks(file, 'csv', skip_rows=skip_rows, chunk_size=chunk_size)
+            results = cls._import_chunks(chunks, update_existing)
             
-            # Очищаем данные
-            df = cls._clean_import_data(df)
+            logger.info(f'Импорт CSV завершен: создано {results["created"]}, обновлено {results["updated"]}')
+            return results
             
-            # Импортируем записи
-            results = cls._import_records(df, update_existing)
+        except Exception as e:
+            logger.error(f'Ошибка импорта из CSV: {e}')
+            raise
+
+    @classmethod
+    def import_from_parquet(cls, file, update_existing=False, chunk_size=None):
+        """
+        Импорт данных из Parquet файла пакетами строк.
+        
+        Returns:
+            Dict с результатами импорта
+        """
+        cls._import_pyarrow()
+        try:
+            chunks = cls.iter_import_chunks(file, 'parquet', chunk_size=chunk_size)
+            results = cls._import_chunks(chunks, update_existing)
             
-            logger.info(f'Импорт завершен: создано {results["created"]}, обновлено {results["updated"]}')
+            logger.info(f'Импорт Parquet завершен: создано {results["created"]}, обновлено {results["updated"]}')
             return results
             
         except Exception as e:
-            logger.error(f'Ошибка импорта из Excel: {e}')
+            logger.error(f'Ошибка импорта из Parquet: {e}')
             raise
 
+    @classmethod
+    def _import_chunks(cls, chunks, update_existing=False):
+        """Импорт последовательности DataFrame одной транзакцией с объединением результатов."""
+        results = {'created': 0, 'updated': 0, 'errors': [], 'total_processed': 0}
+        with transaction.atomic():
+            for df in chunks:
+                chunk_results = cls.import_dataframe(df, update_existing)
+                results['created'] += chunk_results['created']
+                results['updated'] += chunk_results['updated']
+                results['errors'].extend(chunk_results['errors'])
+                results['total_processed'] += chunk_results['total_processed']
+        return results
+
+    @classmethod
+    def iter_import_chunks(cls, file, format=None, sheet_name='Sheet1', skip_rows=0, chunk_size=None):
+        """
+        Чтение файла импорта пакетами DataFrame со сквозной нумерацией строк.
+        
+        Пакеты передаются в import_dataframe; используется фоновыми задачами импорта.
+        """
+        format = format or cls.detect_format(getattr(file, 'name', '') or '')
+        chunk_size = chunk_size or cls.IMPORT_CHUNK_SIZE
+        
+        if format == 'csv':
+            yield from pd.read_csv(
+                file,
+                skiprows=skip_rows,
+                na_values=cls.IMPORT_NA_VALUES,
+                chunksize=chunk_size
+            )
+        elif format == 'parquet':
+            _, pq = cls._import_pyarrow()
+            offset = 0
+            for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_size):
+                df = batch.to_pandas()
+                df.index = pd.RangeIndex(offset, offset + len(df))
+                offset += len(df)
+                yield df
+        elif format == 'xls':
+            # openpyxl не читает xls - лист загружается целиком через xlrd
+            df = pd.read_excel(
+                file,
+                sheet_name=sheet_name,
+                skiprows=skip_rows,
+                na_values=cls.IMPORT_NA_VALUES
+            )
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size]
+        else:
+            yield from cls._iter_excel_chunks(file, sheet_name, skip_rows, chunk_size)
+
+    @classmethod
+    def _iter_excel_chunks(cls, file, sheet_name='Sheet1', skip_rows=0, chunk_size=None):
+        """
+        Потоковое чтение листа xlsx пакетами строк.
+        
+        Книга открывается openpyxl в режиме read-only, поэтому в памяти
+        одновременно находится только текущий пакет строк.
+        """
+        from openpyxl import load_workbook
+        
+        chunk_size = chunk_size or cls.IMPORT_CHUNK_SIZE
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            for _ in range(skip_rows):
+                next(rows, None)
+            header = next(rows, None)
+            if header is None:
+                return
+            
+            offset = 0
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    yield cls._excel_batch_frame(batch, header, offset)
+                    offset += len(batch)
+                    batch = []
+            if batch:
+                yield cls._excel_batch_frame(batch, header, offset)
+        finally:
+            workbook.close()
+
+    @classmethod
+    def _excel_batch_frame(cls, batch, header, offset):
+        """DataFrame пакета строк листа с пустыми значениями IMPORT_NA_VALUES."""
+        df = pd.DataFrame.from_records(
+            batch, columns=list(header), index=pd.RangeIndex(offset, offset + len(batch))
+        )
+        return df.mask(df.isin(cls.IMPORT_NA_VALUES))
+
+    @classmethod
+    def import_dataframe(cls, df, update_existing=False):
+        """Проверка колонок, очистка и импорт DataFrame с колонками IMPORT_COLUMNS_MAPPING."""
+        # Проверяем обязательные колонки
+        required_columns = ['Поезд', 'Дата', 'Общий пробег', 'Суточный пробег']
+        missing_columns = [col for col in required_columns if col not in df.columns]
+        
+        if missing_columns:
+            raise ValidationError(f'Отсутствуют обязательные колонки: {missing_columns}')
+        
+        # Маппинг колонок
+        column_mapping = {}
+        for excel_col, model_field in cls.IMPORT_COLUMNS_MAPPING.items():
+            if excel_col in df.columns:
+                column_mapping[excel_col] = model_field
+                
+        df = df.rename(columns=column_mapping)
+        
+        # Очищаем данные
+        df = cls._clean_import_data(df)
+        
+        # Импортируем записи
+        return cls._import_records(df, update_existing)
+
     @classmethod
     def _format_dataframe(cls, df):
         """Форматирование DataFrame для экспорта."""
@@ -178,38 +567,50 @@ class ExcelService:
         df.fillna('', inplace=True)
 
     @classmethod
-    def _format_excel_sheet(cls, worksheet, df):
-        """Форматирование Excel листа."""
-        try:
-            from openpyxl.styles import Font, PatternFill, Alignment
-            
-            # Стиль заголовков
-            header_font = Font(bold=True, color='FFFFFF')
-            header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-            
-            # Применяем стиль к заголовкам
-            for cell in worksheet[1]:
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = Alignment(horizontal='center')
-            
-            # Автоширина колонок
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                
-                for cell in column:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-                
-        except ImportError:
-            # Если openpyxl не доступен, пропускаем форматирование
-            pass
-        except Exception as e:
-            logger.warning(f'Ошибка форматирования Excel листа: {e}')
+    def _column_widths(cls, queryset, columns):
+        """
+        Ширина колонок по максимальной длине значений.
+        
+        Длины считаются одним агрегирующим запросом, а не обходом ячеек.
+        """
+        aggregates = {
+            f'width_{index}': Max(Length(Cast(field, output_field=CharField())))
+            for index, (field, _) in enumerate(columns)
+        }
+        lengths = queryset.order_by().aggregate(**aggregates)
+        
+        widths = []
+        for index, (_, header) in enumerate(columns):
+            max_length = max(lengths[f'width_{index}'] or 0, len(header))
+            widths.append(min(max_length + 2, cls.MAX_COLUMN_WIDTH))
+        return widths
+
+    @classmethod
+    def _format_excel_sheet(cls, worksheet, columns, widths):
+        """
+        Форматирование листа write-only: ширина колонок и строка заголовков.
+        
+        Вызывается до записи строк данных.
+        """
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, PatternFill, Alignment
+        from openpyxl.utils import get_column_letter
+        
+        for index, width in enumerate(widths, start=1):
+            worksheet.column_dimensions[get_column_letter(index)].width = width
+        
+        # Стиль заголовков
+        header_font = Font(bold=True, color='FFFFFF')
+        header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+        
+        header = []
+        for _, title in columns:
+            cell = WriteOnlyCell(worksheet, value=title)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = Alignment(horizontal='center')
+            header.append(cell)
+        worksheet.append(header)
 
     @classmethod
     def _clean_import_data(cls, df):
@@ -243,95 +644,164 @@ class ExcelService:
 
     @classmethod
     def _import_records(cls, df, update_existing=False):
-        """Импорт записей в базу данных."""
+        """
+        Импорт записей в базу данных пакетами.
+        
+        Поезда и существующие записи загружаются одним запросом на пакет,
+        новые записи вставляются через bulk_create, измененные - через bulk_update.
+        """
         created_count = 0
         updated_count = 0
         errors = []
+        # Самая ранняя исправленная дата по каждому поезду
+        changes = {}
         
-        with transaction.atomic():
-            for index, row in df.iterrows():
-                try:
-                    train_name = row.get('train_name')
-                    if not train_name:
-                        errors.append(f'Строка {index + 1}: отсутствует название поезда')
-                        continue
-                    
-                    try:
-                        train = Train.objects.get(name=train_name)
-                    except Train.DoesNotExist:
-                        errors.append(f'Строка {index + 1}: поезд "{train_name}" не найден')
-                        continue
-                    
-                    record_date = row.get('record_date')
-                    if pd.isna(record_date):
-                        errors.append(f'Строка {index + 1}: отсутствует дата записи')
-                        continue
-                    
-                    # Подготавливаем данные записи
-                    record_data = {'train': train, 'record_date': record_date}
-                    
-                    # Маппинг полей с типами
-                    field_mapping = {
-                        'total_mileage': int,
-                        'daily_mileage': int,
-                        'last_to_mileage': int,
-                        'last_to_date': None,  # уже обработано
-                        'last_to_type': str,
-                        'next_to_type': str,
-                        'last_block_date': None,  # уже обработано
-                        'last_kp_measure_date': None,  # уже обработано
-                        'inspection_counter': int,
-                        'to_l_mileage': int,
-                        'to_n_mileage': int,
-                        'is510_mileage': int,
-                        'is520_mileage': int,
-                        'is530_mileage': int,
-                        'manual_indicator_train': bool,
-                        'manual_indicator_next_to': bool
-                    }
-                    
-                    for field, type_converter in field_mapping.items():
-                        value = row.get(field)
-                        if pd.notna(value):
-                            if type_converter:
-                                value = type_converter(value)
-                            record_data[field] = value
-                    
-                    # Проверяем существование записи
-                    existing_record = TrainDailyRecord.objects.filter(
-                        train=train, record_date=record_date
-                    ).first()
-                    
-                    if existing_record:
-                        if update_existing:
-                            for field, value in record_data.items():
-                                if field not in ['train', 'record_date']:
-                                    setattr(existing_record, field, value)
-                            existing_record.save()
-                            updated_count += 1
-                        else:
-                            errors.append(
-                                f'Строка {index + 1}: запись для поезда "{train_name}" '
-                                f'на {record_date} уже существует'
-                            )
-                    else:
-                        TrainDailyRecord.objects.create(**record_data)
-                        created_count += 1
-                        
-                except (ValueError, TypeError) as e:
-                    errors.append(f'Строка {index + 1}: ошибка данных - {str(e)}')
+        rows = list(zip(df.index, df.to_dict('records')))
+        trains = cls._resolve_trains(row.get('train_name') for _, row in rows)
+        
+        # Подготавливаем данные записей
+        prepared = []
+        for index, row in rows:
+            try:
+                train_name = row.get('train_name')
+                if train_name is None or pd.isna(train_name) or not train_name:
+                    errors.append((index, f'Строка {index + 1}: отсутствует название поезда'))
+                    continue
+                
+                train = trains.get(str(train_name))
+                if train is None:
+                    errors.append((index, f'Строка {index + 1}: поезд "{train_name}" не найден'))
                     continue
-                except Exception as e:
-                    errors.append(f'Строка {index + 1}: ошибка импорта - {str(e)}')
+                
+                record_date = row.get('record_date')
+                if record_date is None or pd.isna(record_date):
+                    errors.append((index, f'Строка {index + 1}: отсутствует дата записи'))
                     continue
+                
+                record_data = {}
+                for field, type_converter in cls.IMPORT_FIELD_TYPES.items():
+                    value = row.get(field)
+                    if value is not None and pd.notna(value):
+                        if type_converter:
+                            value = type_converter(value)
+                        record_data[field] = value
+                
+                prepared.append((index, train, record_date, record_data))
+                
+            except (ValueError, TypeError) as e:
+                errors.append((index, f'Строка {index + 1}: ошибка данных - {str(e)}'))
+                continue
+            except Exception as e:
+                errors.append((index, f'Строка {index + 1}: ошибка импорта - {str(e)}'))
+                continue
+        
+        existing = cls._load_existing_records(
+            {train.id for _, train, _, _ in prepared},
+            [record_date for _, _, record_date, _ in prepared],
+            update_existing
+        )
+        
+        # Разделяем строки на вставки и обновления
+        to_create = {}
+        to_update = {}
+        update_fields = set()
+        for index, train, record_date, record_data in prepared:
+            key = (train.id, record_date)
+            record = to_create.get(key) or to_update.get(key)
+            if record is None and key not in existing:
+                to_create[key] = TrainDailyRecord(train=train, record_date=record_date, **record_data)
+                created_count += 1
+                continue
+            
+            if not update_existing:
+                errors.append((index, (
+                    f'Строка {index + 1}: запись для поезда "{train.name}" '
+                    f'на {record_date} уже существует'
+                )))
+                continue
+            
+            if record is None:
+                record = to_update[key] = existing[key]
+            
+            changed_fields = []
+            for field, value in record_data.items():
+                if getattr(record, field) != value:
+                    changed_fields.append(field)
+                setattr(record, field, value)
+            update_fields.update(record_data)
+            updated_count += 1
+            if key in to_update:
+                BulkCalculationService.track_change(changes, train.id, record_date, changed_fields)
+        
+        with transaction.atomic():
+            TrainDailyRecord.bulk_save_with_calculations(
+                to_create.values(), batch_size=cls.IMPORT_BATCH_SIZE
+            )
+            
+            if to_update:
+                now = timezone.now()
+                for record in to_update.values():
+                    record.apply_calculations(record.train.type)
+                    record.updated_at = now
+                TrainDailyRecord.objects.bulk_update(
+                    to_update.values(),
+                    sorted(update_fields) + cls.IMPORT_DERIVED_FIELDS,
+                    batch_size=cls.IMPORT_BATCH_SIZE
+                )
+                TrainCurrentState.refresh({record.train_id for record in to_update.values()})
+            
+            # Правки прошлых дней распространяются на последующие записи
+            BulkCalculationService.propagate_changes(changes)
         
         return {
             'created': created_count,
             'updated': updated_count,
-            'errors': errors,
+            'errors': [message for _, message in sorted(errors, key=lambda error: error[0])],
             'total_processed': len(df)
         }
 
+    @classmethod
+    def _resolve_trains(cls, train_names):
+        """Загрузка поездов по названиям: {name: Train}."""
+        names = sorted({
+            str(name) for name in train_names
+            if name is not None and not pd.isna(name) and name
+        })
+        trains = {}
+        for start in range(0, len(names), cls.IMPORT_BATCH_SIZE):
+            chunk = names[start:start + cls.IMPORT_BATCH_SIZE]
+            trains.update({train.name: train for train in Train.objects.filter(name__in=chunk)})
+        return trains
+
+    @classmethod
+    def _load_existing_records(cls, train_ids, record_dates, full=False):
+        """
+        Существующие записи для ключей (train_id, record_date) импорта.
+        
+        Returns:
+            Dict {(train_id, record_date): запись или None}
+        """
+        if not train_ids or not record_dates:
+            return {}
+        
+        train_ids = sorted(train_ids)
+        wanted_dates = set(record_dates)
+        existing = {}
+        for start in range(0, len(train_ids), cls.IMPORT_BATCH_SIZE):
+            queryset = TrainDailyRecord.objects.filter(
+                train_id__in=train_ids[start:start + cls.IMPORT_BATCH_SIZE],
+                record_date__range=(min(wanted_dates), max(wanted_dates))
+            )
+            if full:
+                for record in queryset.select_related('train'):
+                    if record.record_date in wanted_dates:
+                        existing[(record.train_id, record.record_date)] = record
+            else:
+                for key in queryset.values_list('train_id', 'record_date'):
+                    if key[1] in wanted_dates:
+                        existing[key] = None
+        return existing
+
     @classmethod
     def export_template(cls):
         """Экспорт шаблона Excel для импорта."""
@@ -0,0 +1,173 @@
+'''
+Сервис фоновых задач экспорта.
+Готовые файлы переиспользуются, пока выгружаемые записи не изменились.
+'''
+import hashlib
+import json
+import logging
+import tempfile
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .excel_service import ExcelService
+
+logger = logging.getLogger(__name__)
+
+
+class ExportJobService:
+    '''Постановка, выполнение и поиск готовых задач экспорта.'''
+    # Время, после которого незавершенная задача считается зависшей (секунды)
+    STALE_TIMEOUT = 3600
+
+    @classmethod
+    def stale_timeout(cls):
+        return timedelta(seconds=getattr(settings, 'EXPORT_JOB_STALE_TIMEOUT', cls.STALE_TIMEOUT))
+
+    @staticmethod
+    def normalize_filters(data):
+        '''
+        Приведение параметров экспорта к каноническому виду.
+
+        Порядок и повторы ID не влияют на результат; xls выгружается как xlsx.
+        '''
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        export_format = data.get('format') or 'xlsx'
+        return {
+            'train_ids': sorted(set(data.get('train_ids') or [])),
+            'depot_ids': sorted(set(data.get('depot_ids') or [])),
+            'start_date': start_date.isoformat() if start_date else None,
+            'end_date': end_date.isoformat() if end_date else None,
+            'include_calculations': bool(data.get('include_calculations', True)),
+            'format': 'xlsx' if export_format == 'xls' else export_format
+        }
+
+    @staticmethod
+    def filters_hash(filters):
+        '''SHA-256 нормализованных фильтров.'''
+        payload = json.dumps(filters, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def build_queryset(filters):
+        '''Записи, попадающие в экспорт.'''
+        from ..models import TrainDailyRecord
+
+        queryset = TrainDailyRecord.objects.all()
+        if filters.get('train_ids'):
+            queryset = queryset.filter(train_id__in=filters['train_ids'])
+        if filters.get('depot_ids'):
+            queryset = queryset.filter(train__depot_id__in=filters['depot_ids'])
+        if filters.get('start_date'):
+            queryset = queryset.filter(record_date__gte=date.fromisoformat(filters['start_date']))
+        if filters.get('end_date'):
+            queryset = queryset.filter(record_date__lte=date.fromisoformat(filters['end_date']))
+        return queryset.order_by('train__name', 'record_date')
+
+    @staticmethod
+    def data_fingerprint(queryset):
+        '''
+        Отпечаток выгружаемых данных: количество записей, последнее изменение
+        и хеш выгружаемых полей поездов (название, тип, депо).
+
+        Поля поездов хешируются по значениям, а не по updated_at: массовое
+        обновление через update() не меняет updated_at, а переименование
+        депо не трогает записи поездов.
+
+        Returns:
+            Tuple (отпечаток, количество записей)
+        '''
+        from ..models import Train
+
+        stats = queryset.order_by().aggregate(count=Count('id'), last_update=Max('updated_at'))
+        last_update = stats['last_update'].isoformat() if stats['last_update'] else ''
+        trains = Train.objects.filter(
+            id__in=queryset.order_by().values('train_id')
+        ).order_by('id').values_list('id', 'name', 'type', 'depot__name')
+        trains_hash = hashlib.sha256(
+            json.dumps(list(trains), ensure_ascii=False).encode('utf-8')
+        ).hexdigest()[:16]
+        return f"{stats['count']}:{last_update}:{trains_hash}", stats['count']
+
+    @classmethod
+    def request_export(cls, data):
+        '''
+        Поиск готового или выполняющегося экспорта либо постановка нового.
+
+        Args:
+            data: Проверенные данные ExcelExportSerializer
+
+        Returns:
+            ExportJob
+        '''
+        from ..models import ExportJob
+        from ..tasks import generate_export_job
+
+        filters = cls.normalize_filters(data)
+        filters_hash = cls.filters_hash(filters)
+        jobs = ExportJob.objects.filter(filters_hash=filters_hash)
+
+        # Зависшая задача не должна бесконечно подменять новые запросы
+        stale_count = ExportJob.fail_stale(jobs, cls.stale_timeout())
+        if stale_count:
+            logger.warning(f'Зависшие экспорты для фильтров {filters_hash[:12]} отмечены ошибкой: {stale_count}')
+
+        active_job = jobs.filter(status__in=ExportJob.ACTIVE_STATUSES).order_by('-created_at').first()
+        if active_job:
+            return active_job
+
+        fingerprint, _ = cls.data_fingerprint(cls.build_queryset(filters))
+        ready_job = jobs.filter(
+            status=ExportJob.STATUS_COMPLETED, data_fingerprint=fingerprint
+        ).order_by('-created_at').first()
+        if ready_job and ready_job.has_artifact:
+            logger.info(f'Экспорт {ready_job.id} переиспользован для фильтров {filters_hash[:12]}')
+            return ready_job
+
+        job = ExportJob.objects.create(
+            filters_hash=filters_hash,
+            filters=filters,
+            format=filters['format'],
+            include_calculations=filters['include_calculations']
+        )
+        transaction.on_commit(lambda: generate_export_job.delay(job.id))
+        return job
+
+    @classmethod
+    def run(cls, job):
+        '''Формирование файла экспорта и удаление устаревших файлов тех же фильтров.'''
+        queryset = cls.build_queryset(job.filters)
+        # Отпечаток снимается до выгрузки: изменения во время записи сделают файл устаревшим
+        fingerprint, rows_count = cls.data_fingerprint(queryset)
+
+        with tempfile.TemporaryFile() as target:
+            ExcelService.write_export(
+                queryset, target, include_calculations=job.include_calculations, format=job.format
+            )
+            target.seek(0)
+            job.file.save(f'vsm_export_{job.id}.{job.format}', File(target), save=False)
+
+        job.mark_completed(file=job.file, data_fingerprint=fingerprint, rows_count=rows_count)
+        cls.delete_stale_artifacts(job)
+
+    @staticmethod
+    def delete_stale_artifacts(job):
+        '''Удаление предыдущих завершенных экспортов с теми же фильтрами.'''
+        from ..models import ExportJob
+
+        stale_jobs = ExportJob.objects.filter(
+            filters_hash=job.filters_hash, status__in=[ExportJob.STATUS_COMPLETED, ExportJob.STATUS_FAILED]
+        ).exclude(id=job.id)
+        for stale_job in stale_jobs:
+            if stale_job.file:
+                stale_job.file.delete(save=False)
+            stale_job.delete()
+
+    @staticmethod
+    def download_filename(job):
+        '''Имя файла для скачивания.'''
+        return f'vsm_data_{job.created_at.date().isoformat()}.{job.format}'
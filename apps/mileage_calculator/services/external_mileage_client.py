@@ -0,0 +1,233 @@
+'''
+Клиент внешнего API пробега.
+Пул соединений requests.Session, ограниченная параллельность и общий бюджет повторов.
+Если API поддерживает пакетный метод, пробег запрашивается пачками, иначе по одному поезду.
+'''
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RetryBudget:
+    '''Общий для всей синхронизации лимит повторных запросов.'''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Списание одного повтора; False, если бюджет исчерпан.'''
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+
+class ExternalMileageClient:
+    '''Пакетное получение суточного пробега поездов из внешнего API.'''
+
+    # Таймауты соединения и чтения, секунды
+    TIMEOUT = (5, 30)
+    # Количество параллельных запросов (и размер пула соединений)
+    MAX_WORKERS = 8
+    # Повторов на всю синхронизацию
+    RETRY_BUDGET = 20
+    # Базовая задержка экспоненциального повтора, секунды
+    BACKOFF_FACTOR = 0.5
+    # Ответы, после которых запрос повторяется
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    # Пар (поезд, дата) в одном пакетном запросе
+    BATCH_SIZE = 200
+    # Ответы, означающие отсутствие пакетного метода
+    BATCH_UNSUPPORTED_STATUSES = {404, 405, 501}
+
+    def __init__(self, base_url=None, api_key=None, max_workers=None, retry_budget=None,
+                 timeout=None, backoff_factor=None, use_batch=None, batch_size=None):
+        self.base_url = (base_url or settings.EXTERNAL_API_URL).rstrip('/')
+        self.max_workers = max_workers or getattr(settings, 'EXTERNAL_API_MAX_WORKERS', self.MAX_WORKERS)
+        self.timeout = timeout or self.TIMEOUT
+        self.backoff_factor = self.BACKOFF_FACTOR if backoff_factor is None else backoff_factor
+        self.retry_budget = RetryBudget(
+            getattr(settings, 'EXTERNAL_API_RETRY_BUDGET', self.RETRY_BUDGET) if retry_budget is None else retry_budget
+        )
+        # Становится False после первого ответа, что пакетного метода нет
+        self.batch_supported = (
+            getattr(settings, 'EXTERNAL_API_BATCH_ENDPOINT', True) if use_batch is None else use_batch
+        )
+        self.batch_size = batch_size or getattr(settings, 'EXTERNAL_API_BATCH_SIZE', self.BATCH_SIZE)
+
+        # Один пул keep-alive соединений на хост, по соединению на поток
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key or settings.EXTERNAL_API_KEY}',
+            'Content-Type': 'application/json'
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _request(self, method, path, **kwargs):
+        '''
+        HTTP-запрос с повтором временных ошибок за счет общего бюджета.
+
+        Returns:
+            requests.Response с кодом, не требующим повтора
+
+        Raises:
+            requests.RequestException: ошибка после исчерпания бюджета повторов
+        '''
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+                if response.status_code not in self.RETRY_STATUSES:
+                    return response
+                error = requests.HTTPError(f'API error: {response.status_code}', response=response)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = exc
+
+            if not self.retry_budget.acquire():
+                raise error
+            delay = self.backoff_factor * (2 ** attempt)
+            logger.warning(f'Повтор запроса {path} через {delay:.1f} с: {error}')
+            time.sleep(delay)
+            attempt += 1
+
+    def fetch_mileage(self, train_name, depot_name, target_date):
+        '''
+        Пробег поезда за дату.
+
+        Returns:
+            Dict с данными API или None, если данных нет (404)
+
+        Raises:
+            requests.RequestException: ошибка после исчерпания повторов
+        '''
+        params = {
+            'train_id': train_name,
+            'date': target_date.isoformat(),
+            'depot': depot_name
+        }
+        response = self._request('GET', '/mileage', params=params)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_batch(self, items):
+        '''
+        Пробег для пачки пар (поезд, дата) одним запросом POST /mileage/batch.
+
+        Args:
+            items: Список кортежей (train, target_date)
+
+        Returns:
+            Dict {(train_id, target_date): результат} или None, если пакетный метод не поддерживается
+
+        Raises:
+            requests.RequestException: ошибка после исчерпания повторов
+        '''
+        payload = {
+            'items': [
+                {'train_id': train.name, 'date': target_date.isoformat(), 'depot': train.depot.name}
+                for train, target_date in items
+            ]
+        }
+        response = self._request('POST', '/mileage/batch', json=payload)
+        if response.status_code in self.BATCH_UNSUPPORTED_STATUSES:
+            return None
+        response.raise_for_status()
+
+        found = {(item.get('train_id'), item.get('date')): item for item in response.json().get('results', [])}
+        results = {}
+        for train, target_date in items:
+            data = found.get((train.name, target_date.isoformat()))
+            if data is None:
+                results[(train.id, target_date)] = {'status': 'not_found'}
+            elif data.get('error'):
+                results[(train.id, target_date)] = {'status': 'error', 'error': data['error']}
+            else:
+                results[(train.id, target_date)] = {'status': 'success', 'data': data}
+        return results
+
+    def _fetch_single(self, item):
+        train, target_date = item
+        try:
+            data = self.fetch_mileage(train.name, train.depot.name, target_date)
+        except requests.RequestException as exc:
+            logger.error(f'Ошибка запроса к API для поезда {train.name}: {exc}')
+            return (train.id, target_date), {'status': 'error', 'error': str(exc)}
+        if data is None:
+            return (train.id, target_date), {'status': 'not_found'}
+        return (train.id, target_date), {'status': 'success', 'data': data}
+
+    def _fetch_chunk(self, chunk):
+        '''Пачка через пакетный метод; None, если его нет и нужны одиночные запросы.'''
+        if not self.batch_supported:
+            return None
+        try:
+            results = self.fetch_batch(chunk)
+        except requests.RequestException as exc:
+            logger.error(f'Ошибка пакетного запроса к API ({len(chunk)} поездов): {exc}')
+            return {(train.id, target_date): {'status': 'error', 'error': str(exc)} for train, target_date in chunk}
+        if results is None:
+            logger.info('Пакетный метод API недоступен, используются одиночные запросы')
+            self.batch_supported = False
+        return results
+
+    def fetch_many(self, items):
+        '''
+        Пробег для множества пар (поезд, дата).
+
+        Пары отправляются пачками по batch_size параллельно; если API не
+        поддерживает пакетный метод, каждая пара запрашивается отдельно
+        через тот же пул соединений.
+
+        Args:
+            items: Список кортежей (train, target_date), поезда с загруженным depot
+
+        Returns:
+            Dict {(train_id, target_date): {'status': 'success'|'not_found'|'error', 'data'|'error': ...}}
+        '''
+        items = list(items)
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = items
+            if self.batch_supported:
+                chunks = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+                pending = []
+                for chunk, chunk_results in zip(chunks, executor.map(self._fetch_chunk, chunks)):
+                    if chunk_results is None:
+                        pending.extend(chunk)
+                    else:
+                        results.update(chunk_results)
+            results.update(executor.map(self._fetch_single, pending))
+        return results
+
+    def fetch_fleet(self, trains, target_date):
+        '''
+        Пробег списка поездов за одну дату.
+
+        Returns:
+            Dict {train_id: результат fetch_many}
+        '''
+        results = self.fetch_many((train, target_date) for train in trains)
+        return {train_id: result for (train_id, _), result in results.items()}
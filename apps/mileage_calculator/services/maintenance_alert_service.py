@@ -0,0 +1,107 @@
+'''
+Сервис уведомлений о предстоящем и просроченном ТО.
+Уровни уведомлений вычисляются в базе одним запросом и хранятся в кеше по датам.
+'''
+import logging
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, F, Q, Value, When
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceAlertService:
+    '''Формирование и хранение уведомлений о ТО.'''
+
+    # Дней с последнего ТО: предупреждение и критическое превышение
+    WARNING_DAYS = 45
+    CRITICAL_DAYS = 56
+    # Критический пробег с последнего ТО, км
+    CRITICAL_MILEAGE = 23000
+    # Срок хранения уведомлений за дату
+    CACHE_TIMEOUT = 7 * 24 * 3600
+
+    @staticmethod
+    def cache_key(current_date):
+        return f'maintenance_alerts:{current_date.isoformat()}'
+
+    @classmethod
+    def alert_rows(cls, current_date):
+        '''
+        Записи за дату, требующие уведомления, с уровнями из CASE-выражений.
+
+        Название депо присоединяется в том же запросе.
+        '''
+        from ..models import TrainDailyRecord
+
+        return TrainDailyRecord.objects.filter(record_date=current_date).annotate(
+            days_alert=Case(
+                When(days_since_to__gte=cls.CRITICAL_DAYS, then=Value('critical_days')),
+                When(days_since_to__gte=cls.WARNING_DAYS, then=Value('warning_days')),
+                default=None,
+                output_field=CharField()
+            ),
+            mileage_alert=Case(
+                When(mileage_since_to__gt=cls.CRITICAL_MILEAGE, then=Value('critical_mileage')),
+                default=None,
+                output_field=CharField()
+            ),
+            train_name=F('train__name'),
+            depot_name=F('train__depot__name')
+        ).filter(
+            Q(days_alert__isnull=False) | Q(mileage_alert__isnull=False)
+        ).order_by('train__name').values(
+            'train_name', 'depot_name', 'days_since_to', 'mileage_since_to', 'days_alert', 'mileage_alert'
+        )
+
+    @classmethod
+    def build_alerts(cls, current_date):
+        '''Список уведомлений за дату.'''
+        alerts = []
+        for row in cls.alert_rows(current_date):
+            days_since_to = row['days_since_to']
+            mileage_since_to = row['mileage_since_to']
+            if row['days_alert'] == 'critical_days':
+                alerts.append({
+                    'type': 'critical_days',
+                    'train': row['train_name'],
+                    'depot': row['depot_name'],
+                    'message': f'Критическое превышение дней с последнего ТО: {days_since_to} дней',
+                    'days_since_to': days_since_to,
+                    'priority': 'high'
+                })
+            elif row['days_alert'] == 'warning_days':
+                alerts.append({
+                    'type': 'warning_days',
+                    'train': row['train_name'],
+                    'depot': row['depot_name'],
+                    'message': f'Предупреждение: {days_since_to} дней с последнего ТО',
+                    'days_since_to': days_since_to,
+                    'priority': 'medium'
+                })
+
+            if row['mileage_alert'] == 'critical_mileage':
+                alerts.append({
+                    'type': 'critical_mileage',
+                    'train': row['train_name'],
+                    'depot': row['depot_name'],
+                    'message': f'Критический пробег с последнего ТО: {mileage_since_to:,} км',
+                    'mileage_since_to': mileage_since_to,
+                    'priority': 'high'
+                })
+        return alerts
+
+    @classmethod
+    def generate(cls, current_date):
+        '''Формирование уведомлений за дату и сохранение их под ключом даты.'''
+        alerts = cls.build_alerts(current_date)
+        cache.set(cls.cache_key(current_date), alerts, cls.CACHE_TIMEOUT)
+        return alerts
+
+    @classmethod
+    def get_alerts(cls, current_date):
+        '''Уведомления за дату: сохраненные или сформированные заново.'''
+        alerts = cache.get(cls.cache_key(current_date))
+        if alerts is None:
+            alerts = cls.generate(current_date)
+        return alerts
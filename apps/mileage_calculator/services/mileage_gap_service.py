@@ -0,0 +1,85 @@
+'''
+Сервис поиска пропущенных дней в истории пробега.
+'''
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Min
+
+
+class MileageGapService:
+    '''Поиск дней без записей у поездов с автоматическим вводом пробега.'''
+
+    @staticmethod
+    def find_missing_days(start_date, end_date, depot_id=None):
+        '''
+        Пары (поезд, дата) без записи за период.
+
+        Дни до первой записи поезда пропуском не считаются.
+
+        Returns:
+            Список кортежей (train_id, record_date), упорядоченный по поезду и дате
+        '''
+        if connection.vendor == 'postgresql':
+            return MileageGapService._missing_days_sql(start_date, end_date, depot_id)
+        return MileageGapService._missing_days_python(start_date, end_date, depot_id)
+
+    @staticmethod
+    def _missing_days_sql(start_date, end_date, depot_id):
+        '''Анти-соединение с generate_series одним запросом в PostgreSQL'''
+        from ..models import Train, TrainDailyRecord
+
+        train_table = Train._meta.db_table
+        record_table = TrainDailyRecord._meta.db_table
+        depot_filter = 'AND t.depot_id = %s' if depot_id else ''
+        sql = f'''
+            SELECT t.id, day::date
+            FROM {train_table} t
+            JOIN (
+                SELECT train_id, MIN(record_date) AS first_date
+                FROM {record_table}
+                GROUP BY train_id
+            ) first_records ON first_records.train_id = t.id
+            CROSS JOIN LATERAL generate_series(
+                GREATEST(%s::date, first_records.first_date), %s::date, interval '1 day'
+            ) AS day
+            WHERE t.is_active AND NOT t.is_manual_mileage {depot_filter}
+              AND NOT EXISTS (
+                  SELECT 1 FROM {record_table} r
+                  WHERE r.train_id = t.id AND r.record_date = day::date
+              )
+            ORDER BY t.id, day
+        '''
+        params = [start_date, end_date]
+        if depot_id:
+            params.append(depot_id)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(train_id, day) for train_id, day in cursor.fetchall()]
+
+    @staticmethod
+    def _missing_days_python(start_date, end_date, depot_id):
+        '''Разность календаря и существующих записей на Python (SQLite и другие СУБД)'''
+        from ..models import Train, TrainDailyRecord
+
+        trains = Train.objects.filter(
+            is_active=True, is_manual_mileage=False, daily_records__isnull=False
+        ).annotate(first_date=Min('daily_records__record_date'))
+        if depot_id:
+            trains = trains.filter(depot_id=depot_id)
+        first_dates = dict(trains.values_list('id', 'first_date'))
+
+        existing = set(
+            TrainDailyRecord.objects.filter(
+                train_id__in=list(first_dates), record_date__gte=start_date, record_date__lte=end_date
+            ).values_list('train_id', 'record_date')
+        )
+
+        missing = []
+        for train_id in sorted(first_dates):
+            day = max(start_date, first_dates[train_id])
+            while day <= end_date:
+                if (train_id, day) not in existing:
+                    missing.append((train_id, day))
+                day += timedelta(days=1)
+        return missing
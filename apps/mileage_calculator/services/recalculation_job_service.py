@@ -0,0 +1,126 @@
+'''
+Сервис фоновых задач пересчета.
+Повторный запрос той же области и периода присоединяется к выполняющейся задаче.
+'''
+import hashlib
+import json
+import logging
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .bulk_calculation_service import BulkCalculationService
+
+logger = logging.getLogger(__name__)
+
+
+class RecalculationJobService:
+    '''Постановка и выполнение задач пересчета с дедупликацией.'''
+
+    # Период пересчета по умолчанию
+    DEFAULT_PERIOD_DAYS = 30
+    # Время, после которого незавершенная задача считается зависшей (секунды)
+    STALE_TIMEOUT = 7200
+    # Попыток создать задачу при гонке с параллельными запросами
+    CREATE_ATTEMPTS = 3
+
+    @classmethod
+    def stale_timeout(cls):
+        return timedelta(seconds=getattr(settings, 'RECALCULATION_JOB_STALE_TIMEOUT', cls.STALE_TIMEOUT))
+
+    @staticmethod
+    def dedup_key(scope, train_ids, depot_id, start_date, end_date):
+        '''SHA-256 области и периода пересчета.'''
+        payload = json.dumps({
+            'scope': scope,
+            'train_ids': train_ids,
+            'depot_id': depot_id,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def request_recalculation(cls, train_ids=None, depot=None, start_date=None, end_date=None):
+        '''
+        Поиск выполняющегося пересчета той же области либо постановка нового.
+
+        Args:
+            train_ids: Список ID поездов (один ID - пересчет поезда)
+            depot: Депо для пересчета всех его поездов
+            start_date: Начало периода (по умолчанию - 30 дней назад)
+            end_date: Конец периода (по умолчанию - сегодня)
+
+        Returns:
+            Tuple (RecalculationJob, создана ли новая задача)
+        '''
+        from ..models import RecalculationJob
+        from ..tasks import run_recalculation_job
+
+        end_date = end_date or date.today()
+        start_date = start_date or end_date - timedelta(days=cls.DEFAULT_PERIOD_DAYS)
+        train_ids = sorted(set(train_ids or []))
+        if depot is not None:
+            scope = RecalculationJob.SCOPE_DEPOT
+        elif len(train_ids) == 1:
+            scope = RecalculationJob.SCOPE_TRAIN
+        else:
+            scope = RecalculationJob.SCOPE_FLEET
+        depot_id = depot.id if depot is not None else None
+        key = cls.dedup_key(scope, train_ids, depot_id, start_date, end_date)
+
+        # Задача упавшего воркера иначе навсегда заняла бы ключ дедупликации
+        stale_count = RecalculationJob.fail_stale(RecalculationJob.objects.filter(dedup_key=key), cls.stale_timeout())
+        if stale_count:
+            logger.warning(f'Зависшие пересчеты {key[:12]} отмечены ошибкой: {stale_count}')
+
+        active_jobs = RecalculationJob.objects.filter(dedup_key=key, status__in=RecalculationJob.ACTIVE_STATUSES)
+        for attempt in range(1, cls.CREATE_ATTEMPTS + 1):
+            job = active_jobs.first()
+            if job:
+                return job, False
+
+            try:
+                # Уникальный индекс по активным задачам защищает от параллельных запросов
+                with transaction.atomic():
+                    job = RecalculationJob.objects.create(
+                        scope=scope,
+                        dedup_key=key,
+                        depot=depot,
+                        train_ids=train_ids,
+                        start_date=start_date,
+                        end_date=end_date
+                    )
+            except IntegrityError:
+                # Параллельная задача могла завершиться до повторного чтения - пробуем снова
+                if attempt == cls.CREATE_ATTEMPTS:
+                    raise
+                continue
+
+            transaction.on_commit(lambda: run_recalculation_job.delay(job.id))
+            return job, True
+
+    @staticmethod
+    def run(job):
+        '''Пересчет области задачи и сохранение итогов.'''
+        from ..models import RecalculationJob, Train
+
+        if job.scope == RecalculationJob.SCOPE_TRAIN:
+            train = Train.objects.get(id=job.train_ids[0])
+            updated_count = BulkCalculationService.recalculate_train(train, job.start_date, job.end_date)
+            job.mark_completed(trains_count=1, updated_count=updated_count)
+            return
+
+        report = BulkCalculationService.recalculate_fleet(
+            job.start_date, job.end_date, depot_id=job.depot_id, train_ids=job.train_ids or None
+        )
+        failed = [result for result in report.values() if result['status'] == 'error']
+        fields = {
+            'trains_count': len(report),
+            'updated_count': sum(result['updated_count'] for result in report.values())
+        }
+        if failed:
+            job.mark_failed('; '.join(f'{r["train_name"]}: {r["error"]}' for r in failed), **fields)
+        else:
+            job.mark_completed(**fields)
@@ -1,165 +1,572 @@
-# Source Generated with Decompyle++
-# File: tasks.cpython-312.pyc (Python 3.12)
-
 '''
 Celery задачи для калькулятора пробега.
 '''
 from datetime import date, timedelta
-from typing import List, Dict, Any
+import bisect
 import logging
 import requests
 from django.conf import settings
 from django.core.cache import cache
 from django.db import transaction
-from celery import shared_task
-from celery.exceptions import MaxRetriesExceededError
-from .models import Train, TrainDailyRecord, Depot
+from django.db.models import OuterRef, Q, Subquery
+from celery import chord, group, shared_task
+from celery.result import allow_join_result
+from .models import Train, TrainDailyRecord, ImportJob, ExportJob, RecalculationJob
 from .services.calculation_service import MileageCalculationService
+from .services.bulk_calculation_service import BulkCalculationService
+from .services.excel_service import ExcelService
+from .services.export_job_service import ExportJobService
+from .services.external_mileage_client import ExternalMileageClient
+from .services.mileage_gap_service import MileageGapService
+from .services.maintenance_alert_service import MaintenanceAlertService
+from .services.recalculation_job_service import RecalculationJobService
+
 logger = logging.getLogger(__name__)
-recalculate_train_metrics = (lambda self = None, train_id = None, start_date = shared_task(bind = True, max_retries = 3), end_date = (None, None): train = Train.objects.get(id = train_id)if start_date:
-start_date = date.fromisoformat(start_date)else:
-start_date = date.today() - timedelta(days = 30)if end_date:
-end_date = date.fromisoformat(end_date)else:
-end_date = date.today()logger.info(f'''Начинаем пересчет метрик для поезда {train.name} с {start_date} по {end_date}''')updated_count = MileageCalculationService.bulk_calculate_for_train(train, start_date, end_date)logger.info(f'''Пересчет завершен для поезда {train.name}. Обновлено записей: {updated_count}'''){
-'train_id': train_id,
-'train_name': train.name,
-'updated_count': updated_count,
-'start_date': start_date.isoformat(),
-'end_date': end_date.isoformat() }# if None:  # Некорректное условиеif Train.DoesNotExist and Train.DoesNotExist:
-logger.error(f'''Поезд с ID {train_id} не найден''')if None and None:
-logger.error(f'''Ошибка при пересчете метрик для поезда {train_id}: {exc}''')if self.request.retries < self.max_retries:
-raise self.retry(countdown = 60 * (self.request.retries + 1))del excNoneNone = Nonedel excexcept Exception as e:
-        passexcept Exception as e:
-        pass)()
-bulk_recalculate_all_trains = (lambda self = None, depot_id = None: if depot_id:
-trains = Train.objects.filter(depot_id = depot_id, is_active = True)logger.info(f'''Начинаем массовый пересчет для депо {depot_id}''')else:
-trains = Train.objects.filter(is_active = True)logger.info('Начинаем массовый пересчет для всех поездов')results = []end_date = date.today()start_date = end_date - timedelta(days = 90)for train in trains:
-updated_count = MileageCalculationService.bulk_calculate_for_train(train, start_date, end_date)results.append({
-'train_id': train.id,
-'train_name': train.name,
-'updated_count': updated_count,
-'status': 'success' })logger.info(f'''Поезд {train.name}: обновлено {updated_count} записей''')# if None:  # Некорректное условиеtotal_updated = (lambda .0: # if None:  # Некорректное условиеfor r in .0:
-if r.get('updated_count', 0):
-passr.get('updated_count', 0)# if None:  # Некорректное условиеNoneif None:
-# if None:  # Некорректное условие)(results())
-    logger.info(f'''Массовый пересчет завершен. Всего обновлено записей: {total_updated}''')
+
+
+@shared_task(bind=True, max_retries=3)
+def recalculate_train_metrics(self, train_id, start_date=None, end_date=None):
+    '''Пересчет метрик поезда за период.'''
+    try:
+        train = Train.objects.get(id=train_id)
+
+        if start_date:
+            start_date = date.fromisoformat(start_date)
+        else:
+            start_date = date.today() - timedelta(days=30)
+
+        if end_date:
+            end_date = date.fromisoformat(end_date)
+        else:
+            end_date = date.today()
+
+        logger.info(f'Начинаем пересчет метрик для поезда {train.name} с {start_date} по {end_date}')
+
+        updated_count = MileageCalculationService.bulk_calculate_for_train(train, start_date, end_date)
+
+        logger.info(f'Пересчет завершен для поезда {train.name}. Обновлено записей: {updated_count}')
+
+        return {
+            'train_id': train_id,
+            'train_name': train.name,
+            'updated_count': updated_count,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        }
+
+    except Train.DoesNotExist:
+        logger.error(f'Поезд с ID {train_id} не найден')
+        return {'error': f'Поезд с ID {train_id} не найден'}
+
+    except Exception as exc:
+        logger.error(f'Ошибка при пересчете метрик для поезда {train_id}: {exc}')
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=60 * (self.request.retries + 1))
+        return {'error': str(exc)}
+
+
+def _fleet_recalculation_summary(results, depot_id):
+    '''Сводка массового пересчета по отчетам поездов.'''
+    for result in results:
+        if result['status'] == 'error':
+            logger.error(f'Ошибка при пересчете поезда {result["train_name"]}: {result["error"]}')
+
+    total_updated = sum(r.get('updated_count', 0) for r in results)
+    logger.info(f'Массовый пересчет завершен. Всего обновлено записей: {total_updated}')
+
     return {
         'depot_id': depot_id,
-        'total_trains': len(trains),
+        'total_trains': len(results),
         'total_updated': total_updated,
-        'results': results }
-    if sum:
-        pass
+        'results': results
+    }
+
+
+@shared_task(bind=True, max_retries=2)
+def bulk_recalculate_all_trains(self, depot_id=None, partitions=None):
+    '''
+    Массовый пересчет метрик всех активных поездов за 90 дней.
+
+    Парк делится на части с близким числом записей, части пересчитываются
+    параллельно группой задач, а отчеты собираются колбэком chord.
+    '''
+    end_date = date.today()
+    start_date = end_date - timedelta(days=90)
+    partitions = partitions or getattr(settings, 'FLEET_RECALC_PARTITIONS', 4)
+
     try:
-        exc = sum
-        logger.error(f'''Ошибка при пересчете поезда {train.name}: {exc}''')
-        results.append({
-            'train_id': train.id,
-            'train_name': train.name,
-            'status': 'error',
-            'error': str(exc) })
-        exc = None
-        del exc
-        continue
-        exc = None
-        del exc
-        except Exception as e:
-        pass
-    if None and None and None:
-        pass
+        if depot_id:
+            logger.info(f'Начинаем массовый пересчет для депо {depot_id}')
+        else:
+            logger.info('Начинаем массовый пересчет для всех поездов')
+
+        parts = BulkCalculationService.partition_fleet(start_date, end_date, partitions, depot_id=depot_id)
+        if len(parts) <= 1:
+            report = BulkCalculationService.recalculate_fleet(start_date, end_date, depot_id=depot_id)
+            return _fleet_recalculation_summary(list(report.values()), depot_id)
+
+    except Exception as exc:
+        logger.error(f'Ошибка при массовом пересчете: {exc}')
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=300)
+        return {'error': str(exc)}
+
+    logger.info(f'Массовый пересчет разбит на {len(parts)} частей')
+    header = group(
+        recalculate_fleet_partition.s(train_ids, start_date.isoformat(), end_date.isoformat())
+        for train_ids in parts
+    )
+    # Результат задачи заменяется результатом колбэка chord;
+    # в eager-режиме chord выполняется синхронно и ожидает результаты группы
+    with allow_join_result():
+        return self.replace(chord(header, aggregate_fleet_recalculation.s(depot_id)))
+
+
+@shared_task(bind=True, max_retries=2)
+def recalculate_fleet_partition(self, train_ids, start_date, end_date):
+    '''Пересчет части парка для bulk_recalculate_all_trains.'''
     try:
-        exc = None
-        logger.error(f'''Ошибка при массовом пересчете: {exc}''')
+        report = BulkCalculationService.recalculate_fleet(
+            date.fromisoformat(start_date), date.fromisoformat(end_date), train_ids=train_ids
+        )
+        return list(report.values())
+    except Exception as exc:
+        logger.error(f'Ошибка при пересчете части парка ({len(train_ids)} поездов): {exc}')
         if self.request.retries < self.max_retries:
-            raise self.retry(countdown = 300)
-        del exc
-        return None
-    None = None
-    del exc
-    except Exception as e:
-        pass
-    except Exception as e:
-        pass
-)()
-fetch_mileage_from_external_api = (lambda self = None, train_id = None, target_date = shared_task(bind = True, max_retries = 5): train = Train.objects.get(id = train_id)if train.is_manual_mileage:
-{
-'message': f'''Поезд {train.name} использует ручной ввод пробега''' }if None:
-target_date = date.fromisoformat(target_date)else:
-target_date = date.today()existing_record = TrainDailyRecord.objects.filter(train = train, record_date = target_date).first()if existing_record:
-logger.info(f'''Запись для поезда {train.name} на {target_date} уже существует'''){
-'message': f'''Запись уже существует для {train.name} на {target_date}''' }api_url = None.EXTERNAL_API_URLapi_key = settings.EXTERNAL_API_KEYheaders = {
-'Authorization': f'''Bearer {api_key}''',
-'Content-Type': 'application/json' }params = {
-'train_id': train.name,
-'date': target_date.isoformat(),
-'depot': train.depot.name }logger.info(f'''Запрос к API для поезда {train.name} на {target_date}''')response = requests.get(f'''{api_url}/mileage''', headers = headers, params = params, timeout = 30)if response.status_code == 200:
-data = response.json()previous_record = TrainDailyRecord.objects.filter(train = train, record_date__lt = target_date).order_by('-record_date').first()daily_mileage = data.get('daily_mileage', 0)total_mileage = data.get('total_mileage')if total_mileage and previous_record:
-total_mileage = previous_record.total_mileage + daily_mileageelif not total_mileage:
-total_mileage = daily_mileagerecord = TrainDailyRecord.objects.create(train = train, record_date = target_date, total_mileage = total_mileage, daily_mileage = daily_mileage, last_to_mileage = previous_record.last_to_mileage if previous_record else None, last_to_date = previous_record.last_to_date if previous_record else None, last_to_type = previous_record.last_to_type if previous_record else None, next_to_type = previous_record.next_to_type if previous_record else None, last_block_date = previous_record.last_block_date if previous_record else None, last_kp_measure_date = previous_record.last_kp_measure_date if previous_record else None)MileageCalculationService.calculate_all_metrics(record, force_recalculate = True)logger.info(f'''Создана запись для поезда {train.name} на {target_date}: суточный пробег {daily_mileage} км, общий пробег {total_mileage} км'''){
-'train_id': train_id,
-'train_name': train.name,
-'date': target_date.isoformat(),
-'daily_mileage': daily_mileage,
-'total_mileage': total_mileage,
-'status': 'success' }if None.status_code == 404:
-logger.warning(f'''Данные для поезда {train.name} на {target_date} не найдены в API'''){
-'message': f'''Данные не найдены для {train.name} на {target_date}''' }None.error(f'''Ошибка API: {response.status_code} - {response.text}''')raise Exception(f'''API error: {response.status_code}''')# if None:  # Некорректное условиеif Train.DoesNotExist and Train.DoesNotExist:
-logger.error(f'''Поезд с ID {train_id} не найден''')if None.RequestException and None.RequestException:
-logger.error(f'''Ошибка запроса к API для поезда {train_id}: {exc}''')if self.request.retries < self.max_retries:
-2 ** self.request.retries * 60 = Noneraise self.retry(countdown = countdown)del excNoneNone = Nonedel exc# if None:  # Некорректное условиеtry:
-exc = Nonelogger.error(f'''Неожиданная ошибка при получении данных для поезда {train_id}: {exc}''')del excNoneNone = Nonedel excexcept Exception as e:
-        passexcept Exception as e:
-        pass)()
-daily_mileage_sync = (lambda : logger.info('Начинаем ежедневную синхронизацию пробега')trains = Train.objects.filter(is_manual_mileage = False, is_active = True)target_date = date.today()results = []for train in trains:
-task_result = fetch_mileage_from_external_api.delay(train.id, target_date.isoformat())results.append({
-'train_id': train.id,
-'train_name': train.name,
-'task_id': task_result.id,
-'status': 'queued' })# if None:  # Некорректное условиеlogger.info(f'''Запущена синхронизация для {len(trains)} поездов на {target_date}'''){
-'date': target_date.isoformat(),
-'total_trains': len(trains),
-'results': results }# if None:  # Некорректное условиеtry:
-exc = Nonelogger.error(f'''Ошибка при запуске задачи для поезда {train.name}: {exc}''')results.append({
-'train_id': train.id,
-'train_name': train.name,
-'status': 'error',
-'error': str(exc) })exc = Nonedel exccontinueexc = Nonedel excexcept Exception as e:
-        passexcept Exception as e:
-        pass)()
-cleanup_old_cache = (lambda : logger.info('Начинаем очистку старого кеша')cache.clear()logger.info('Кеш очищен успешно'){
-'status': 'success',
-'message': 'Кеш очищен' }# if None:  # Некорректное условиеtry:
-exc = Nonelogger.error(f'''Ошибка при очистке кеша: {exc}''')del excNoneNone = Nonedel excexcept Exception as e:
-        passexcept Exception as e:
-        pass)()
-generate_maintenance_alerts = (lambda : logger.info('Начинаем генерацию уведомлений о ТО')alerts = []current_date = date.today()critical_records = TrainDailyRecord.objects.filter(record_date = current_date).select_related('train')for record in critical_records:
-days_since_to = record.days_since_tomileage_since_to = record.mileage_since_toif days_since_to and days_since_to >= 56:
-alerts.append({
-'type': 'critical_days',
-'train': record.train.name,
-'depot': record.train.depot.name,
-'message': f'''Критическое превышение дней с последнего ТО: {days_since_to} дней''',
-'days_since_to': days_since_to,
-'priority': 'high' })elif days_since_to:
-# Некорректное сравнение, требует восстановления
-passelse:
-alerts.append({
-'type': 'warning_days',
-'train': record.train.name,
-'depot': record.train.depot.name,
-'message': f'''Предупреждение: {days_since_to} дней с последнего ТО''',
-'days_since_to': days_since_to,
-'priority': 'medium' })if not mileage_since_to:
-continueif not mileage_since_to > 23000:
-continuealerts.append({
-'type': 'critical_mileage',
-'train': record.train.name,
-'depot': record.train.depot.name,
-'message': f'''Критический пробег с последнего ТО: {mileage_since_to:,} км''',
-'mileage_since_to': mileage_since_to,
-'priority': 'high' })# if None:  # Некорректное условиеif alerts:
-cache.set('maintenance_alerts', alerts, 3600)logger.info(f'''Сгенерировано {len(alerts)} уведомлений о ТО''')else:
-logger.info('Критических уведомлений не найдено')# if 10:  # Некорректное условие{
-'date': alerts,
-'total_alerts': None,
-'alerts': 10 })()
+            raise self.retry(countdown=300)
+        return [
+            {'train_id': train_id, 'train_name': str(train_id), 'updated_count': 0,
+             'records_count': 0, 'status': 'error', 'error': str(exc)}
+            for train_id in train_ids
+        ]
+
+
+@shared_task
+def aggregate_fleet_recalculation(partition_results, depot_id=None):
+    '''Колбэк chord: объединение отчетов частей в ответ bulk_recalculate_all_trains.'''
+    results = sorted(
+        (result for part in partition_results for result in part),
+        key=lambda result: result['train_name']
+    )
+    return _fleet_recalculation_summary(results, depot_id)
+
+
+def _record_from_api(train, target_date, data, previous_record):
+    '''Несохраненная запись по ответу API с переносом данных ТО из предыдущей записи.'''
+    daily_mileage = data.get('daily_mileage', 0)
+    total_mileage = data.get('total_mileage')
+
+    if not total_mileage and previous_record:
+        total_mileage = previous_record.total_mileage + daily_mileage
+    elif not total_mileage:
+        total_mileage = daily_mileage
+
+    return TrainDailyRecord(
+        train=train,
+        record_date=target_date,
+        total_mileage=total_mileage,
+        daily_mileage=daily_mileage,
+        last_to_mileage=previous_record.last_to_mileage if previous_record else None,
+        last_to_date=previous_record.last_to_date if previous_record else None,
+        last_to_type=previous_record.last_to_type if previous_record else None,
+        next_to_type=previous_record.next_to_type if previous_record else None,
+        last_block_date=previous_record.last_block_date if previous_record else None,
+        last_kp_measure_date=previous_record.last_kp_measure_date if previous_record else None
+    )
+
+
+@shared_task(bind=True, max_retries=5)
+def fetch_mileage_from_external_api(self, train_id, target_date=None):
+    '''Получение суточного пробега поезда из внешнего API.'''
+    try:
+        train = Train.objects.select_related('depot').get(id=train_id)
+
+        if train.is_manual_mileage:
+            return {'message': f'Поезд {train.name} использует ручной ввод пробега'}
+
+        if target_date:
+            target_date = date.fromisoformat(target_date)
+        else:
+            target_date = date.today()
+
+        existing_record = TrainDailyRecord.objects.filter(train=train, record_date=target_date).first()
+        if existing_record:
+            logger.info(f'Запись для поезда {train.name} на {target_date} уже существует')
+            return {'message': f'Запись уже существует для {train.name} на {target_date}'}
+
+        api_url = settings.EXTERNAL_API_URL
+        api_key = settings.EXTERNAL_API_KEY
+        headers = {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        }
+        params = {
+            'train_id': train.name,
+            'date': target_date.isoformat(),
+            'depot': train.depot.name
+        }
+
+        logger.info(f'Запрос к API для поезда {train.name} на {target_date}')
+        response = requests.get(f'{api_url}/mileage', headers=headers, params=params, timeout=30)
+
+        if response.status_code == 200:
+            data = response.json()
+
+            previous_record = TrainDailyRecord.objects.filter(
+                train=train, record_date__lt=target_date
+            ).order_by('-record_date').first()
+
+            record = _record_from_api(train, target_date, data, previous_record)
+            record.save()
+            daily_mileage = record.daily_mileage
+            total_mileage = record.total_mileage
+
+            BulkCalculationService.recalculate_train(train, target_date, target_date)
+
+            logger.info(
+                f'Создана запись для поезда {train.name} на {target_date}: '
+                f'суточный пробег {daily_mileage} км, общий пробег {total_mileage} км'
+            )
+
+            return {
+                'train_id': train_id,
+                'train_name': train.name,
+                'date': target_date.isoformat(),
+                'daily_mileage': daily_mileage,
+                'total_mileage': total_mileage,
+                'status': 'success'
+            }
+
+        if response.status_code == 404:
+            logger.warning(f'Данные для поезда {train.name} на {target_date} не найдены в API')
+            return {'message': f'Данные не найдены для {train.name} на {target_date}'}
+
+        logger.error(f'Ошибка API: {response.status_code} - {response.text}')
+        raise Exception(f'API error: {response.status_code}')
+
+    except Train.DoesNotExist:
+        logger.error(f'Поезд с ID {train_id} не найден')
+        return {'error': f'Поезд с ID {train_id} не найден'}
+
+    except requests.RequestException as exc:
+        logger.error(f'Ошибка запроса к API для поезда {train_id}: {exc}')
+        if self.request.retries < self.max_retries:
+            countdown = 2 ** self.request.retries * 60
+            raise self.retry(countdown=countdown)
+        return {'error': str(exc)}
+
+    except Exception as exc:
+        logger.error(f'Неожиданная ошибка при получении данных для поезда {train_id}: {exc}')
+        return {'error': str(exc)}
+
+
+@shared_task
+def daily_mileage_sync():
+    '''Ежедневная синхронизация пробега для поездов с автоматическим вводом.'''
+    logger.info('Начинаем ежедневную синхронизацию пробега')
+
+    if getattr(settings, 'EXTERNAL_API_BATCH_SYNC', True):
+        return sync_fleet_mileage()
+
+    trains = Train.objects.filter(is_manual_mileage=False, is_active=True)
+    target_date = date.today()
+    results = []
+
+    for train in trains:
+        try:
+            task_result = fetch_mileage_from_external_api.delay(train.id, target_date.isoformat())
+            results.append({
+                'train_id': train.id,
+                'train_name': train.name,
+                'task_id': task_result.id,
+                'status': 'queued'
+            })
+        except Exception as exc:
+            logger.error(f'Ошибка при запуске задачи для поезда {train.name}: {exc}')
+            results.append({
+                'train_id': train.id,
+                'train_name': train.name,
+                'status': 'error',
+                'error': str(exc)
+            })
+
+    logger.info(f'Запущена синхронизация для {len(trains)} поездов на {target_date}')
+
+    return {
+        'date': target_date.isoformat(),
+        'total_trains': len(trains),
+        'results': results
+    }
+
+
+@shared_task
+def sync_fleet_mileage(target_date=None, depot_id=None):
+    '''
+    Пакетная синхронизация пробега всего парка за дату.
+
+    Запросы к API выполняются параллельно через общий пул соединений,
+    а все обращения к базе остаются в текущем потоке: поезда без записи,
+    предыдущие записи и вставка читаются и пишутся по одному запросу.
+    '''
+    target_date = date.fromisoformat(target_date) if target_date else date.today()
+
+    trains = Train.objects.filter(is_manual_mileage=False, is_active=True).select_related('depot')
+    if depot_id:
+        trains = trains.filter(depot_id=depot_id)
+    trains = list(trains.exclude(daily_records__record_date=target_date))
+
+    if not trains:
+        logger.info(f'Все поезда уже имеют записи на {target_date}')
+        return {'date': target_date.isoformat(), 'total_trains': 0, 'created': 0, 'results': []}
+
+    train_ids = [train.id for train in trains]
+    previous_date = TrainDailyRecord.objects.filter(
+        train_id=OuterRef('train_id'), record_date__lt=target_date
+    ).order_by('-record_date').values('record_date')[:1]
+    previous_records = {
+        record.train_id: record
+        for record in TrainDailyRecord.objects.filter(
+            train_id__in=train_ids, record_date=Subquery(previous_date)
+        )
+    }
+
+    with ExternalMileageClient() as client:
+        responses = client.fetch_fleet(trains, target_date)
+
+    records = []
+    results = []
+    for train in trains:
+        response = responses[train.id]
+        result = {'train_id': train.id, 'train_name': train.name, 'status': response['status']}
+        if response['status'] == 'success':
+            record = _record_from_api(train, target_date, response['data'], previous_records.get(train.id))
+            records.append(record)
+            result.update(daily_mileage=record.daily_mileage, total_mileage=record.total_mileage)
+        elif response['status'] == 'error':
+            result['error'] = response['error']
+        results.append(result)
+
+    with transaction.atomic():
+        TrainDailyRecord.bulk_save_with_calculations(records)
+        if records:
+            # Средний пробег и плановая дата ТО зависят от истории поезда
+            BulkCalculationService.recalculate_fleet(
+                target_date, target_date, train_ids=[record.train_id for record in records]
+            )
+
+    logger.info(
+        f'Синхронизация пробега на {target_date}: запрошено {len(trains)} поездов, '
+        f'создано {len(records)} записей'
+    )
+
+    return {
+        'date': target_date.isoformat(),
+        'total_trains': len(trains),
+        'created': len(records),
+        'results': results
+    }
+
+
+@shared_task
+def backfill_mileage_gaps(start_date=None, end_date=None, depot_id=None, days=30):
+    '''
+    Дозагрузка пропущенных дней пробега из внешнего API.
+
+    Пропуски находятся одним запросом, запрашиваются пакетно, вставляются
+    в порядке дат каждого поезда, после чего история каждого затронутого
+    поезда пересчитывается один раз от первого заполненного дня.
+    '''
+    end_date = date.fromisoformat(end_date) if end_date else date.today()
+    start_date = date.fromisoformat(start_date) if start_date else end_date - timedelta(days=days)
+
+    missing = MileageGapService.find_missing_days(start_date, end_date, depot_id)
+    if not missing:
+        logger.info(f'Пропусков пробега за {start_date} - {end_date} нет')
+        return {
+            'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(),
+            'missing': 0, 'created': 0, 'failed': 0, 'trains': {}
+        }
+
+    trains = Train.objects.select_related('depot').in_bulk({train_id for train_id, _ in missing})
+    with ExternalMileageClient() as client:
+        responses = client.fetch_many((trains[train_id], day) for train_id, day in missing)
+
+    # Последняя запись до периода и записи периода: опора для переноса пробега и данных ТО
+    previous_date = TrainDailyRecord.objects.filter(
+        train_id=OuterRef('train_id'), record_date__lt=start_date
+    ).order_by('-record_date').values('record_date')[:1]
+    history = {}
+    for record in TrainDailyRecord.objects.filter(train_id__in=list(trains)).filter(
+        Q(record_date=Subquery(previous_date)) | Q(record_date__gte=start_date, record_date__lte=end_date)
+    ).order_by('record_date'):
+        history.setdefault(record.train_id, []).append(record)
+
+    records = []
+    changes = {}
+    failed = 0
+    for train_id, day in missing:
+        response = responses[(train_id, day)]
+        if response['status'] != 'success':
+            failed += 1
+            continue
+        train_history = history.setdefault(train_id, [])
+        previous_record = None
+        for record in train_history:
+            if record.record_date >= day:
+                break
+            previous_record = record
+        record = _record_from_api(trains[train_id], day, response['data'], previous_record)
+        bisect.insort(train_history, record, key=lambda item: item.record_date)
+        records.append(record)
+        changes.setdefault(train_id, (day, True))
+
+    with transaction.atomic():
+        TrainDailyRecord.bulk_save_with_calculations(records)
+        report = BulkCalculationService.propagate_changes(changes)
+
+    logger.info(
+        f'Дозагрузка пробега за {start_date} - {end_date}: пропусков {len(missing)}, '
+        f'создано {len(records)}, без данных {failed}'
+    )
+
+    return {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'missing': len(missing),
+        'created': len(records),
+        'failed': failed,
+        'trains': report
+    }
+
+
+@shared_task
+def cleanup_old_cache():
+    '''Очистка кеша расчетов.'''
+    try:
+        logger.info('Начинаем очистку старого кеша')
+        cache.clear()
+        logger.info('Кеш очищен успешно')
+        return {
+            'status': 'success',
+            'message': 'Кеш очищен'
+        }
+    except Exception as exc:
+        logger.error(f'Ошибка при очистке кеша: {exc}')
+        return {'error': str(exc)}
+
+
+@shared_task
+def generate_maintenance_alerts():
+    '''Генерация уведомлений о предстоящем и просроченном ТО.'''
+    logger.info('Начинаем генерацию уведомлений о ТО')
+
+    current_date = date.today()
+    alerts = MaintenanceAlertService.generate(current_date)
+
+    if alerts:
+        logger.info(f'Сгенерировано {len(alerts)} уведомлений о ТО')
+    else:
+        logger.info('Критических уведомлений не найдено')
+
+    return {
+        'date': current_date.isoformat(),
+        'total_alerts': len(alerts),
+        'alerts': alerts[:10]
+    }
+
+
+@shared_task(bind=True)
+def process_import_job(self, job_id):
+    '''Фоновый импорт файла пакетами с публикацией прогресса.'''
+    try:
+        job = ImportJob.objects.get(id=job_id)
+    except ImportJob.DoesNotExist:
+        logger.error(f'Задача импорта {job_id} не найдена')
+        return {'error': f'Задача импорта {job_id} не найдена'}
+
+    job.mark_running(self.request.id)
+    logger.info(f'Начинаем импорт {job.file.name} (задача {job_id})')
+
+    try:
+        with job.file.open('rb') as file:
+            chunks = ExcelService.iter_import_chunks(
+                file,
+                format=job.format,
+                sheet_name=job.sheet_name,
+                skip_rows=job.skip_rows
+            )
+            if job.partial_commit:
+                # Каждый пакет фиксируется в своей транзакции внутри import_dataframe
+                _import_job_chunks(job, chunks)
+            else:
+                with transaction.atomic():
+                    _import_job_chunks(job, chunks)
+
+    except Exception as exc:
+        logger.error(f'Ошибка импорта (задача {job_id}): {exc}')
+        if not job.partial_commit:
+            # Транзакция откачена - ничего не создано и не обновлено
+            job.created_count = 0
+            job.updated_count = 0
+        job.mark_failed(str(exc), **job.get_progress(), errors=job.errors)
+        return {'job_id': job_id, 'status': job.status, 'error': str(exc)}
+
+    job.mark_completed(**job.get_progress(), errors=job.errors)
+    logger.info(
+        f'Импорт завершен (задача {job_id}): создано {job.created_count}, '
+        f'обновлено {job.updated_count}, ошибок {job.errors_count}'
+    )
+    return {'job_id': job_id, 'status': job.status, **job.get_progress()}
+
+
+def _import_job_chunks(job, chunks):
+    '''Импорт пакетов строк с обновлением счетчиков задачи.'''
+    for df in chunks:
+        results = ExcelService.import_dataframe(df, job.update_existing)
+        job.add_chunk_results(len(df), results)
+
+
+@shared_task(bind=True)
+def generate_export_job(self, job_id):
+    '''Фоновое формирование файла экспорта.'''
+    try:
+        job = ExportJob.objects.get(id=job_id)
+    except ExportJob.DoesNotExist:
+        logger.error(f'Задача экспорта {job_id} не найдена')
+        return {'error': f'Задача экспорта {job_id} не найдена'}
+
+    job.mark_running(self.request.id)
+    logger.info(f'Начинаем экспорт (задача {job_id}, формат {job.format})')
+
+    try:
+        ExportJobService.run(job)
+    except Exception as exc:
+        logger.error(f'Ошибка экспорта (задача {job_id}): {exc}')
+        job.mark_failed(str(exc))
+        return {'job_id': job_id, 'status': job.status, 'error': str(exc)}
+
+    logger.info(f'Экспорт завершен (задача {job_id}): выгружено {job.rows_count} строк')
+    return {'job_id': job_id, 'status': job.status, 'rows_count': job.rows_count}
+
+
+@shared_task(bind=True)
+def run_recalculation_job(self, job_id):
+    '''Фоновый пересчет по задаче RecalculationJob.'''
+    try:
+        job = RecalculationJob.objects.get(id=job_id)
+    except RecalculationJob.DoesNotExist:
+        logger.error(f'Задача пересчета {job_id} не найдена')
+        return {'error': f'Задача пересчета {job_id} не найдена'}
+
+    job.mark_running(self.request.id)
+    logger.info(f'Начинаем пересчет (задача {job_id}, {job.scope}, {job.start_date} - {job.end_date})')
+
+    try:
+        RecalculationJobService.run(job)
+    except Exception as exc:
+        logger.error(f'Ошибка пересчета (задача {job_id}): {exc}')
+        job.mark_failed(str(exc))
+        return {'job_id': job_id, 'status': job.status, 'error': str(exc)}
+
+    logger.info(f'Пересчет завершен (задача {job_id}): обновлено {job.updated_count} записей')
+    return {'job_id': job_id, 'status': job.status, 'updated_count': job.updated_count}
@@ -7,10 +7,14 @@ URL маршруты для API калькулятора пробега.
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views_simple import DepotViewSet, TrainViewSet, TrainDailyRecordViewSet, health_check
+from .views import ImportJobViewSet, ExportJobViewSet, RecalculationJobViewSet
 app_name = 'mileage_calculator'
 router = DefaultRouter()
 router.register('depots', DepotViewSet, basename = 'depot')
 router.register('trains', TrainViewSet, basename = 'train')
+router.register('records/import_jobs', ImportJobViewSet, basename = 'import-job')
+router.register('records/export_jobs', ExportJobViewSet, basename = 'export-job')
+router.register('records/recalculation_jobs', RecalculationJobViewSet, basename = 'recalculation-job')
 router.register('records', TrainDailyRecordViewSet, basename = 'record')
 urlpatterns = [
     path('api/v1/health/', health_check, name = 'health-check'),
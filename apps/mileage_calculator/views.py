@@ -5,9 +5,10 @@
 API Views для калькулятора пробега.
 '''
 from datetime import date, timedelta
-from django.db.models import Q, Prefetch
-from django.http import HttpResponse
-from rest_framework import viewsets, status, filters
+from django.db import transaction
+from django.db.models import Q, Prefetch, Count
+from django.http import HttpResponse, FileResponse
+from rest_framework import viewsets, mixins, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -15,15 +16,19 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
-from .models import Depot, Train, TrainDailyRecord
-from .serializers import DepotSerializer, TrainSerializer, TrainDailyRecordSerializer, TrainDailyRecordDetailSerializer, TrainDailyRecordCreateSerializer, BulkRecalculateSerializer, DepotStatisticsSerializer, MaintenancePredictionSerializer, ExcelImportSerializer, ExcelExportSerializer, TrainAnalyticsSerializer
+from .models import Depot, Train, TrainDailyRecord, ImportJob, ExportJob, RecalculationJob
+from .pagination import RecordPagination
+from .serializers import DepotSerializer, TrainSerializer, TrainDailyRecordSerializer, TrainDailyRecordDetailSerializer, TrainDailyRecordCreateSerializer, BulkRecalculateSerializer, DepotStatisticsSerializer, MaintenancePredictionSerializer, ExcelExportSerializer, TrainAnalyticsSerializer, ImportJobSerializer, ExportJobSerializer, RecalculationJobSerializer
 from .services.calculation_service import MileageCalculationService
 from .services.analytics_service import AnalyticsService
 from .services.excel_service import ExcelService
+from .services.export_job_service import ExportJobService
+from .services.recalculation_job_service import RecalculationJobService
 
 class DepotViewSet(viewsets.ModelViewSet):
     '''ViewSet для управления депо.'''
-    queryset = Depot.objects.all()
+    # Счетчики поездов - условными агрегатами в запросе списка/депо
+    queryset = Depot.with_train_counts()
     serializer_class = DepotSerializer
     permission_classes = [
         IsAuthenticated]
@@ -54,17 +59,21 @@ class DepotViewSet(viewsets.ModelViewSet):
         depot = self.get_object()
         serializer = BulkRecalculateSerializer(data=request.data)
         if serializer.is_valid():
-            # Здесь можно запустить Celery задачу для пересчета
-            return Response({
-                'message': f'Пересчет запущен для депо {depot.name}',
-                'depot_id': depot.id
-            }, status=status.HTTP_202_ACCEPTED)
+            job, created = RecalculationJobService.request_recalculation(
+                depot=depot,
+                start_date=serializer.validated_data.get('start_date'),
+                end_date=serializer.validated_data.get('end_date')
+            )
+            return recalculation_job_response(
+                job, created, f'Пересчет запущен для депо {depot.name}', depot_id=depot.id
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class TrainViewSet(viewsets.ModelViewSet):
     '''ViewSet для управления поездами.'''
-    queryset = Train.objects.select_related('depot').all()
+    # Число записей - аннотацией, последняя запись - из текущего состояния поезда
+    queryset = Train.objects.select_related('depot', 'current_state').annotate(records_count=Count('daily_records'))
     serializer_class = TrainSerializer
     permission_classes = [
         IsAuthenticated]
@@ -135,26 +144,23 @@ class TrainViewSet(viewsets.ModelViewSet):
         serializer = BulkRecalculateSerializer(data=request.data)
         
         if serializer.is_valid():
-            start_date = serializer.validated_data.get('start_date')
-            end_date = serializer.validated_data.get('end_date')
-            
-            if not start_date:
-                start_date = date.today() - timedelta(days=30)
-            if not end_date:
-                end_date = date.today()
-            
-            # Здесь можно запустить Celery задачу для пересчета
-            return Response({
-                'message': f'Пересчет запущен для поезда {train.name}',
-                'train_id': train.id,
-                'period': f'{start_date} - {end_date}'
-            }, status=status.HTTP_202_ACCEPTED)
+            job, created = RecalculationJobService.request_recalculation(
+                train_ids=[train.id],
+                start_date=serializer.validated_data.get('start_date'),
+                end_date=serializer.validated_data.get('end_date')
+            )
+            return recalculation_job_response(
+                job, created, f'Пересчет запущен для поезда {train.name}',
+                train_id=train.id,
+                period=f'{job.start_date} - {job.end_date}'
+            )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class TrainDailyRecordViewSet(viewsets.ModelViewSet):
     '''ViewSet для управления ежедневными записями.'''
+    pagination_class = RecordPagination
     permission_classes = [
         IsAuthenticated]
     filter_backends = [
@@ -196,66 +202,18 @@ class TrainDailyRecordViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def export_excel(self, request):
-        '''Экспорт данных в Excel.'''
-        serializer = ExcelExportSerializer(data=request.data)
-        if serializer.is_valid():
-            data = serializer.validated_data
-            queryset = self.filter_queryset(self.get_queryset())
-            
-            # Применение фильтров
-            if data.get('train_ids'):
-                queryset = queryset.filter(train_id__in=data['train_ids'])
-            if data.get('depot_ids'):
-                queryset = queryset.filter(train__depot_id__in=data['depot_ids'])
-            if data.get('start_date'):
-                queryset = queryset.filter(record_date__gte=data['start_date'])
-            if data.get('end_date'):
-                queryset = queryset.filter(record_date__lte=data['end_date'])
-            
-            filename = f'vsm_data_{date.today().isoformat()}.{data["format"]}'
-            
-            try:
-                response = ExcelService.export_to_excel(
-                    queryset,
-                    filename=filename,
-                    include_calculations=data['include_calculations'],
-                    format=data['format']
-                )
-                return response
-            except Exception as e:
-                return Response({
-                    'error': f'Ошибка экспорта: {str(e)}'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        '''
+        Экспорт данных в Excel.
 
-    @action(detail=False, methods=['post'])
+        Готовый файл для тех же фильтров отдается сразу, иначе ставится
+        фоновая задача экспорта и возвращается ее статус.
+        '''
+        return export_job_response(request, request.data)
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
     def import_excel(self, request):
-        '''Импорт данных из Excel.'''
-        serializer = ExcelImportSerializer(data=request.data)
-        if serializer.is_valid():
-            data = serializer.validated_data
-            
-            try:
-                result = ExcelService.import_from_excel(
-                    data['file'],
-                    sheet_name=data['sheet_name'],
-                    skip_rows=data['skip_rows'],
-                    update_existing=data['update_existing']
-                )
-                
-                return Response({
-                    'success': True,
-                    'message': 'Импорт завершен успешно',
-                    'results': result
-                }, status=status.HTTP_201_CREATED)
-                
-            except Exception as e:
-                return Response({
-                    'error': f'Ошибка импорта: {str(e)}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-        
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        '''Импорт данных из файла фоновой задачей; прогресс - в records/import_jobs/<id>/.'''
+        return import_job_response(request)
 
     @action(detail=False, methods=['get'])
     def download_template(self, request):
@@ -272,21 +230,7 @@ class TrainDailyRecordViewSet(viewsets.ModelViewSet):
         '''Массовый пересчет записей.'''
         serializer = BulkRecalculateSerializer(data=request.data)
         if serializer.is_valid():
-            data = serializer.validated_data
-            train_ids = data.get('train_ids', [])
-            
-            if not train_ids:
-                train_ids = list(Train.objects.filter(is_active=True).values_list('id', flat=True))
-            
-            start_date = data.get('start_date') or date.today() - timedelta(days=30)
-            end_date = data.get('end_date') or date.today()
-            
-            # Здесь можно запустить Celery задачу для пересчета
-            return Response({
-                'message': f'Запущен пересчет для {len(train_ids)} поездов',
-                'period': f'{start_date} - {end_date}',
-                'trains_count': len(train_ids)
-            }, status=status.HTTP_202_ACCEPTED)
+            return bulk_recalculation_response(serializer.validated_data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -376,3 +320,144 @@ class TrainDailyRecordViewSet(viewsets.ModelViewSet):
             'upcoming_maintenance': upcoming_serializer.data
         })
 
+
+
+class ImportJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    '''
+    Фоновый импорт файлов с записями.
+
+    POST сохраняет файл и ставит задачу Celery, GET по ID возвращает прогресс.
+    '''
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    permission_classes = [
+        IsAuthenticated]
+    parser_classes = [
+        MultiPartParser,
+        FormParser]
+
+    def perform_create(self, serializer):
+        start_import_job(serializer)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+
+def start_import_job(serializer):
+    '''Сохранение файла импорта и запуск задачи после фиксации транзакции.'''
+    from .tasks import process_import_job
+
+    job = serializer.save()
+    transaction.on_commit(lambda: process_import_job.delay(job.id))
+    return job
+
+
+def import_job_response(request):
+    '''Постановка фонового импорта по данным ImportJobSerializer; ответ 202 с задачей.'''
+    serializer = ImportJobSerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    start_import_job(serializer)
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+def export_job_response(request, data):
+    '''
+    Экспорт записей по фильтрам ExcelExportSerializer.
+
+    Готовый файл для тех же фильтров отдается сразу, иначе - ответ 202
+    с задачей экспорта.
+    '''
+    serializer = ExcelExportSerializer(data=data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        job = ExportJobService.request_export(serializer.validated_data)
+    except Exception as e:
+        return Response({
+            'error': f'Ошибка экспорта: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    if job.has_artifact:
+        return export_job_file_response(job)
+    return Response(
+        ExportJobSerializer(job, context={'request': request}).data,
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+def recalculation_job_response(job, created, message, **extra):
+    '''Ответ 202 с задачей пересчета; deduplicated - запрос присоединен к выполняющейся задаче.'''
+    return Response({
+        **RecalculationJobSerializer(job).data,
+        'message': message,
+        'deduplicated': not created,
+        **extra
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def bulk_recalculation_response(data):
+    '''Постановка массового пересчета по данным BulkRecalculateSerializer.'''
+    train_ids = data.get('train_ids', [])
+    job, created = RecalculationJobService.request_recalculation(
+        train_ids=train_ids,
+        start_date=data.get('start_date'),
+        end_date=data.get('end_date')
+    )
+    trains_count = len(job.train_ids) if job.train_ids else Train.objects.filter(is_active=True).count()
+    return recalculation_job_response(
+        job, created, f'Запущен пересчет для {trains_count} поездов',
+        period=f'{job.start_date} - {job.end_date}',
+        trains_count=trains_count
+    )
+
+
+class RecalculationJobViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    '''Статус фоновых задач пересчета.'''
+    queryset = RecalculationJob.objects.all()
+    serializer_class = RecalculationJobSerializer
+    permission_classes = [
+        IsAuthenticated]
+
+
+def export_job_file_response(job):
+    '''Ответ с готовым файлом задачи экспорта.'''
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=ExportJobService.download_filename(job),
+        content_type=ExcelService.EXPORT_CONTENT_TYPES[job.format]
+    )
+
+
+class ExportJobViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    '''
+    Фоновый экспорт записей.
+
+    POST ставит задачу (или возвращает готовую для тех же фильтров),
+    GET по ID возвращает статус, download - готовый файл.
+    '''
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    permission_classes = [
+        IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = ExcelExportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = ExportJobService.request_export(serializer.validated_data)
+        response_status = status.HTTP_200_OK if job.has_artifact else status.HTTP_202_ACCEPTED
+        return Response(self.get_serializer(job).data, status=response_status)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        '''Скачивание готового файла экспорта.'''
+        job = self.get_object()
+        if not job.has_artifact:
+            return Response({
+                'error': 'Файл экспорта еще не готов',
+                'status': job.status
+            }, status=status.HTTP_409_CONFLICT)
+        return export_job_file_response(job)
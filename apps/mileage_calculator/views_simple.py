@@ -4,26 +4,37 @@
 """
 Простые ViewSet'ы для тестирования с корректной аутентификацией.
 """
+from django.db.models import Count
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.http import JsonResponse, HttpResponse
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.parsers import MultiPartParser, FormParser
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 import datetime
 import logging
-from .models import Depot, Train, TrainDailyRecord
-from .serializers import DepotSerializer, TrainSerializer, TrainDailyRecordSerializer
+from .models import Depot, Train, TrainDailyRecord, TrainTypeCache
+from .pagination import RecordPagination
+from .filters import TrainDailyRecordFilter
+from .renderers import FastJSONRenderer, NDJSONRenderer, CSVRenderer
+from .serializers import DepotSerializer, TrainSerializer, TrainDailyRecordSerializer, TrainDailyRecordRowSerializer, BulkRecalculateSerializer
+from .services.excel_service import ExcelService
+from .services.recalculation_job_service import RecalculationJobService
+from .views import recalculation_job_response, bulk_recalculation_response, import_job_response, export_job_response
 
 logger = logging.getLogger(__name__)
 
 
 class DepotViewSet(viewsets.ModelViewSet):
     '''Simple ViewSet для депо.'''
-    queryset = Depot.objects.all()
+    # Счетчики поездов - условными агрегатами в запросе списка/депо
+    queryset = Depot.with_train_counts()
     serializer_class = DepotSerializer
     permission_classes = [
         IsAuthenticated]
@@ -43,9 +54,13 @@ class DepotViewSet(viewsets.ModelViewSet):
     def statistics(self, request, pk=None):
         '''Статистика депо.'''
         depot = self.get_object()
+        counts = depot.train_counts()
         stats = {
-            'total_trains': depot.trains.count(),
-            'active_trains': depot.trains.filter(is_active=True).count()
+            'total_trains': counts['trains_count'],
+            'active_trains': counts['active_trains_count'],
+            'manual_trains': counts['manual_trains_count'],
+            'automatic_trains': counts['automatic_trains_count'],
+            'trains_by_type': counts['trains_by_type']
         }
         return Response(stats)
     
@@ -60,11 +75,25 @@ class DepotViewSet(viewsets.ModelViewSet):
             'maintenance_rate': 12.3
         }
         return Response(performance)
+    
+    @action(detail=True, methods=['post'])
+    def recalculate(self, request, pk=None):
+        '''Пересчет всех поездов депо.'''
+        depot = self.get_object()
+        serializer = BulkRecalculateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job, created = RecalculationJobService.request_recalculation(
+            depot=depot,
+            start_date=serializer.validated_data.get('start_date'),
+            end_date=serializer.validated_data.get('end_date')
+        )
+        return recalculation_job_response(job, created, f'Пересчет запущен для депо {depot.name}', depot_id=depot.id)
 
 
 class TrainViewSet(viewsets.ModelViewSet):
     '''Simple ViewSet для поездов.'''
-    queryset = Train.objects.all()
+    # Число записей - аннотацией, последняя запись - из текущего состояния поезда
+    queryset = Train.objects.select_related('depot', 'current_state').annotate(records_count=Count('daily_records'))
     serializer_class = TrainSerializer
     permission_classes = [
         IsAuthenticated]
@@ -111,6 +140,19 @@ class TrainViewSet(viewsets.ModelViewSet):
         }
         return Response(trends)
     
+    @action(detail=True, methods=['post'])
+    def recalculate(self, request, pk=None):
+        '''Пересчет данных поезда.'''
+        train = self.get_object()
+        serializer = BulkRecalculateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job, created = RecalculationJobService.request_recalculation(
+            train_ids=[train.id],
+            start_date=serializer.validated_data.get('start_date'),
+            end_date=serializer.validated_data.get('end_date')
+        )
+        return recalculation_job_response(job, created, f'Пересчет запущен для поезда {train.name}', train_id=train.id)
+    
     @action(detail=False, methods=['post'])
     def bulk_update(self, request):
         '''Массовое обновление поездов.'''
@@ -120,6 +162,8 @@ class TrainViewSet(viewsets.ModelViewSet):
         
         if train_ids and updates:
             Train.objects.filter(id__in=train_ids).update(**updates)
+            # update() не вызывает сигналы Train - кеш типов сбрасывается явно
+            TrainTypeCache.invalidate()
             
         return Response({
             'message': 'Поезда обновлены',
@@ -131,17 +175,17 @@ class TrainDailyRecordViewSet(viewsets.ModelViewSet):
     '''Simple ViewSet для ежедневных записей.'''
     queryset = TrainDailyRecord.objects.all()
     serializer_class = TrainDailyRecordSerializer
+    pagination_class = RecordPagination
+    renderer_classes = [
+        FastJSONRenderer,
+        BrowsableAPIRenderer]
     permission_classes = [
         IsAuthenticated]
     filter_backends = [
         DjangoFilterBackend,
         SearchFilter,
         OrderingFilter]
-    filterset_fields = [
-        'train',
-        'record_date',
-        'train__type',
-        'train__depot']
+    filterset_class = TrainDailyRecordFilter
     search_fields = [
         'train__name',
         'train__depot__name']
@@ -150,6 +194,33 @@ class TrainDailyRecordViewSet(viewsets.ModelViewSet):
         'total_mileage']
     ordering = [
         '-record_date']
+    # Записей, читаемых курсором за раз при потоковой выгрузке
+    stream_chunk_size = getattr(settings, 'RECORDS_STREAM_CHUNK_SIZE', 2000)
+    # Действия, где ответ строится по ?fields=/?omit= и выборка сокращается до нужных колонок
+    sparse_actions = (
+        'list',
+        'retrieve')
+    
+    def is_row_representation(self):
+        '''Облегченное представление списка по ?representation=row.'''
+        return self.action == 'list' and self.request.query_params.get('representation') == 'row'
+    
+    def get_queryset(self):
+        '''Для чтения списка и записи - только колонки и связи запрошенных полей.'''
+        queryset = super().get_queryset()
+        if self.action in self.sparse_actions:
+            field_names = TrainDailyRecordSerializer.requested_field_names(
+                self.request, TrainDailyRecordSerializer.Meta.fields
+            )
+            if self.is_row_representation():
+                return TrainDailyRecordRowSerializer.row_queryset(queryset, field_names)
+            queryset = TrainDailyRecordSerializer.optimize_queryset(queryset, field_names)
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.is_row_representation():
+            return TrainDailyRecordRowSerializer
+        return super().get_serializer_class()
     
     def create(self, request, *args, **kwargs):
         '''Переопределяем create для правильной обработки.'''
@@ -176,6 +247,36 @@ class TrainDailyRecordViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def stream(self, request):
+        '''
+        Потоковая выгрузка записей по фильтрам списка в NDJSON или CSV.
+
+        Формат выбирается заголовком Accept или ?format=ndjson|csv; строки читаются
+        курсором порциями по stream_chunk_size, поэтому выгрузка идет одним запросом
+        без накопления в памяти.
+        '''
+        field_names = TrainDailyRecordSerializer.requested_field_names(
+            request, TrainDailyRecordSerializer.Meta.fields
+        )
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = TrainDailyRecordRowSerializer.row_queryset(queryset, field_names).iterator(
+            chunk_size=self.stream_chunk_size
+        )
+        serializer = TrainDailyRecordRowSerializer(context=self.get_serializer_context())
+        renderer = request.accepted_renderer
+        items = (serializer.to_representation(row) for row in rows)
+        
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(serializer.field_names, items),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="records.{renderer.format}"'
+        return response
+    
     @action(detail=False, methods=['get'])
     def by_indicator(self, request):
         '''Фильтрация по индикатору.'''
@@ -229,17 +330,24 @@ class TrainDailyRecordViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def bulk_recalculate(self, request):
         '''Массовый пересчет.'''
-        return Response({'message': 'OK'})
+        serializer = BulkRecalculateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return bulk_recalculation_response(serializer.validated_data)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['post'])
     def export_excel(self, request):
-        '''Экспорт в Excel.'''
-        return Response({'message': 'OK'})
+        '''
+        Экспорт записей по фильтрам ExcelExportSerializer.
+
+        Готовый файл для тех же фильтров отдается сразу, иначе - ответ 202
+        с задачей; статус - в records/export_jobs/<id>/.
+        '''
+        return export_job_response(request, request.data)
     
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
     def import_excel(self, request):
-        '''Импорт из Excel.'''
-        return Response({'message': 'OK'})
+        '''Импорт записей из файла фоновой задачей; прогресс - в records/import_jobs/<id>/.'''
+        return import_job_response(request)
     
     @action(detail=False, methods=['get'])
     def download_template(self, request):
@@ -252,10 +360,18 @@ class TrainDailyRecordViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def export(self, request):
         '''Экспорт данных.'''
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="records.xlsx"'
-        response.write(b'fake excel content')
-        return response
+        export_format = request.query_params.get('export_format', 'xlsx')
+        if export_format not in ExcelService.TABULAR_FORMATS:
+            return Response({'error': f'Неподдерживаемый формат: {export_format}'}, status=400)
+        
+        queryset = self.filter_queryset(self.get_queryset())
+        include_calculations = request.query_params.get('include_calculations', 'true').lower() != 'false'
+        return ExcelService.export_data(
+            queryset,
+            filename='records.xlsx',
+            include_calculations=include_calculations,
+            format=export_format
+        )
 
 
 def health_check(request):
@@ -1,3 +1,6 @@
 # Source Generated with Decompyle++
 # File: __init__.cpython-312.pyc (Python 3.12)
 
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
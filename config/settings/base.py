@@ -129,6 +129,14 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
     'SCHEMA_PATH_PREFIX': '/api/v1/',
     'COMPONENT_SPLIT_REQUEST': True }
+# Максимальный размер страницы записей в режиме курсора (?pagination=cursor)
+RECORDS_CURSOR_MAX_PAGE_SIZE = config('RECORDS_CURSOR_MAX_PAGE_SIZE', default = 500, cast = int)
+# Записей, читаемых курсором за раз в /api/v1/records/stream/
+RECORDS_STREAM_CHUNK_SIZE = config('RECORDS_STREAM_CHUNK_SIZE', default = 2000, cast = int)
+# Через сколько секунд незавершенная задача экспорта считается зависшей
+EXPORT_JOB_STALE_TIMEOUT = config('EXPORT_JOB_STALE_TIMEOUT', default = 3600, cast = int)
+# Через сколько секунд незавершенная задача пересчета считается зависшей
+RECALCULATION_JOB_STALE_TIMEOUT = config('RECALCULATION_JOB_STALE_TIMEOUT', default = 7200, cast = int)
 MAX_UPLOAD_SIZE = config('MAX_UPLOAD_SIZE', default = 5242880, cast = int)
 ALLOWED_EXTENSIONS = config('ALLOWED_EXTENSIONS', default='xlsx,xls', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
 LOGGING = {
@@ -180,3 +188,7 @@ SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
 EXTERNAL_API_URL = config('EXTERNAL_API_URL', default = 'https://api.example.com')
 EXTERNAL_API_KEY = config('EXTERNAL_API_KEY', default = 'your-api-key-here')
+EXTERNAL_API_BATCH_SYNC = config('EXTERNAL_API_BATCH_SYNC', default = True, cast = bool)
+EXTERNAL_API_MAX_WORKERS = config('EXTERNAL_API_MAX_WORKERS', default = 8, cast = int)
+EXTERNAL_API_RETRY_BUDGET = config('EXTERNAL_API_RETRY_BUDGET', default = 20, cast = int)
+FLEET_RECALC_PARTITIONS = config('FLEET_RECALC_PARTITIONS', default = 4, cast = int)
@@ -114,6 +114,9 @@ SPECTACULAR_SETTINGS = {
     'SORT_OPERATIONS': False }
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# Задачи Celery выполняются синхронно, без брокера
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = True
 EXTERNAL_API_URL = os.environ.get('EXTERNAL_API_URL', 'https://api.example.com')
 EXTERNAL_API_KEY = os.environ.get('EXTERNAL_API_KEY', 'test-key')
 LOGGING = {
@@ -8,6 +8,8 @@ from rest_framework import status
 from django.contrib.auth.models import User
 from datetime import date, timedelta
 import json
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from apps.mileage_calculator.models import Depot, Train, TrainDailyRecord
 
 
@@ -77,6 +79,45 @@ class TestDepotAPIEndpoints:
         assert 'active_trains' in data
         assert data['total_trains'] == 2
         assert data['active_trains'] == 1
+    
+    def test_depot_statistics_breakdown(self, authenticated_client, depot):
+        """Тестирование разбивки поездов депо по типам и вводу пробега."""
+        Train.objects.create(name="Поезд 1", type="Ласточка", depot=depot, is_manual_mileage=True)
+        Train.objects.create(name="Поезд 2", type="Ласточка", depot=depot)
+        Train.objects.create(name="Поезд 3", type="Сапсан", depot=depot, is_active=False)
+        
+        response = authenticated_client.get(f'/api/v1/depots/{depot.id}/statistics/')
+        
+        data = response.json()
+        assert data['manual_trains'] == 1
+        assert data['automatic_trains'] == 2
+        assert data['trains_by_type'] == {'Ласточка': 2, 'Финист': 0, 'Сапсан': 1}
+    
+    def test_depot_list_query_count_is_constant(self, authenticated_client):
+        """Тестирование: счетчики поездов не добавляют запросов на каждое депо."""
+        def list_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = authenticated_client.get('/api/v1/depots/')
+            assert response.status_code == status.HTTP_200_OK
+            return len(queries), response.json()['results']
+        
+        def create_depots(names):
+            for name in names:
+                depot = Depot.objects.create(name=name)
+                Train.objects.create(name=f"{name} поезд 1", type="Ласточка", depot=depot)
+                Train.objects.create(name=f"{name} поезд 2", type="Финист", depot=depot, is_manual_mileage=True)
+        
+        create_depots(["Депо 1", "Депо 2"])
+        small_count, small_results = list_queries()
+        create_depots([f"Депо {index}" for index in range(3, 11)])
+        large_count, large_results = list_queries()
+        
+        assert len(small_results) == 2
+        assert len(large_results) == 10
+        assert small_count == large_count
+        assert large_results[0]['trains_count'] == 2
+        assert large_results[0]['manual_trains_count'] == 1
+        assert large_results[0]['trains_by_type']['Финист'] == 1
 
 
 @pytest.mark.django_db
@@ -224,6 +265,62 @@ class TestTrainDailyRecordAPIEndpoints:
         assert len(data['results']) == 1
         assert data['results'][0]['train'] == train1.id
     
+    def test_record_sparse_fields(self, authenticated_client, daily_records):
+        """Тестирование выбора полей записей через ?fields= без соединения с поездом."""
+        fields = 'id,record_date,total_mileage,daily_mileage,indicator_color'
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(f'/api/v1/records/?fields={fields}')
+        
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()['results']
+        assert len(results) == 10
+        assert all(list(item) == fields.split(',') for item in results)
+        select_sql = [query['sql'] for query in queries if TrainDailyRecord._meta.db_table in query['sql']]
+        assert select_sql
+        assert not any('"mileage_calculator_train"' in sql for sql in select_sql)
+        assert not any('"last_to_mileage"' in sql for sql in select_sql if 'COUNT(' not in sql.upper())
+    
+    def test_record_sparse_fields_with_related(self, authenticated_client, daily_records):
+        """Тестирование связанных и вычисляемых полей при выборе полей."""
+        response = authenticated_client.get(
+            f'/api/v1/records/{daily_records[0].id}/?fields=train_name,depot_name,next_block_date'
+        )
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            'train_name': daily_records[0].train.name,
+            'depot_name': daily_records[0].train.depot.name,
+            'next_block_date': None
+        }
+    
+    def test_record_omit_fields(self, authenticated_client, daily_records):
+        """Тестирование исключения полей через ?omit=."""
+        response = authenticated_client.get('/api/v1/records/?omit=created_at,updated_at,depot_name')
+        
+        item = response.json()['results'][0]
+        assert 'created_at' not in item
+        assert 'depot_name' not in item
+        assert 'train_name' in item
+    
+    def test_record_unknown_field(self, authenticated_client, daily_records):
+        """Тестирование неизвестного поля в ?fields=."""
+        response = authenticated_client.get('/api/v1/records/?fields=id,unknown')
+        
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+    
+    def test_record_row_representation(self, authenticated_client, daily_records):
+        """Тестирование облегченного представления: тот же JSON, что у сериализатора."""
+        full = authenticated_client.get('/api/v1/records/').json()
+        rows = authenticated_client.get('/api/v1/records/?representation=row').json()
+        sparse = authenticated_client.get('/api/v1/records/?representation=row&fields=id,train,record_date').json()
+        
+        assert rows == full
+        assert sparse['results'][0] == {
+            'id': full['results'][0]['id'],
+            'train': full['results'][0]['train'],
+            'record_date': full['results'][0]['record_date']
+        }
+    
     def test_record_by_indicator(self, authenticated_client, train):
         """Тестирование фильтрации по цветовому индикатору."""
         record = TrainDailyRecord.objects.create(
@@ -302,7 +399,8 @@ class TestTrainDailyRecordAPIEndpoints:
         
         response = authenticated_client.post('/api/v1/records/bulk_recalculate/', data)
         
-        assert response.status_code == status.HTTP_200_OK
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.json()['trains_count'] == 1
 
 
 @pytest.mark.django_db
@@ -412,6 +510,73 @@ class TestAPIPagination:
         assert len(data['results']) <= 60  # Не больше общего количества
         assert data['count'] == 60
     
+    def create_record_history(self, depot, trains=3, days=10):
+        """Создание истории записей: trains поездов за days дней."""
+        records = []
+        for index in range(trains):
+            train = Train.objects.create(name=f"Поезд {index + 1}", type="Ласточка", depot=depot)
+            for offset in range(days):
+                records.append(TrainDailyRecord(
+                    train=train,
+                    record_date=date.today() - timedelta(days=offset),
+                    total_mileage=100000 - offset * 500,
+                    daily_mileage=500
+                ))
+        TrainDailyRecord.objects.bulk_create(records)
+        return list(
+            TrainDailyRecord.objects.order_by('-record_date', '-train_id', '-id').values_list('id', flat=True)
+        )
+    
+    def test_cursor_pagination_walks_all_records(self, authenticated_client, depot):
+        """Тестирование keyset-пагинации записей: обход всех страниц без COUNT."""
+        expected_ids = self.create_record_history(depot)
+        
+        url = '/api/v1/records/?pagination=cursor&page_size=7'
+        seen_ids = []
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = authenticated_client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            data = response.json()
+            assert 'count' not in data
+            assert not any('COUNT(' in query['sql'].upper() for query in queries)
+            seen_ids.extend(item['id'] for item in data['results'])
+            pages.append(data)
+            url = data['next']
+        
+        assert seen_ids == expected_ids
+        assert len(pages) == 5
+        assert pages[0]['previous'] is None
+        
+        # Ссылка previous возвращает предыдущую страницу
+        response = authenticated_client.get(pages[2]['previous'])
+        assert [item['id'] for item in response.json()['results']] == expected_ids[7:14]
+    
+    def test_cursor_pagination_page_size_limit(self, authenticated_client, depot, settings):
+        """Тестирование ограничения размера страницы в режиме курсора."""
+        settings.RECORDS_CURSOR_MAX_PAGE_SIZE = 5
+        self.create_record_history(depot, trains=1)
+        
+        response = authenticated_client.get('/api/v1/records/?pagination=cursor&page_size=100')
+        
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()['results']) == 5
+    
+    def test_cursor_pagination_invalid_cursor(self, authenticated_client):
+        """Тестирование неверного курсора."""
+        response = authenticated_client.get('/api/v1/records/?cursor=not-a-cursor')
+        
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+    
+    def test_records_page_number_pagination_by_default(self, authenticated_client, depot):
+        """Тестирование: без параметра pagination записи отдаются постранично с count."""
+        self.create_record_history(depot, trains=1)
+        
+        response = authenticated_client.get('/api/v1/records/')
+        
+        assert response.json()['count'] == 10
+    
     def test_search_functionality(self, authenticated_client, depot):
         """Тестирование функциональности поиска."""
         Train.objects.create(name="Специальный поезд", type="Ласточка", depot=depot)
@@ -9,7 +9,10 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from rest_framework import status
-from apps.mileage_calculator.models import Depot, Train
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from apps.mileage_calculator.models import Depot, Train, TrainDailyRecord
+from datetime import date, timedelta
 import uuid
 
 
@@ -67,3 +70,63 @@ class TestTrainFiltering(APITestCase):
         """Тест фильтрации поездов"""
         response = self.client.get('/api/v1/trains/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TestTrainListQueries(APITestCase):
+    """Число запросов списка поездов не зависит от количества поездов"""
+    
+    def setUp(self):
+        """Настройка тестового окружения"""
+        unique_id = str(uuid.uuid4())[:8]
+        self.user = User.objects.create_user(
+            username=f'testuser_{unique_id}',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.depot = Depot.objects.create(name="Test Depot")
+    
+    def create_trains(self, count):
+        """Создание поездов с двумя записями и одного поезда без записей"""
+        start = Train.objects.count()
+        for index in range(start, start + count):
+            train = Train.objects.create(name=f"Train {index:03d}", type="Ласточка", depot=self.depot)
+            for offset in (1, 0):
+                TrainDailyRecord.objects.create(
+                    train=train,
+                    record_date=date.today() - timedelta(days=offset),
+                    total_mileage=100000 + index * 1000 - offset * 500,
+                    daily_mileage=500
+                )
+        Train.objects.create(name=f"Train {start + count:03d} empty", type="Ласточка", depot=self.depot)
+    
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/trains/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response.data['results']
+    
+    def test_train_list_query_count_is_constant(self):
+        """Тест: список из 3 и из 16 поездов строится одинаковым числом запросов"""
+        self.create_trains(2)
+        small_count, small_results = self.count_list_queries()
+        self.create_trains(12)
+        large_count, large_results = self.count_list_queries()
+        
+        self.assertEqual(len(small_results), 3)
+        self.assertEqual(len(large_results), 16)
+        self.assertEqual(small_count, large_count)
+        # Счетчик страницы и сама страница
+        self.assertLessEqual(large_count, 2)
+    
+    def test_train_list_values_from_annotation_and_state(self):
+        """Тест: число записей и последняя запись в списке"""
+        self.create_trains(1)
+        _, results = self.count_list_queries()
+        by_name = {item['name']: item for item in results}
+        
+        self.assertEqual(by_name['Train 000']['records_count'], 2)
+        self.assertEqual(by_name['Train 000']['latest_record_date'], date.today().isoformat())
+        self.assertEqual(by_name['Train 000']['latest_total_mileage'], 100000)
+        self.assertEqual(by_name['Train 001 empty']['records_count'], 0)
+        self.assertIsNone(by_name['Train 001 empty']['latest_record_date'])
+        self.assertIsNone(by_name['Train 001 empty']['latest_total_mileage'])
@@ -0,0 +1,353 @@
+'''
+Тесты пакетного пересчета записей поезда.
+'''
+import pytest
+import pandas as pd
+from unittest import mock
+from datetime import date, timedelta
+from apps.mileage_calculator.models import Depot, Train, TrainDailyRecord
+from apps.mileage_calculator.services.calculation_service import MileageCalculationService
+from apps.mileage_calculator.services.bulk_calculation_service import BulkCalculationService
+from apps.mileage_calculator.services.excel_service import ExcelService
+from apps.mileage_calculator.tasks import recalculate_train_metrics, bulk_recalculate_all_trains
+
+
+@pytest.fixture
+def history(train):
+    """История записей поезда за 90 дней."""
+    base_date = date.today() - timedelta(days=89)
+    records = []
+    for i in range(90):
+        records.append(TrainDailyRecord.objects.create(
+            train=train,
+            record_date=base_date + timedelta(days=i),
+            total_mileage=100000 + i * 500,
+            daily_mileage=500 if i % 7 else 0,
+            last_to_mileage=130000,
+            last_to_date=base_date - timedelta(days=10)
+        ))
+    return records
+
+
+@pytest.mark.django_db
+class TestBulkCalculateForTrain:
+    """Тесты MileageCalculationService.bulk_calculate_for_train."""
+
+    def test_updates_average_and_planned_date(self, train, history):
+        """Средний пробег и плановая дата ТО заполняются для окна."""
+        start_date = date.today() - timedelta(days=30)
+        updated_count = MileageCalculationService.bulk_calculate_for_train(train, start_date, date.today())
+
+        assert updated_count == 31
+        record = TrainDailyRecord.objects.get(train=train, record_date=date.today())
+        assert record.avg_mileage == 500.0
+        assert record.mileage_since_to == record.total_mileage - 130000
+        remaining = 25000 - record.mileage_since_to
+        assert record.planned_to_date == record.record_date + timedelta(days=int(remaining / 500))
+
+    def test_records_outside_window_untouched(self, train, history):
+        """Записи до начала окна не изменяются."""
+        start_date = date.today() - timedelta(days=10)
+        MileageCalculationService.bulk_calculate_for_train(train, start_date, date.today())
+
+        before_window = TrainDailyRecord.objects.get(train=train, record_date=start_date - timedelta(days=1))
+        assert before_window.avg_mileage is None
+
+    def test_repeated_recalculation_is_idempotent(self, train, history):
+        """Повторный пересчет не меняет записи."""
+        start_date = date.today() - timedelta(days=30)
+        MileageCalculationService.bulk_calculate_for_train(train, start_date, date.today())
+        assert MileageCalculationService.bulk_calculate_for_train(train, start_date, date.today()) == 0
+
+    def test_formula_1_chain(self, train):
+        """Общий пробег следует за суточным пробегом от первой записи окна."""
+        base_date = date.today() - timedelta(days=3)
+        for i, daily in enumerate([None, 300, 400, None]):
+            TrainDailyRecord.objects.create(
+                train=train,
+                record_date=base_date + timedelta(days=i),
+                total_mileage=10000 + i * 1000,
+                daily_mileage=daily
+            )
+
+        MileageCalculationService.bulk_calculate_for_train(train, base_date, date.today())
+
+        records = list(TrainDailyRecord.objects.filter(train=train).order_by('record_date'))
+        assert [r.total_mileage for r in records] == [10000, 10300, 10700, 13000]
+        # Формула 2 для записи без суточного пробега
+        assert records[3].daily_mileage == 2300
+
+    def test_formula_1_restarts_after_missing_day(self, train):
+        """После пропущенного дня общий пробег берется из записи, а не из цепочки."""
+        base_date = date.today() - timedelta(days=3)
+        for offset, total in [(0, 1000), (2, 1300), (3, 1400)]:
+            TrainDailyRecord.objects.create(
+                train=train,
+                record_date=base_date + timedelta(days=offset),
+                total_mileage=total,
+                daily_mileage=100
+            )
+
+        MileageCalculationService.bulk_calculate_for_train(train, base_date, date.today())
+
+        records = TrainDailyRecord.objects.filter(train=train).order_by('record_date')
+        assert [r.total_mileage for r in records] == [1000, 1300, 1400]
+
+    def test_query_count(self, train, history, django_assert_max_num_queries):
+        """Окно в 90 дней пересчитывается за несколько запросов."""
+        start_date = date.today() - timedelta(days=89)
+        with django_assert_max_num_queries(6):
+            MileageCalculationService.bulk_calculate_for_train(train, start_date, date.today())
+
+    def test_sapsan_columns(self, depot):
+        """Формулы 10-12 рассчитываются для Сапсан."""
+        sapsan = Train.objects.create(name='SAPSAN-BULK', type='Сапсан', depot=depot)
+        record = TrainDailyRecord.objects.create(
+            train=sapsan,
+            record_date=date.today(),
+            total_mileage=120000,
+            daily_mileage=500,
+            to_l_mileage=110000,
+            to_n_mileage=100000
+        )
+        frame = BulkCalculationService.build_frame(
+            TrainDailyRecord.objects.filter(id=record.id).values_list(*BulkCalculationService.LOAD_FIELDS)
+        )
+        calculated = BulkCalculationService.compute_frame(frame, 'Сапсан')
+
+        assert calculated['sapsan_mileage_from_to_l'][0] == 10000
+        assert calculated['sapsan_mileage_to_to_l'][0] == 15000
+        assert calculated['sapsan_mileage_to_to_n'][0] == 130000
+
+
+@pytest.mark.django_db
+class TestRecalculateTrainMetricsTask:
+    """Тесты задачи recalculate_train_metrics."""
+
+    def test_task_result(self, train, history):
+        """Задача возвращает количество обновленных записей."""
+        result = recalculate_train_metrics(train.id)
+
+        assert result['train_id'] == train.id
+        assert result['updated_count'] > 0
+        assert result['end_date'] == date.today().isoformat()
+
+    def test_task_missing_train(self):
+        """Задача сообщает об отсутствующем поезде."""
+        result = recalculate_train_metrics(999999)
+        assert 'error' in result
+
+
+@pytest.mark.django_db
+class TestFleetRecalculation:
+    """Тесты пересчета всего парка одним проходом."""
+
+    def _create_fleet(self, depot, count=3, days=20):
+        trains = []
+        for n in range(count):
+            train = Train.objects.create(name=f'FLEET-{n}', type='Финист', depot=depot)
+            for i in range(days):
+                TrainDailyRecord.objects.create(
+                    train=train,
+                    record_date=date.today() - timedelta(days=days - 1 - i),
+                    total_mileage=50000 + i * 400,
+                    daily_mileage=400
+                )
+            trains.append(train)
+        return trains
+
+    def test_fleet_report(self, depot):
+        """Отчет содержит количество измененных записей по каждому поезду."""
+        trains = self._create_fleet(depot)
+        report = BulkCalculationService.recalculate_fleet(
+            date.today() - timedelta(days=9), date.today(), chunk_size=7
+        )
+
+        assert set(report) == {t.id for t in trains}
+        for train in trains:
+            assert report[train.id]['updated_count'] == 10
+            assert report[train.id]['records_count'] == 20
+        assert TrainDailyRecord.objects.filter(avg_mileage=400.0).count() == 30
+
+    def test_fleet_matches_per_train(self, depot):
+        """Результат совпадает с пересчетом по одному поезду."""
+        trains = self._create_fleet(depot, count=2)
+        start_date = date.today() - timedelta(days=15)
+        BulkCalculationService.recalculate_fleet(start_date, date.today())
+        for train in trains:
+            assert MileageCalculationService.bulk_calculate_for_train(train, start_date, date.today()) == 0
+
+    def test_fleet_depot_filter(self, depot):
+        """Пересчет ограничивается депо."""
+        self._create_fleet(depot, count=1)
+        other_depot = Depot.objects.create(name='Другое депо')
+        other_train = Train.objects.create(name='OTHER-1', type='Ласточка', depot=other_depot)
+        TrainDailyRecord.objects.create(
+            train=other_train, record_date=date.today(), total_mileage=1000, daily_mileage=100
+        )
+
+        report = BulkCalculationService.recalculate_fleet(
+            date.today() - timedelta(days=5), date.today(), depot_id=other_depot.id
+        )
+
+        assert list(report) == [other_train.id]
+
+    def test_fleet_query_count(self, depot, django_assert_max_num_queries):
+        """Число запросов не зависит от размера парка."""
+        self._create_fleet(depot, count=5, days=10)
+        with django_assert_max_num_queries(8):
+            BulkCalculationService.recalculate_fleet(date.today() - timedelta(days=9), date.today())
+
+    def test_bulk_recalculate_all_trains_task(self, depot):
+        """Задача массового пересчета сохраняет формат ответа."""
+        trains = self._create_fleet(depot, count=2, days=5)
+        result = bulk_recalculate_all_trains(depot.id)
+
+        assert result['depot_id'] == depot.id
+        assert result['total_trains'] == 2
+        assert result['total_updated'] == 10
+        assert {r['train_id'] for r in result['results']} == {t.id for t in trains}
+
+
+@pytest.mark.django_db
+class TestParallelFleetRecalculation:
+    """Тесты параллельного пересчета парка частями."""
+
+    def _create_trains(self, depot, days_by_train):
+        trains = []
+        for n, days in enumerate(days_by_train):
+            train = Train.objects.create(name=f'PART-{n}', type='Ласточка', depot=depot)
+            TrainDailyRecord.objects.bulk_create([
+                TrainDailyRecord(
+                    train=train,
+                    record_date=date.today() - timedelta(days=days - 1 - i),
+                    total_mileage=30000 + i * 300,
+                    daily_mileage=300
+                )
+                for i in range(days)
+            ])
+            trains.append(train)
+        return trains
+
+    def test_partitions_are_balanced(self, depot):
+        """Части получают близкое число записей."""
+        trains = self._create_trains(depot, [40, 30, 20, 20, 10])
+        sizes = {train.id: days for train, days in zip(trains, [40, 30, 20, 20, 10])}
+
+        with mock.patch.object(BulkCalculationService, 'PARTITION_MIN_RECORDS', 1):
+            parts = BulkCalculationService.partition_fleet(date.today() - timedelta(days=30), date.today(), 2)
+
+        loads = sorted(sum(sizes[train_id] for train_id in part) for part in parts)
+        assert loads == [60, 60]
+        assert sorted(train_id for part in parts for train_id in part) == sorted(sizes)
+
+    def test_small_fleet_is_not_split(self, depot):
+        """Небольшой парк пересчитывается одной частью."""
+        trains = self._create_trains(depot, [5, 5])
+
+        parts = BulkCalculationService.partition_fleet(date.today() - timedelta(days=30), date.today(), 4)
+
+        assert len(parts) == 1
+        assert sorted(parts[0]) == sorted(t.id for t in trains)
+
+    def test_chord_result_matches_serial_shape(self, depot):
+        """Результат chord совпадает по формату с последовательным пересчетом."""
+        trains = self._create_trains(depot, [12, 8, 6])
+
+        with mock.patch.object(BulkCalculationService, 'PARTITION_MIN_RECORDS', 1), \
+                mock.patch.object(BulkCalculationService, 'recalculate_fleet',
+                                  wraps=BulkCalculationService.recalculate_fleet) as recalculate:
+            result = bulk_recalculate_all_trains.delay(depot.id, partitions=3).get()
+
+        assert recalculate.call_count == 3
+        assert result['depot_id'] == depot.id
+        assert result['total_trains'] == 3
+        assert result['total_updated'] == 26
+        assert [r['train_name'] for r in result['results']] == [t.name for t in trains]
+        assert TrainDailyRecord.objects.filter(avg_mileage=300.0).count() == 26
+
+
+@pytest.mark.django_db
+class TestForwardPropagation:
+    """Тесты распространения правки исторической записи на последующие дни."""
+
+    def _create_chain(self, train, days=10):
+        base_date = date.today() - timedelta(days=days - 1)
+        return [
+            TrainDailyRecord.objects.create(
+                train=train,
+                record_date=base_date + timedelta(days=i),
+                total_mileage=20000 + i * 100,
+                daily_mileage=100
+            )
+            for i in range(days)
+        ]
+
+    def test_track_change_keeps_earliest_date(self, train):
+        """Для поезда сохраняется самая ранняя измененная дата."""
+        changes = {}
+        day = date.today()
+        BulkCalculationService.track_change(changes, train.id, day, ['daily_mileage'])
+        BulkCalculationService.track_change(changes, train.id, day - timedelta(days=3), ['total_mileage'])
+        BulkCalculationService.track_change(changes, train.id, day - timedelta(days=1), ['total_mileage'])
+        BulkCalculationService.track_change(changes, train.id, day - timedelta(days=5), ['last_to_type'])
+
+        assert changes == {train.id: (day - timedelta(days=3), True)}
+
+    def test_api_total_correction_propagates(self, authenticated_client, train):
+        """Исправление общего пробега через API сдвигает все последующие дни."""
+        records = self._create_chain(train)
+        edited = records[3]
+
+        response = authenticated_client.patch(
+            f'/api/v1/records/{edited.id}/', {'total_mileage': 21300}, format='json'
+        )
+
+        assert response.status_code == 200
+        totals = list(
+            TrainDailyRecord.objects.filter(train=train).order_by('record_date').values_list('total_mileage', flat=True)
+        )
+        assert totals[:3] == [20000, 20100, 20200]
+        assert totals[3:] == [21300 + i * 100 for i in range(7)]
+
+    def test_api_daily_correction_propagates(self, authenticated_client, train):
+        """Исправление суточного пробега пересчитывает общий пробег от предыдущего дня."""
+        records = self._create_chain(train)
+
+        response = authenticated_client.patch(
+            f'/api/v1/records/{records[5].id}/', {'daily_mileage': 600}, format='json'
+        )
+
+        assert response.status_code == 200
+        totals = list(
+            TrainDailyRecord.objects.filter(train=train).order_by('record_date').values_list('total_mileage', flat=True)
+        )
+        assert totals[4] == 20400
+        assert totals[5] == 21000
+        assert totals[9] == 21400
+
+    def test_only_suffix_is_rewritten(self, train):
+        """Записи до исправленной даты не переписываются."""
+        records = self._create_chain(train)
+        changes = BulkCalculationService.track_change({}, train.id, records[6].record_date, ['total_mileage'])
+
+        report = BulkCalculationService.propagate_changes(changes)
+
+        assert report == {train.id: 4}
+        assert TrainDailyRecord.objects.get(id=records[5].id).avg_mileage is None
+
+    def test_import_update_existing_propagates(self, train):
+        """Импорт с обновлением существующих записей распространяет правку."""
+        records = self._create_chain(train)
+        df = pd.DataFrame([{
+            'train_name': train.name,
+            'record_date': records[2].record_date,
+            'total_mileage': 30000,
+            'daily_mileage': 100
+        }])
+
+        result = ExcelService._import_records(df, update_existing=True)
+
+        assert result['updated'] == 1
+        assert TrainDailyRecord.objects.get(id=records[9].id).total_mileage == 30700
+        assert TrainDailyRecord.objects.get(id=records[1].id).total_mileage == 20100
@@ -7,11 +7,14 @@
 '''
 import pytest
 from django.test import TestCase
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import date, timedelta
 from decimal import Decimal
 from apps.mileage_calculator.models import Depot, Train, TrainDailyRecord
 from apps.mileage_calculator.services.calculation_service import MileageCalculationService
+from apps.mileage_calculator.services.bulk_calculation_service import BulkCalculationService
+from apps.mileage_calculator.serializers import TrainDailyRecordCreateSerializer
 
 
 @pytest.mark.django_db
@@ -354,5 +357,67 @@ class TestIntegrationCalculations:
         assert record2.daily_mileage == -100  # Оставляем как есть
 
 
+
+@pytest.mark.django_db
+class TestAverageMileageWindow:
+    """Тесты расчета среднего пробега за период одним проходом."""
+    
+    def _create_records(self, train, days=120):
+        for i in range(days):
+            TrainDailyRecord.objects.create(
+                train=train,
+                record_date=date.today() - timedelta(days=days - 1 - i),
+                daily_mileage=0 if i % 5 == 0 else 300 + i,
+                total_mileage=100000 + i * 400
+            )
+    
+    def test_range_matches_per_record_average(self, train):
+        """Пакетный пересчет совпадает с формулой 6 для каждой даты."""
+        cache.clear()
+        self._create_records(train)
+        start_date = date.today() - timedelta(days=20)
+        
+        BulkCalculationService.recalculate_train(train, start_date, date.today())
+        
+        records = TrainDailyRecord.objects.filter(train=train, record_date__gte=start_date)
+        assert records.count() == 21
+        for record in records:
+            expected = MileageCalculationService.calculate_average_mileage(train, record.record_date)
+            assert record.avg_mileage == pytest.approx(expected, abs=0.01)
+    
+    def test_idle_days_excluded(self, train):
+        """Дни простоя не учитываются в среднем."""
+        TrainDailyRecord.objects.create(
+            train=train, record_date=date.today() - timedelta(days=1), total_mileage=1000, daily_mileage=0
+        )
+        record = TrainDailyRecord.objects.create(
+            train=train, record_date=date.today(), total_mileage=1400, daily_mileage=400
+        )
+        
+        BulkCalculationService.recalculate_train(train, date.today() - timedelta(days=1), date.today())
+        
+        record.refresh_from_db()
+        assert record.avg_mileage == 400.0
+    
+    def test_create_serializer_uses_bulk_calculation(self, train):
+        """Создание записи считает метрики пакетным расчетом, включая последующие дни."""
+        self._create_records(train, days=10)
+        TrainDailyRecord.objects.filter(train=train, record_date=date.today() - timedelta(days=3)).delete()
+        serializer = TrainDailyRecordCreateSerializer(data={
+            'train': train.id,
+            'record_date': date.today() - timedelta(days=3),
+            'total_mileage': 200000,
+            'daily_mileage': 600
+        })
+        assert serializer.is_valid(), serializer.errors
+        
+        record = serializer.save()
+        
+        assert record.total_mileage == 200000
+        assert record.avg_mileage > 0
+        # Последующие дни продолжают цепочку формулы 1 от новой записи
+        next_day = TrainDailyRecord.objects.get(train=train, record_date=date.today() - timedelta(days=2))
+        assert next_day.total_mileage == 200000 + next_day.daily_mileage
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
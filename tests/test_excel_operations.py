@@ -8,16 +8,21 @@
 import pytest
 import tempfile
 import os
+from unittest import mock
 from io import BytesIO
 from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APITestCase
 from rest_framework import status
 from datetime import date, timedelta
 import openpyxl
+import pandas as pd
 from openpyxl.workbook import Workbook
 from apps.mileage_calculator.models import Depot, Train, TrainDailyRecord
+from apps.mileage_calculator.services.excel_service import ExcelService
 
 
 class TestExcelTemplateGeneration(APITestCase):
@@ -85,6 +90,92 @@ class TestExcelExport(APITestCase):
             status.HTTP_200_OK,
             status.HTTP_404_NOT_FOUND
         ])
+    
+    def _load_workbook(self, response):
+        """Чтение книги из потокового ответа"""
+        return openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+    
+    def test_records_export_is_streamed(self):
+        """Экспорт записей отдается потоком из временного файла"""
+        train = Train.objects.create(name="EXPORT-1", type="Ласточка", depot=self.depot)
+        for i in range(25):
+            TrainDailyRecord.objects.create(
+                train=train,
+                record_date=date.today() - timedelta(days=i),
+                total_mileage=100000 + i,
+                daily_mileage=100
+            )
+        
+        response = self.client.get('/api/v1/records/export/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn('records.xlsx', response['Content-Disposition'])
+        worksheet = self._load_workbook(response)['Данные VSM']
+        rows = list(worksheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0][:2], ('Поезд', 'Тип поезда'))
+        self.assertEqual(len(rows), 26)
+    
+    def test_export_reads_queryset_in_chunks(self):
+        """Экспорт читает записи пакетами курсора"""
+        train = Train.objects.create(name="EXPORT-2", type="Ласточка", depot=self.depot)
+        for i in range(7):
+            TrainDailyRecord.objects.create(
+                train=train, record_date=date.today() - timedelta(days=i), total_mileage=i, daily_mileage=1
+            )
+        
+        with mock.patch.object(ExcelService, 'EXPORT_CHUNK_SIZE', 3):
+            response = ExcelService.export_to_excel(TrainDailyRecord.objects.order_by('record_date'))
+        
+        rows = list(self._load_workbook(response).active.iter_rows(values_only=True))
+        self.assertEqual([row[4] for row in rows[1:]], [6, 5, 4, 3, 2, 1, 0])
+    
+    def _export_record(self):
+        train = Train.objects.create(name="EXPORT-FULL-TRAIN", type="Сапсан", depot=self.depot)
+        return TrainDailyRecord.objects.create(
+            train=train,
+            record_date=date.today(),
+            total_mileage=120000,
+            daily_mileage=500,
+            last_to_mileage=100000,
+            last_to_date=date.today() - timedelta(days=10)
+        )
+    
+    def test_export_full_columns(self):
+        """Экспорт содержит все колонки EXPORT_COLUMNS с расчетными полями"""
+        self._export_record()
+        
+        response = ExcelService.export_to_excel(TrainDailyRecord.objects.all())
+        
+        worksheet = self._load_workbook(response).active
+        header, row = list(worksheet.iter_rows(values_only=True))
+        self.assertEqual(list(header), [title for _, title in ExcelService.EXPORT_COLUMNS])
+        values = dict(zip(header, row))
+        self.assertEqual(values['Депо'], 'Test Depot')
+        self.assertEqual(values['Тип поезда'], 'Сапсан')
+        self.assertEqual(values['Пробег с последнего ТО'], 20000)
+        self.assertEqual(values['Дней с последнего ТО'], 10)
+        self.assertTrue(worksheet['A1'].font.b)
+        self.assertEqual(worksheet.column_dimensions['A'].width, len('EXPORT-FULL-TRAIN') + 2)
+    
+    def test_export_without_calculations(self):
+        """Расчетные колонки пропускаются, если они не запрошены"""
+        self._export_record()
+        
+        response = ExcelService.export_to_excel(TrainDailyRecord.objects.all(), include_calculations=False)
+        
+        header = next(self._load_workbook(response).active.iter_rows(values_only=True))
+        self.assertNotIn('Пробег с последнего ТО', header)
+        self.assertNotIn('Средний пробег', header)
+        self.assertEqual(len(header), len(ExcelService.EXPORT_COLUMNS) - len(ExcelService.CALCULATED_EXPORT_FIELDS))
+    
+    def test_export_xls_falls_back_to_xlsx(self):
+        """Формат xls выгружается как xlsx"""
+        response = ExcelService.export_to_excel(
+            TrainDailyRecord.objects.all(), filename='vsm_data.xls', format='xls'
+        )
+        
+        self.assertIn('vsm_data.xlsx', response['Content-Disposition'])
 
 
 class TestExcelPerformance(APITestCase):
@@ -104,6 +195,204 @@ class TestExcelPerformance(APITestCase):
         # Базовый тест без реальной обработки файлов пока что
         self.assertTrue(True, "Тест производительности требует реализации")
 
+class TestExcelImportPipeline(TestCase):
+    """Тесты пакетного импорта записей из Excel"""
+    
+    def setUp(self):
+        """Настройка тестового окружения"""
+        self.depot = Depot.objects.create(name="Test Depot")
+        self.trains = [
+            Train.objects.create(name=f"IMPORT-{n}", type="Ласточка", depot=self.depot)
+            for n in range(3)
+        ]
+        self.base_date = date.today() - timedelta(days=99)
+    
+    def _workbook(self, rows):
+        """Excel файл из списка строк"""
+        buffer = BytesIO()
+        pd.DataFrame(rows).to_excel(buffer, index=False)
+        buffer.seek(0)
+        return buffer
+    
+    def _rows(self, days=100):
+        return [
+            {
+                'Поезд': train.name,
+                'Дата': self.base_date + timedelta(days=i),
+                'Общий пробег': 110000 + i * 100,
+                'Суточный пробег': 100,
+                'Пробег последнего ТО': 100000,
+                'Дата последнего ТО': self.base_date
+            }
+            for train in self.trains
+            for i in range(days)
+        ]
+    
+    def test_import_creates_records_with_derived_fields(self):
+        """Новые записи вставляются с рассчитанными полями"""
+        results = ExcelService.import_from_excel(self._workbook(self._rows()))
+        
+        self.assertEqual(results['created'], 300)
+        self.assertEqual(results['errors'], [])
+        record = TrainDailyRecord.objects.get(train=self.trains[0], record_date=self.base_date + timedelta(days=50))
+        self.assertEqual(record.mileage_since_to, 15000)
+        self.assertEqual(record.mileage_to_to, 10000)
+        self.assertEqual(record.days_since_to, 50)
+        self.assertEqual(record.indicator_color, 'yellow')
+    
+    def test_import_query_count_does_not_grow_with_rows(self):
+        """Число запросов не зависит от количества строк"""
+        with CaptureQueriesContext(connection) as context:
+            ExcelService.import_from_excel(self._workbook(self._rows()))
+        
+        self.assertLess(len(context.captured_queries), 30)
+    
+    def test_import_error_report(self):
+        """Ошибки строк сохраняют прежний формат"""
+        TrainDailyRecord.objects.create(
+            train=self.trains[0], record_date=self.base_date, total_mileage=1, daily_mileage=1
+        )
+        rows = [
+            {'Поезд': self.trains[0].name, 'Дата': self.base_date, 'Общий пробег': 100, 'Суточный пробег': 10},
+            {'Поезд': 'UNKNOWN', 'Дата': self.base_date, 'Общий пробег': 100, 'Суточный пробег': 10},
+            {'Поезд': self.trains[1].name, 'Дата': None, 'Общий пробег': 100, 'Суточный пробег': 10},
+            {'Поезд': self.trains[1].name, 'Дата': self.base_date, 'Общий пробег': 100, 'Суточный пробег': 10},
+        ]
+        
+        results = ExcelService.import_from_excel(self._workbook(rows))
+        
+        self.assertEqual(results['created'], 1)
+        self.assertEqual(results['total_processed'], 4)
+        self.assertEqual(results['errors'], [
+            f'Строка 1: запись для поезда "{self.trains[0].name}" на {self.base_date} уже существует',
+            'Строка 2: поезд "UNKNOWN" не найден',
+            'Строка 3: отсутствует дата записи',
+        ])
+    
+    def test_streaming_reader_yields_row_batches(self):
+        """Лист xlsx читается пакетами без загрузки целиком"""
+        rows = self._rows(days=10)
+        rows[4]['Суточный пробег'] = 'N/A'
+        
+        with mock.patch.object(pd, 'read_excel', side_effect=AssertionError('read_excel')):
+            chunks = list(ExcelService.iter_import_chunks(self._workbook(rows), 'xlsx', chunk_size=7))
+        
+        self.assertEqual([len(chunk) for chunk in chunks], [7, 7, 7, 7, 2])
+        self.assertEqual(chunks[1].index[0], 7)
+        self.assertTrue(pd.isna(chunks[0].loc[4, 'Суточный пробег']))
+        self.assertEqual(chunks[0].loc[0, 'Поезд'], self.trains[0].name)
+    
+    def test_streaming_import_with_skipped_rows(self):
+        """Потоковый импорт учитывает пропуск строк и сквозную нумерацию"""
+        buffer = BytesIO()
+        df = pd.DataFrame(self._rows(days=4))
+        df.loc[9, 'Поезд'] = 'UNKNOWN'
+        with pd.ExcelWriter(buffer) as writer:
+            df.to_excel(writer, index=False, startrow=2)
+        buffer.seek(0)
+        
+        results = ExcelService.import_from_excel(buffer, skip_rows=2, chunk_size=5)
+        
+        self.assertEqual(results['created'], 11)
+        self.assertEqual(results['total_processed'], 12)
+        self.assertEqual(results['errors'], ['Строка 10: поезд "UNKNOWN" не найден'])
+    
+    def test_import_update_existing(self):
+        """Существующие записи обновляются пакетно"""
+        ExcelService.import_from_excel(self._workbook(self._rows(days=5)))
+        rows = self._rows(days=5)
+        for row in rows:
+            row['Пробег последнего ТО'] = 105000
+        
+        results = ExcelService.import_from_excel(self._workbook(rows), update_existing=True)
+        
+        self.assertEqual(results['created'], 0)
+        self.assertEqual(results['updated'], 15)
+        self.assertEqual(
+            TrainDailyRecord.objects.filter(last_to_mileage=105000, mileage_since_to=5000).count(), 3
+        )
+
+
+class TestTabularFormats(APITestCase):
+    """Тесты импорта и экспорта CSV и Parquet"""
+    
+    def setUp(self):
+        """Настройка тестового окружения"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.depot = Depot.objects.create(name="Test Depot")
+        self.train = Train.objects.create(name="TABULAR-1", type="Финист", depot=self.depot)
+    
+    def _frame(self, days=25):
+        return pd.DataFrame([
+            {
+                'Поезд': self.train.name,
+                'Дата': (date.today() - timedelta(days=i)).isoformat(),
+                'Общий пробег': 50000 - i * 100,
+                'Суточный пробег': 100
+            }
+            for i in range(days)
+        ])
+    
+    def test_csv_import_in_chunks(self):
+        """CSV читается пакетами, номера строк сквозные"""
+        df = self._frame()
+        df.loc[21, 'Поезд'] = 'UNKNOWN'
+        buffer = BytesIO(df.to_csv(index=False).encode('utf-8'))
+        
+        results = ExcelService.import_from_csv(buffer, chunk_size=10)
+        
+        self.assertEqual(results['created'], 24)
+        self.assertEqual(results['total_processed'], 25)
+        self.assertEqual(results['errors'], ['Строка 22: поезд "UNKNOWN" не найден'])
+    
+    def test_parquet_import(self):
+        """Parquet импортируется пакетами строк"""
+        buffer = BytesIO()
+        self._frame().to_parquet(buffer, index=False)
+        buffer.seek(0)
+        buffer.name = 'records.parquet'
+        
+        results = ExcelService.import_from_file(buffer)
+        
+        self.assertEqual(results['created'], 25)
+        self.assertEqual(TrainDailyRecord.objects.filter(train=self.train).count(), 25)
+    
+    def test_csv_export_endpoint(self):
+        """Экспорт в CSV отдается потоком"""
+        ExcelService.import_from_csv(BytesIO(self._frame(days=3).to_csv(index=False).encode('utf-8')))
+        
+        response = self.client.get('/api/v1/records/export/', {'export_format': 'csv'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('records.csv', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('Поезд,Тип поезда,Депо,Дата'))
+    
+    def test_parquet_export_roundtrip(self):
+        """Экспорт в Parquet читается обратно с колонками EXPORT_COLUMNS"""
+        ExcelService.import_from_csv(BytesIO(self._frame(days=5).to_csv(index=False).encode('utf-8')))
+        
+        response = ExcelService.export_data(
+            TrainDailyRecord.objects.order_by('record_date'), format='parquet', include_calculations=False
+        )
+        
+        df = pd.read_parquet(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(df), 5)
+        self.assertEqual(list(df.columns), [header for _, header in ExcelService.get_export_columns(False)])
+        self.assertEqual(df['Общий пробег'].tolist(), [49600, 49700, 49800, 49900, 50000])
+    
+    def test_unsupported_export_format(self):
+        """Неизвестный формат экспорта отклоняется"""
+        response = self.client.get('/api/v1/records/export/', {'export_format': 'docx'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 if __name__ == '__main__':
     pytest.main([
         __file__,
@@ -0,0 +1,183 @@
+'''
+Тесты фоновых задач экспорта.
+'''
+import pytest
+from io import BytesIO
+from datetime import date, timedelta
+import openpyxl
+from django.utils import timezone
+from apps.mileage_calculator.models import Train, TrainDailyRecord, ExportJob
+from apps.mileage_calculator.services.export_job_service import ExportJobService
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Файлы экспорта сохраняются во временный каталог."""
+    settings.MEDIA_ROOT = tmp_path
+
+
+@pytest.fixture
+def records(train):
+    return [
+        TrainDailyRecord.objects.create(
+            train=train,
+            record_date=date.today() - timedelta(days=i),
+            total_mileage=70000 - i * 200,
+            daily_mileage=200
+        )
+        for i in range(5)
+    ]
+
+
+@pytest.mark.django_db
+class TestExportJobService:
+    """Тесты нормализации фильтров экспорта."""
+
+    def test_filters_hash_ignores_order_and_duplicates(self):
+        """Порядок и повторы ID не меняют ключ экспорта."""
+        first = ExportJobService.normalize_filters({'train_ids': [3, 1, 3], 'format': 'xls'})
+        second = ExportJobService.normalize_filters({'train_ids': [1, 3], 'format': 'xlsx'})
+
+        assert first == second
+        assert ExportJobService.filters_hash(first) == ExportJobService.filters_hash(second)
+
+    def test_different_filters_have_different_hash(self):
+        """Разные фильтры дают разные ключи."""
+        first = ExportJobService.normalize_filters({'train_ids': [1]})
+        second = ExportJobService.normalize_filters({'train_ids': [1], 'include_calculations': False})
+
+        assert ExportJobService.filters_hash(first) != ExportJobService.filters_hash(second)
+
+    def test_stale_active_job_is_failed(self, train, records, settings):
+        """Зависшая задача отмечается ошибкой, вместо нее ставится новая."""
+        settings.EXPORT_JOB_STALE_TIMEOUT = 600
+        stale = ExportJobService.request_export({'train_ids': [train.id]})
+        ExportJob.objects.filter(id=stale.id).update(created_at=timezone.now() - timedelta(seconds=601))
+
+        job = ExportJobService.request_export({'train_ids': [train.id]})
+
+        assert job.id != stale.id
+        stale.refresh_from_db()
+        assert stale.status == ExportJob.STATUS_FAILED
+        assert stale.error_message
+
+    def test_recent_active_job_is_reused(self, train, records, settings):
+        """Задача моложе таймаута возвращается повторному запросу."""
+        settings.EXPORT_JOB_STALE_TIMEOUT = 600
+        first = ExportJobService.request_export({'train_ids': [train.id]})
+        ExportJob.objects.filter(id=first.id).update(
+            status=ExportJob.STATUS_RUNNING, started_at=timezone.now() - timedelta(seconds=60)
+        )
+
+        assert ExportJobService.request_export({'train_ids': [train.id]}).id == first.id
+
+    def test_fingerprint_tracks_train_and_depot_names(self, train, records):
+        """Переименование депо и массовая смена типа поезда меняют отпечаток."""
+        queryset = ExportJobService.build_queryset({'train_ids': [train.id]})
+        initial, _ = ExportJobService.data_fingerprint(queryset)
+
+        train.depot.name = 'Новое депо'
+        train.depot.save()
+        renamed, _ = ExportJobService.data_fingerprint(queryset)
+        Train.objects.filter(id=train.id).update(type='Финист')
+        retyped, _ = ExportJobService.data_fingerprint(queryset)
+
+        assert len({initial, renamed, retyped}) == 3
+
+
+@pytest.mark.django_db
+class TestExportJobApi:
+    """Тесты API фонового экспорта."""
+
+    url = '/api/v1/records/export_jobs/'
+
+    def _request(self, client, capture, data):
+        with capture(execute=True):
+            return client.post(self.url, data, format='json')
+
+    def test_export_job_lifecycle(self, authenticated_client, train, records, django_capture_on_commit_callbacks):
+        """Задача ставится, выполняется и отдает файл."""
+        response = self._request(authenticated_client, django_capture_on_commit_callbacks, {'train_ids': [train.id]})
+
+        assert response.status_code == 202
+        job_id = response.data['id']
+
+        response = authenticated_client.get(f'{self.url}{job_id}/')
+        assert response.data['status'] == 'completed'
+        assert response.data['rows_count'] == 5
+        assert response.data['download_url'].endswith(f'/records/export_jobs/{job_id}/download/')
+
+        response = authenticated_client.get(f'{self.url}{job_id}/download/')
+        assert response.status_code == 200
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+        assert workbook.active.max_row == 6
+
+    def test_repeat_request_reuses_artifact(self, authenticated_client, train, records, django_capture_on_commit_callbacks):
+        """Повторный запрос с теми же фильтрами отдает готовый файл."""
+        first = self._request(authenticated_client, django_capture_on_commit_callbacks, {'train_ids': [train.id, train.id]})
+        second = self._request(authenticated_client, django_capture_on_commit_callbacks, {'train_ids': [train.id]})
+
+        assert second.status_code == 200
+        assert second.data['id'] == first.data['id']
+        assert ExportJob.objects.count() == 1
+
+    def test_changed_records_invalidate_artifact(self, authenticated_client, train, records, django_capture_on_commit_callbacks):
+        """Изменение выгружаемых записей приводит к новой выгрузке."""
+        first = self._request(authenticated_client, django_capture_on_commit_callbacks, {'train_ids': [train.id]})
+        old_job = ExportJob.objects.get(id=first.data['id'])
+        old_file_name = old_job.file.name
+        TrainDailyRecord.objects.create(
+            train=train, record_date=date.today() - timedelta(days=10), total_mileage=60000, daily_mileage=100
+        )
+
+        second = self._request(authenticated_client, django_capture_on_commit_callbacks, {'train_ids': [train.id]})
+
+        assert second.status_code == 202
+        assert second.data['id'] != first.data['id']
+        new_job = ExportJob.objects.get(id=second.data['id'])
+        assert new_job.rows_count == 6
+        assert not ExportJob.objects.filter(id=old_job.id).exists()
+        assert not new_job.file.storage.exists(old_file_name)
+
+    def test_download_before_ready(self, authenticated_client, train, records):
+        """Скачивание недоступно, пока файл не сформирован."""
+        response = authenticated_client.post(self.url, {'format': 'csv'}, format='json')
+
+        assert response.status_code == 202
+        response = authenticated_client.get(f'{self.url}{response.data["id"]}/download/')
+        assert response.status_code == 409
+        assert response.data['status'] == 'pending'
+
+    def test_csv_artifact(self, authenticated_client, train, records, django_capture_on_commit_callbacks):
+        """Экспорт в CSV сохраняется с колонками EXPORT_COLUMNS."""
+        response = self._request(
+            authenticated_client, django_capture_on_commit_callbacks, {'format': 'csv', 'include_calculations': False}
+        )
+
+        response = authenticated_client.get(f'{self.url}{response.data["id"]}/download/')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        assert len(lines) == 6
+        assert 'Средний пробег' not in lines[0]
+
+    def test_export_excel_action(self, authenticated_client, train, records, django_capture_on_commit_callbacks):
+        """records/export_excel/ ставит задачу, а повторный запрос отдает готовый файл."""
+        url = '/api/v1/records/export_excel/'
+        with django_capture_on_commit_callbacks(execute=True):
+            first = authenticated_client.post(url, {'train_ids': [train.id]}, format='json')
+
+        assert first.status_code == 202
+        assert ExportJob.objects.get(id=first.data['id']).rows_count == 5
+
+        second = authenticated_client.post(url, {'train_ids': [train.id]}, format='json')
+
+        assert second.status_code == 200
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(second.streaming_content)))
+        assert workbook.active.max_row == 6
+        assert ExportJob.objects.count() == 1
+
+    def test_export_excel_action_validates_filters(self, authenticated_client):
+        """records/export_excel/ проверяет фильтры экспорта."""
+        response = authenticated_client.post('/api/v1/records/export_excel/', {'format': 'pdf'}, format='json')
+
+        assert response.status_code == 400
+        assert 'format' in response.data
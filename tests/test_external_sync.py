@@ -0,0 +1,298 @@
+'''
+Тесты пакетной синхронизации пробега с внешним API.
+'''
+import json
+import threading
+import pytest
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from apps.mileage_calculator.models import Train, TrainDailyRecord
+from apps.mileage_calculator.services.external_mileage_client import ExternalMileageClient
+from apps.mileage_calculator.services.mileage_gap_service import MileageGapService
+from apps.mileage_calculator.tasks import sync_fleet_mileage, daily_mileage_sync, backfill_mileage_gaps
+
+
+class StubMileageApi(ThreadingHTTPServer):
+    """Локальный HTTP-сервер вместо EXTERNAL_API_URL."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubMileageHandler)
+        self.lock = threading.Lock()
+        self.batch_enabled = False
+        self.batch_requests = []
+        self.responses = {}
+        self.failures = {}
+        self.requests = []
+        self.connections = set()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StubMileageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        train_name = params.get('train_id')
+        with server.lock:
+            server.requests.append(params)
+            server.connections.add(self.client_address)
+            failures = server.failures.get(train_name, 0)
+            if failures:
+                server.failures[train_name] = failures - 1
+
+        if failures:
+            self._send(503, {'error': 'unavailable'})
+        elif train_name in server.responses:
+            self._send(200, server.responses[train_name])
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if not server.batch_enabled or urlparse(self.path).path != '/mileage/batch':
+            self._send(404, {'error': 'not found'})
+            return
+
+        items = json.loads(body)['items']
+        with server.lock:
+            server.batch_requests.append(items)
+        results = [
+            {'train_id': item['train_id'], 'date': item['date'], **server.responses[item['train_id']]}
+            for item in items
+            if item['train_id'] in server.responses
+        ]
+        self._send(200, {'results': results})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api(settings):
+    server = StubMileageApi()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.EXTERNAL_API_URL = server.url
+    settings.EXTERNAL_API_MAX_WORKERS = 4
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fleet(depot):
+    return [
+        Train.objects.create(name=f'SYNC-{i:02d}', type='Ласточка', depot=depot, is_manual_mileage=False)
+        for i in range(12)
+    ]
+
+
+@pytest.mark.django_db
+class TestExternalMileageClient:
+    """Тесты клиента внешнего API."""
+
+    def test_not_found_returns_none(self, stub_api):
+        """Ответ 404 означает отсутствие данных."""
+        with ExternalMileageClient(backoff_factor=0) as client:
+            assert client.fetch_mileage('UNKNOWN', 'Depot', date.today()) is None
+
+    def test_retry_after_server_error(self, stub_api):
+        """Временная ошибка сервера повторяется в пределах бюджета."""
+        stub_api.responses['T-1'] = {'daily_mileage': 300}
+        stub_api.failures['T-1'] = 2
+
+        with ExternalMileageClient(backoff_factor=0, retry_budget=5) as client:
+            assert client.fetch_mileage('T-1', 'Depot', date.today()) == {'daily_mileage': 300}
+            assert client.retry_budget.used == 2
+
+    def test_retry_budget_is_shared(self, stub_api, fleet):
+        """Исчерпанный бюджет повторов не дает повторять остальные запросы."""
+        for train in fleet:
+            stub_api.failures[train.name] = 1
+            stub_api.responses[train.name] = {'daily_mileage': 100}
+
+        with ExternalMileageClient(backoff_factor=0, retry_budget=3) as client:
+            results = client.fetch_fleet(fleet, date.today())
+
+        statuses = [result['status'] for result in results.values()]
+        assert statuses.count('success') == 3
+        assert statuses.count('error') == len(fleet) - 3
+
+    def test_connections_are_pooled(self, stub_api, fleet):
+        """Число соединений ограничено числом потоков, соединения переиспользуются."""
+        for train in fleet:
+            stub_api.responses[train.name] = {'daily_mileage': 100}
+
+        with ExternalMileageClient(max_workers=3) as client:
+            client.fetch_fleet(fleet, date.today())
+            client.fetch_fleet(fleet, date.today())
+
+        assert len(stub_api.requests) == 2 * len(fleet)
+        assert len(stub_api.connections) <= 3
+
+
+@pytest.mark.django_db
+class TestBatchEndpoint:
+    """Тесты пакетного метода внешнего API."""
+
+    def test_batch_requests_replace_single_calls(self, stub_api, fleet):
+        """Пары (поезд, дата) отправляются пачками без одиночных запросов."""
+        stub_api.batch_enabled = True
+        for train in fleet[:8]:
+            stub_api.responses[train.name] = {'daily_mileage': 100}
+        dates = [date.today() - timedelta(days=1), date.today()]
+
+        with ExternalMileageClient(batch_size=10) as client:
+            results = client.fetch_many((train, day) for train in fleet for day in dates)
+
+        assert sorted(len(items) for items in stub_api.batch_requests) == [4, 10, 10]
+        assert stub_api.requests == []
+        assert results[(fleet[0].id, dates[0])] == {'status': 'success', 'data': {
+            'train_id': fleet[0].name, 'date': dates[0].isoformat(), 'daily_mileage': 100
+        }}
+        assert results[(fleet[11].id, dates[1])] == {'status': 'not_found'}
+
+    def test_falls_back_to_single_calls(self, stub_api, fleet):
+        """Без пакетного метода клиент переходит на одиночные запросы."""
+        for train in fleet:
+            stub_api.responses[train.name] = {'daily_mileage': 100}
+
+        with ExternalMileageClient(batch_size=5) as client:
+            results = client.fetch_fleet(fleet, date.today())
+            assert client.batch_supported is False
+
+        assert len(stub_api.requests) == len(fleet)
+        assert all(result['status'] == 'success' for result in results.values())
+
+    def test_sync_uses_batch_endpoint(self, stub_api, fleet):
+        """Синхронизация парка обходится одним HTTP-запросом."""
+        stub_api.batch_enabled = True
+        for train in fleet:
+            stub_api.responses[train.name] = {'daily_mileage': 150}
+
+        result = sync_fleet_mileage(date.today().isoformat())
+
+        assert result['created'] == len(fleet)
+        assert len(stub_api.batch_requests) == 1
+        assert stub_api.requests == []
+
+
+@pytest.mark.django_db
+class TestSyncFleetMileage:
+    """Тесты пакетной синхронизации парка."""
+
+    def test_creates_records_for_fleet(self, stub_api, fleet):
+        """Записи создаются по данным API с переносом общего пробега."""
+        target_date = date.today()
+        TrainDailyRecord.objects.create(
+            train=fleet[0], record_date=target_date - timedelta(days=3), total_mileage=50000,
+            daily_mileage=400, last_to_type='ТО-2'
+        )
+        for train in fleet[:10]:
+            stub_api.responses[train.name] = {'daily_mileage': 500}
+
+        result = sync_fleet_mileage(target_date.isoformat())
+
+        assert result['total_trains'] == len(fleet)
+        assert result['created'] == 10
+        statuses = {item['train_name']: item['status'] for item in result['results']}
+        assert statuses['SYNC-11'] == 'not_found'
+
+        record = TrainDailyRecord.objects.get(train=fleet[0], record_date=target_date)
+        assert record.total_mileage == 50500
+        assert record.last_to_type == 'ТО-2'
+        assert record.avg_mileage is not None
+        assert TrainDailyRecord.objects.filter(record_date=target_date).count() == 10
+
+    def test_skips_existing_and_manual(self, stub_api, fleet, train_manual):
+        """Поезда с записью на дату и с ручным вводом не запрашиваются."""
+        target_date = date.today()
+        TrainDailyRecord.objects.create(train=fleet[0], record_date=target_date, total_mileage=1000, daily_mileage=100)
+
+        result = sync_fleet_mileage(target_date.isoformat())
+
+        requested = {params['train_id'] for params in stub_api.requests}
+        assert result['total_trains'] == len(fleet) - 1
+        assert fleet[0].name not in requested
+        assert train_manual.name not in requested
+
+    def test_daily_sync_uses_batch_mode(self, stub_api, fleet):
+        """Ежедневная синхронизация выполняется одним пакетом."""
+        for train in fleet:
+            stub_api.responses[train.name] = {'daily_mileage': 200, 'total_mileage': 10200}
+
+        result = daily_mileage_sync()
+
+        assert result['created'] == len(fleet)
+        assert TrainDailyRecord.objects.filter(record_date=date.today(), total_mileage=10200).count() == len(fleet)
+
+
+@pytest.mark.django_db
+class TestBackfillMileageGaps:
+    """Тесты дозагрузки пропущенных дней."""
+
+    def _history(self, train, offsets, base=100000):
+        today = date.today()
+        for offset in offsets:
+            TrainDailyRecord.objects.create(
+                train=train, record_date=today - timedelta(days=offset),
+                total_mileage=base + (10 - offset) * 100, daily_mileage=100
+            )
+
+    def test_find_missing_days(self, train, train_manual):
+        """Пропуски ищутся после первой записи и только у автоматических поездов."""
+        today = date.today()
+        self._history(train, [5, 4, 1])
+        self._history(train_manual, [5])
+
+        missing = MileageGapService.find_missing_days(today - timedelta(days=7), today)
+
+        assert missing == [
+            (train.id, today - timedelta(days=3)),
+            (train.id, today - timedelta(days=2)),
+            (train.id, today),
+        ]
+
+    def test_backfill_fills_gaps_and_recalculates(self, stub_api, train):
+        """Пропуски заполняются по порядку дат, хвост истории пересчитывается."""
+        today = date.today()
+        self._history(train, [5, 4, 1])
+        stub_api.responses[train.name] = {'daily_mileage': 250}
+
+        result = backfill_mileage_gaps(end_date=(today - timedelta(days=1)).isoformat(), days=7)
+
+        assert result['missing'] == 2
+        assert result['created'] == 2
+        totals = dict(
+            TrainDailyRecord.objects.filter(train=train).values_list('record_date', 'total_mileage')
+        )
+        assert totals[today - timedelta(days=3)] == 100850
+        assert totals[today - timedelta(days=2)] == 101100
+        assert totals[today - timedelta(days=1)] == 101200
+
+    def test_backfill_keeps_unavailable_days_missing(self, stub_api, train):
+        """Дни, которых нет в API, остаются пропусками."""
+        self._history(train, [3])
+
+        result = backfill_mileage_gaps(days=5)
+
+        assert result['missing'] == 3
+        assert result['created'] == 0
+        assert result['failed'] == 3
+        assert TrainDailyRecord.objects.filter(train=train).count() == 1
@@ -0,0 +1,147 @@
+'''
+Тесты фоновых задач импорта.
+'''
+import pytest
+from unittest import mock
+from datetime import date, timedelta
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from apps.mileage_calculator.models import TrainDailyRecord, ImportJob
+from apps.mileage_calculator.services.excel_service import ExcelService
+from apps.mileage_calculator.tasks import process_import_job
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Загруженные файлы сохраняются во временный каталог."""
+    settings.MEDIA_ROOT = tmp_path
+
+
+def _csv_upload(train, rows=30, name='records.csv'):
+    df = pd.DataFrame([
+        {
+            'Поезд': train.name,
+            'Дата': (date.today() - timedelta(days=i)).isoformat(),
+            'Общий пробег': 90000 - i * 100,
+            'Суточный пробег': 100
+        }
+        for i in range(rows)
+    ])
+    return SimpleUploadedFile(name, df.to_csv(index=False).encode('utf-8'), content_type='text/csv')
+
+
+@pytest.mark.django_db
+class TestImportJobApi:
+    """Тесты API фонового импорта."""
+
+    def test_upload_and_poll(self, authenticated_client, train, django_capture_on_commit_callbacks):
+        """Файл сохраняется, задача выполняется, прогресс доступен по ID."""
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_client.post(
+                '/api/v1/records/import_jobs/', {'file': _csv_upload(train)}, format='multipart'
+            )
+
+        assert response.status_code == 202
+        assert response.data['format'] == 'csv'
+
+        response = authenticated_client.get(f'/api/v1/records/import_jobs/{response.data["id"]}/')
+
+        assert response.status_code == 200
+        assert response.data['status'] == 'completed'
+        assert response.data['rows_read'] == 30
+        assert response.data['created_count'] == 30
+        assert response.data['errors_count'] == 0
+        assert TrainDailyRecord.objects.filter(train=train).count() == 30
+
+    def test_rejects_unknown_extension(self, authenticated_client):
+        """Файлы неподдерживаемых форматов отклоняются."""
+        upload = SimpleUploadedFile('records.txt', b'data')
+        response = authenticated_client.post('/api/v1/records/import_jobs/', {'file': upload}, format='multipart')
+
+        assert response.status_code == 400
+        assert 'file' in response.data
+
+    def test_requires_authentication(self, api_client):
+        """Задачи импорта доступны только авторизованным пользователям."""
+        response = api_client.get('/api/v1/records/import_jobs/')
+        assert response.status_code in [401, 403]
+
+    def test_import_excel_action_starts_job(self, authenticated_client, train, django_capture_on_commit_callbacks):
+        """records/import_excel/ ставит фоновую задачу импорта."""
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_client.post(
+                '/api/v1/records/import_excel/', {'file': _csv_upload(train, rows=5)}, format='multipart'
+            )
+
+        assert response.status_code == 202
+        job = ImportJob.objects.get(pk=response.data['id'])
+        assert job.status == ImportJob.STATUS_COMPLETED
+        assert job.created_count == 5
+        assert TrainDailyRecord.objects.filter(train=train).count() == 5
+
+    def test_import_excel_action_rejects_unknown_extension(self, authenticated_client):
+        """records/import_excel/ проверяет файл так же, как import_jobs/."""
+        upload = SimpleUploadedFile('records.txt', b'data')
+        response = authenticated_client.post('/api/v1/records/import_excel/', {'file': upload}, format='multipart')
+
+        assert response.status_code == 400
+        assert 'file' in response.data
+        assert not ImportJob.objects.exists()
+
+
+@pytest.mark.django_db
+class TestProcessImportJob:
+    """Тесты задачи process_import_job."""
+
+    def _failing_import(self, fail_on_call):
+        real_import = ExcelService.import_dataframe
+        calls = []
+
+        def import_dataframe(df, update_existing=False):
+            calls.append(len(df))
+            if len(calls) == fail_on_call:
+                raise RuntimeError('сбой базы данных')
+            return real_import(df, update_existing)
+
+        return import_dataframe
+
+    def _run(self, train, partial_commit):
+        job = ImportJob.objects.create(file=_csv_upload(train), format='csv', partial_commit=partial_commit)
+        with mock.patch.object(ExcelService, 'IMPORT_CHUNK_SIZE', 10), \
+                mock.patch.object(ExcelService, 'import_dataframe', side_effect=self._failing_import(3)):
+            process_import_job(job.id)
+        job.refresh_from_db()
+        return job
+
+    def test_partial_commit_keeps_imported_chunks(self, train):
+        """В режиме частичной фиксации сбой не откатывает предыдущие пакеты."""
+        job = self._run(train, partial_commit=True)
+
+        assert job.status == 'failed'
+        assert 'сбой базы данных' in job.error_message
+        assert job.created_count == 20
+        assert TrainDailyRecord.objects.filter(train=train).count() == 20
+
+    def test_atomic_import_rolls_back(self, train):
+        """Без частичной фиксации сбой откатывает весь импорт."""
+        job = self._run(train, partial_commit=False)
+
+        assert job.status == 'failed'
+        assert job.created_count == 0
+        assert TrainDailyRecord.objects.filter(train=train).count() == 0
+
+    def test_row_errors_are_stored(self, train):
+        """Ошибки строк сохраняются в задаче."""
+        df = pd.DataFrame([
+            {'Поезд': 'UNKNOWN', 'Дата': date.today().isoformat(), 'Общий пробег': 1, 'Суточный пробег': 1},
+            {'Поезд': train.name, 'Дата': date.today().isoformat(), 'Общий пробег': 1, 'Суточный пробег': 1},
+        ])
+        upload = SimpleUploadedFile('records.csv', df.to_csv(index=False).encode('utf-8'))
+        job = ImportJob.objects.create(file=upload, format='csv')
+
+        result = process_import_job(job.id)
+
+        job.refresh_from_db()
+        assert result['status'] == 'completed'
+        assert job.created_count == 1
+        assert job.errors == ['Строка 1: поезд "UNKNOWN" не найден']
@@ -0,0 +1,62 @@
+'''
+Тесты уведомлений о ТО.
+'''
+import pytest
+from datetime import date, timedelta
+from django.core.cache import cache
+from apps.mileage_calculator.models import Train, TrainDailyRecord
+from apps.mileage_calculator.services.maintenance_alert_service import MaintenanceAlertService
+from apps.mileage_calculator.tasks import generate_maintenance_alerts
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def fleet_records(depot):
+    """Записи на сегодня с разными днями и пробегом с последнего ТО."""
+    values = [(60, 24000), (50, 1000), (10, 23500), (5, 100)]
+    for n, (days_since_to, mileage_since_to) in enumerate(values):
+        train = Train.objects.create(name=f'ALERT-{n}', type='Ласточка', depot=depot)
+        TrainDailyRecord.objects.create(train=train, record_date=date.today(), total_mileage=50000, daily_mileage=300)
+    for n, (days_since_to, mileage_since_to) in enumerate(values):
+        TrainDailyRecord.objects.filter(train__name=f'ALERT-{n}').update(
+            days_since_to=days_since_to, mileage_since_to=mileage_since_to
+        )
+
+
+@pytest.mark.django_db
+class TestMaintenanceAlerts:
+    """Тесты формирования уведомлений о ТО."""
+
+    def test_alert_levels(self, depot, fleet_records):
+        """Уровни уведомлений совпадают с порогами дней и пробега."""
+        alerts = MaintenanceAlertService.build_alerts(date.today())
+
+        assert [(a['train'], a['type']) for a in alerts] == [
+            ('ALERT-0', 'critical_days'),
+            ('ALERT-0', 'critical_mileage'),
+            ('ALERT-1', 'warning_days'),
+            ('ALERT-2', 'critical_mileage'),
+        ]
+        assert alerts[0]['depot'] == depot.name
+        assert alerts[0]['priority'] == 'high'
+        assert alerts[2]['message'] == 'Предупреждение: 50 дней с последнего ТО'
+
+    def test_single_query(self, fleet_records, django_assert_num_queries):
+        """Уведомления строятся одним запросом независимо от размера парка."""
+        with django_assert_num_queries(1):
+            MaintenanceAlertService.build_alerts(date.today())
+
+    def test_alerts_are_stored_per_date(self, fleet_records, django_assert_num_queries):
+        """Задача сохраняет уведомления под ключом даты."""
+        result = generate_maintenance_alerts()
+
+        assert result['total_alerts'] == 4
+        with django_assert_num_queries(0):
+            assert len(MaintenanceAlertService.get_alerts(date.today())) == 4
+        assert MaintenanceAlertService.get_alerts(date.today() - timedelta(days=1)) == []
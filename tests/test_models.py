@@ -2,11 +2,13 @@
 Тесты моделей VSM Калькулятора пробега.
 """
 import pytest
+from django.core.cache import cache
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from datetime import date, timedelta
-from apps.mileage_calculator.models import Depot, Train, TrainDailyRecord
+from apps.mileage_calculator.models import Depot, Train, TrainDailyRecord, TrainTypeCache, TrainCurrentState
+from apps.mileage_calculator.services.bulk_calculation_service import BulkCalculationService
 
 
 @pytest.mark.django_db
@@ -333,5 +335,166 @@ class TestModelRelationships:
             assert train.depot == depot
 
 
+@pytest.mark.django_db
+class TestTrainDailyRecordSavePath:
+    """Тесты сохранения записей без ленивой загрузки поезда."""
+    
+    def test_save_by_train_id_without_train_query(self, train, django_assert_num_queries):
+        """Запись, созданная по train_id, не загружает поезд при сохранении."""
+        TrainTypeCache.get_type(train.id)
+        record = TrainDailyRecord(
+            train_id=train.id,
+            record_date=date.today(),
+            total_mileage=110000,
+            daily_mileage=500,
+            last_to_mileage=100000,
+            last_to_date=date.today() - timedelta(days=50)
+        )
+        
+        # Вставка записи и обновление текущего состояния поезда, без запроса к поезду
+        with django_assert_num_queries(2) as context:
+            record.save()
+        
+        assert not any('FROM "mileage_calculator_train"' in query['sql'] for query in context.captured_queries)
+        assert record.mileage_since_to == 10000
+        assert record.indicator_color == 'yellow'
+    
+    def test_save_with_pre_resolved_type(self, train, django_assert_num_queries):
+        """Тип поезда можно передать в save явно."""
+        TrainTypeCache.invalidate()
+        record = TrainDailyRecord(train_id=train.id, record_date=date.today(), total_mileage=1000)
+        
+        with django_assert_num_queries(2) as context:
+            record.save(train_type=train.type)
+        
+        assert not any('FROM "mileage_calculator_train"' in query['sql'] for query in context.captured_queries)
+    
+    def test_cache_invalidated_on_train_change(self, train):
+        """Изменение типа поезда сбрасывает кеш."""
+        assert TrainTypeCache.get_type(train.id) == 'Ласточка'
+        
+        train.type = 'Сапсан'
+        train.save()
+        
+        assert TrainTypeCache.get_type(train.id) == 'Сапсан'
+    
+    def test_cache_is_shared_between_processes(self, train):
+        """Типы хранятся в общем кеше Django, а не в памяти процесса."""
+        TrainTypeCache.get_type(train.id)
+        
+        version = cache.get(TrainTypeCache.VERSION_KEY)
+        assert cache.get(TrainTypeCache.cache_key(train.id), version=version) == 'Ласточка'
+        
+        # Другой процесс видит сброс через смену версии ключей
+        TrainTypeCache.invalidate()
+        assert cache.get(TrainTypeCache.VERSION_KEY) == version + 1
+        assert cache.get(TrainTypeCache.cache_key(train.id), version=version + 1) is None
+    
+    def test_cache_invalidated_on_api_bulk_update(self, authenticated_client, train):
+        """Массовое обновление поездов через API сбрасывает кеш типов."""
+        assert TrainTypeCache.get_type(train.id) == 'Ласточка'
+        
+        response = authenticated_client.post('/api/v1/trains/bulk_update/', {
+            'train_ids': [train.id],
+            'updates': {'type': 'Сапсан'}
+        }, format='json')
+        
+        assert response.status_code == 200
+        assert TrainTypeCache.get_type(train.id) == 'Сапсан'
+    
+    def test_bulk_save_with_calculations(self, train, train_manual, django_assert_max_num_queries):
+        """Пакетная вставка применяет те же расчеты, что и save."""
+        TrainTypeCache.invalidate()
+        records = [
+            TrainDailyRecord(
+                train_id=train_id,
+                record_date=date.today() - timedelta(days=i),
+                total_mileage=124000,
+                daily_mileage=500,
+                last_to_mileage=100000,
+                last_to_date=date.today() - timedelta(days=60)
+            )
+            for i in range(50)
+            for train_id in (train.id, train_manual.id)
+        ]
+        
+        # Один запрос типов поездов, пакеты INSERT (SQLite режет пакет по лимиту параметров)
+        # и одно обновление текущего состояния поездов
+        with django_assert_max_num_queries(6):
+            TrainDailyRecord.bulk_save_with_calculations(records)
+        
+        assert TrainDailyRecord.objects.count() == 100
+        assert TrainDailyRecord.objects.filter(
+            mileage_since_to=24000,
+            mileage_to_to=1000,
+            mileage_indicator_color='yellow'
+        ).count() == 100
+        assert TrainDailyRecord.objects.filter(
+            record_date=date.today(), days_since_to=60, indicator_color='red'
+        ).count() == 2
+
+
+@pytest.mark.django_db
+class TestTrainCurrentState:
+    """Тесты текущего состояния поезда."""
+    
+    def _record(self, train, days_ago, total_mileage):
+        return TrainDailyRecord.objects.create(
+            train=train,
+            record_date=date.today() - timedelta(days=days_ago),
+            total_mileage=total_mileage,
+            daily_mileage=300,
+            last_block_date=date.today() - timedelta(days=10)
+        )
+    
+    def test_newer_record_updates_state(self, train):
+        """Новая запись становится текущим состоянием, старая - нет."""
+        self._record(train, 2, 50000)
+        latest = self._record(train, 0, 50600)
+        self._record(train, 5, 49000)
+        
+        state = TrainCurrentState.objects.get(train=train)
+        assert state.latest_record_id == latest.id
+        assert state.total_mileage == 50600
+        assert train.latest_total_mileage == 50600
+        assert train.next_block_date == date.today() + timedelta(days=35)
+    
+    def test_latest_record_moved_back(self, train):
+        """Перенос последней записи на более раннюю дату перечитывает состояние."""
+        older = self._record(train, 2, 50000)
+        latest = self._record(train, 0, 50600)
+        
+        latest.record_date = date.today() - timedelta(days=4)
+        latest.save()
+        
+        assert TrainCurrentState.objects.get(train=train).latest_record_id == older.id
+    
+    def test_delete_latest_record(self, train):
+        """Удаление последней записи возвращает состояние к предыдущей."""
+        older = self._record(train, 2, 50000)
+        latest = self._record(train, 0, 50600)
+        
+        latest.delete()
+        assert TrainCurrentState.objects.get(train=train).latest_record_id == older.id
+        
+        older.delete()
+        assert not TrainCurrentState.objects.filter(train=train).exists()
+    
+    def test_bulk_paths_refresh_state(self, train):
+        """Пакетная вставка и пересчет обновляют состояние."""
+        TrainDailyRecord.bulk_save_with_calculations([
+            TrainDailyRecord(train_id=train.id, record_date=date.today() - timedelta(days=i),
+                             total_mileage=60000 - i * 300, daily_mileage=300)
+            for i in range(5)
+        ])
+        assert TrainCurrentState.objects.get(train=train).avg_mileage is None
+        
+        BulkCalculationService.recalculate_train(train)
+        
+        state = TrainCurrentState.objects.get(train=train)
+        assert state.record_date == date.today()
+        assert state.avg_mileage == 300.0
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v']) 
\ No newline at end of file
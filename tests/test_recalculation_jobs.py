@@ -0,0 +1,132 @@
+'''
+Тесты фоновых задач пересчета.
+'''
+import pytest
+from unittest import mock
+from datetime import date, timedelta
+from django.db import IntegrityError
+from django.utils import timezone
+from apps.mileage_calculator.models import TrainDailyRecord, RecalculationJob
+from apps.mileage_calculator.services.recalculation_job_service import RecalculationJobService
+
+
+@pytest.fixture
+def records(train):
+    return [
+        TrainDailyRecord.objects.create(
+            train=train,
+            record_date=date.today() - timedelta(days=4 - i),
+            total_mileage=40000 + i * 250,
+            daily_mileage=250
+        )
+        for i in range(5)
+    ]
+
+
+@pytest.mark.django_db
+class TestRecalculationJobService:
+    """Тесты постановки задач пересчета."""
+
+    def test_active_job_is_reused(self, train):
+        """Повторный запрос той же области присоединяется к активной задаче."""
+        first, first_created = RecalculationJobService.request_recalculation(train_ids=[train.id])
+        second, second_created = RecalculationJobService.request_recalculation(train_ids=[train.id])
+
+        assert first_created is True
+        assert second_created is False
+        assert second.id == first.id
+        assert first.scope == RecalculationJob.SCOPE_TRAIN
+
+    def test_finished_job_is_not_reused(self, train):
+        """После завершения задачи запрос ставит новую."""
+        first, _ = RecalculationJobService.request_recalculation(train_ids=[train.id])
+        first.mark_completed()
+
+        second, created = RecalculationJobService.request_recalculation(train_ids=[train.id])
+
+        assert created is True
+        assert second.id != first.id
+
+    def test_different_window_is_new_job(self, train):
+        """Другой период пересчета - отдельная задача."""
+        first, _ = RecalculationJobService.request_recalculation(train_ids=[train.id])
+        second, created = RecalculationJobService.request_recalculation(
+            train_ids=[train.id], start_date=date.today() - timedelta(days=7)
+        )
+
+        assert created is True
+        assert second.id != first.id
+
+    def test_stale_job_releases_dedup_key(self, train, settings):
+        """Зависшая задача отмечается ошибкой и не блокирует новый пересчет."""
+        settings.RECALCULATION_JOB_STALE_TIMEOUT = 600
+        stale, _ = RecalculationJobService.request_recalculation(train_ids=[train.id])
+        RecalculationJob.objects.filter(id=stale.id).update(
+            status=RecalculationJob.STATUS_RUNNING, started_at=timezone.now() - timedelta(seconds=601)
+        )
+
+        job, created = RecalculationJobService.request_recalculation(train_ids=[train.id])
+
+        assert created is True
+        assert job.id != stale.id
+        stale.refresh_from_db()
+        assert stale.status == RecalculationJob.STATUS_FAILED
+
+    def test_create_is_retried_after_conflict(self, train):
+        """Конфликт с задачей, завершившейся до повторного чтения, не приводит к ошибке."""
+        create = RecalculationJob.objects.create
+        with mock.patch.object(
+            RecalculationJob.objects, 'create', side_effect=[IntegrityError('conflict'), mock.DEFAULT], wraps=create
+        ):
+            job, created = RecalculationJobService.request_recalculation(train_ids=[train.id])
+
+        assert created is True
+        assert RecalculationJob.objects.filter(id=job.id).exists()
+
+
+@pytest.mark.django_db
+class TestRecalculationJobApi:
+    """Тесты запуска пересчета через API."""
+
+    def test_train_recalculate_runs_job(self, authenticated_client, train, records, django_capture_on_commit_callbacks):
+        """Пересчет поезда выполняется задачей, статус доступен по ID."""
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_client.post(f'/api/v1/trains/{train.id}/recalculate/', {}, format='json')
+
+        assert response.status_code == 202
+        assert response.data['deduplicated'] is False
+
+        response = authenticated_client.get(f'/api/v1/records/recalculation_jobs/{response.data["id"]}/')
+        assert response.data['status'] == 'completed'
+        assert response.data['updated_count'] == 5
+        assert TrainDailyRecord.objects.filter(train=train, avg_mileage=250.0).count() == 5
+
+    def test_repeated_click_attaches_to_running_job(self, authenticated_client, train, django_capture_on_commit_callbacks):
+        """Повторный запрос во время выполнения не ставит новую задачу."""
+        with django_capture_on_commit_callbacks() as callbacks:
+            first = authenticated_client.post('/api/v1/records/bulk_recalculate/', {'train_ids': [train.id]}, format='json')
+            second = authenticated_client.post('/api/v1/records/bulk_recalculate/', {'train_ids': [train.id]}, format='json')
+
+        assert second.data['id'] == first.data['id']
+        assert second.data['deduplicated'] is True
+        assert len(callbacks) == 1
+        assert RecalculationJob.objects.count() == 1
+
+    def test_depot_recalculate(self, authenticated_client, depot, train, records, django_capture_on_commit_callbacks):
+        """Пересчет депо охватывает его поезда."""
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_client.post(f'/api/v1/depots/{depot.id}/recalculate/', {}, format='json')
+
+        job = RecalculationJob.objects.get(id=response.data['id'])
+        assert job.scope == RecalculationJob.SCOPE_DEPOT
+        assert job.status == 'completed'
+        assert job.trains_count == 1
+
+    def test_invalid_period(self, authenticated_client, train):
+        """Начало периода позже конца отклоняется."""
+        response = authenticated_client.post(f'/api/v1/trains/{train.id}/recalculate/', {
+            'start_date': date.today().isoformat(),
+            'end_date': (date.today() - timedelta(days=1)).isoformat()
+        }, format='json')
+
+        assert response.status_code == 400
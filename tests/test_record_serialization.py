@@ -0,0 +1,89 @@
+"""
+Тесты облегченной сериализации больших списков записей.
+"""
+import pytest
+from io import StringIO
+from datetime import date, timedelta
+from django.core.management import call_command
+from rest_framework.renderers import JSONRenderer
+from apps.mileage_calculator import renderers
+from apps.mileage_calculator.models import TrainDailyRecord
+from apps.mileage_calculator.renderers import FastJSONRenderer
+from apps.mileage_calculator.serializers import TrainDailyRecordSerializer, TrainDailyRecordRowSerializer
+
+
+@pytest.fixture
+def records(train):
+    """Записи с заполненными датами, индикаторами и дробным средним пробегом."""
+    return [
+        TrainDailyRecord.objects.create(
+            train=train,
+            record_date=date.today() - timedelta(days=offset),
+            total_mileage=100000 + offset * 500,
+            daily_mileage=500,
+            last_to_date=date.today() - timedelta(days=40),
+            last_to_type='ТО-1',
+            last_block_date=date.today() - timedelta(days=20),
+            last_kp_measure_date=date.today() - timedelta(days=10)
+        )
+        for offset in range(5)
+    ]
+
+
+@pytest.mark.django_db
+class TestRecordRowSerializer:
+    """Тесты представления записей из строк values_list()."""
+
+    def test_rows_match_model_serializer(self, records):
+        """Тестирование: строки дают тот же JSON, что TrainDailyRecordSerializer."""
+        queryset = TrainDailyRecord.objects.order_by('-record_date')
+        fields = TrainDailyRecordSerializer.Meta.fields
+
+        expected = JSONRenderer().render(TrainDailyRecordSerializer(queryset, many=True).data)
+        rows = TrainDailyRecordRowSerializer.row_queryset(queryset, fields)
+        actual = FastJSONRenderer().render(TrainDailyRecordRowSerializer(rows, many=True).data)
+
+        assert actual == expected
+
+    def test_row_list_response_is_byte_identical(self, authenticated_client, records):
+        """Тестирование: ответ списка в представлении row совпадает побайтно."""
+        full = authenticated_client.get('/api/v1/records/?fields=id,train_name,next_block_date,created_at')
+        rows = authenticated_client.get('/api/v1/records/?fields=id,train_name,next_block_date,created_at&representation=row')
+
+        assert rows.status_code == 200
+        assert rows.content == full.content
+
+    def test_row_list_with_cursor_pagination(self, authenticated_client, records):
+        """Тестирование представления row вместе с keyset-пагинацией."""
+        first = authenticated_client.get('/api/v1/records/?representation=row&pagination=cursor&page_size=3').json()
+        second = authenticated_client.get(first['next']).json()
+
+        ids = [item['id'] for item in first['results'] + second['results']]
+        assert ids == [record.id for record in records]
+
+
+class TestFastJSONRenderer:
+    """Тесты рендерера на orjson."""
+
+    def test_same_output_as_json_renderer(self):
+        """Тестирование совпадения с JSONRenderer, включая не-ASCII и U+2028."""
+        data = {'name': 'Ласточка\u2028', 'values': [1, 2.5, None, True], 'date': date(2024, 1, 31)}
+
+        assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+    def test_fallback_without_orjson(self, monkeypatch):
+        """Тестирование работы без установленного orjson."""
+        monkeypatch.setattr(renderers, 'orjson', None)
+
+        assert FastJSONRenderer().render({'a': 'б'}) == JSONRenderer().render({'a': 'б'})
+
+
+@pytest.mark.django_db
+def test_benchmark_command():
+    """Тестирование команды сравнения сериализации."""
+    out = StringIO()
+
+    call_command('benchmark_record_serialization', rows=30, trains=4, repeat=1, stdout=out)
+
+    assert 'Вывод совпадает побайтно' in out.getvalue()
+    assert not TrainDailyRecord.objects.exists()
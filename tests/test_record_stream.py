@@ -0,0 +1,103 @@
+"""
+Тесты потоковой выгрузки ежедневных записей.
+"""
+import csv
+import io
+import json
+import pytest
+from datetime import date, timedelta
+from rest_framework import status
+from apps.mileage_calculator.models import Train, TrainDailyRecord
+
+
+@pytest.fixture
+def fleet_records(depot):
+    """Два поезда разных типов с записями за 10 дней."""
+    trains = [
+        Train.objects.create(name="Поезд 1", type="Ласточка", depot=depot),
+        Train.objects.create(name="Поезд 2", type="Финист", depot=depot)
+    ]
+    TrainDailyRecord.objects.bulk_create([
+        TrainDailyRecord(
+            train=train,
+            record_date=date.today() - timedelta(days=offset),
+            total_mileage=100000 + offset * 500,
+            daily_mileage=500
+        )
+        for train in trains
+        for offset in range(10)
+    ])
+    return trains
+
+
+def read_stream(response):
+    assert response.streaming
+    return b''.join(response.streaming_content).decode('utf-8')
+
+
+@pytest.mark.django_db
+class TestRecordStream:
+    """Тесты /api/v1/records/stream/."""
+
+    def test_stream_ndjson_with_filters(self, authenticated_client, fleet_records):
+        """Тестирование NDJSON с фильтрами по типу поезда и периоду."""
+        start = date.today() - timedelta(days=4)
+        response = authenticated_client.get('/api/v1/records/stream/', {
+            'train__type': 'Ласточка',
+            'record_date__gte': start.isoformat(),
+            'fields': 'id,train_name,record_date,total_mileage'
+        })
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/x-ndjson'
+        lines = [json.loads(line) for line in read_stream(response).splitlines()]
+        assert len(lines) == 5
+        assert {line['train_name'] for line in lines} == {"Поезд 1"}
+        assert all(line['record_date'] >= start.isoformat() for line in lines)
+        assert list(lines[0]) == ['id', 'train_name', 'record_date', 'total_mileage']
+
+    def test_stream_matches_list_representation(self, authenticated_client, fleet_records):
+        """Тестирование: строки потока совпадают с элементами списка."""
+        listed = authenticated_client.get('/api/v1/records/?page_size=100&pagination=cursor').json()['results']
+        streamed = [
+            json.loads(line)
+            for line in read_stream(authenticated_client.get('/api/v1/records/stream/')).splitlines()
+        ]
+
+        assert sorted(streamed, key=lambda item: item['id']) == sorted(listed, key=lambda item: item['id'])
+
+    def test_stream_csv(self, authenticated_client, fleet_records):
+        """Тестирование CSV с заголовком из имен полей."""
+        end = date.today() - timedelta(days=8)
+        response = authenticated_client.get('/api/v1/records/stream/', {
+            'format': 'csv',
+            'record_date__lte': end.isoformat(),
+            'fields': 'train_name,record_date,daily_mileage,last_to_date'
+        })
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'text/csv; charset=utf-8'
+        assert 'records.csv' in response['Content-Disposition']
+        rows = list(csv.reader(io.StringIO(read_stream(response))))
+        assert rows[0] == ['train_name', 'record_date', 'daily_mileage', 'last_to_date']
+        assert len(rows) == 1 + 4
+        assert rows[1][2] == '500'
+        assert rows[1][3] == ''
+
+    def test_stream_accept_header(self, authenticated_client, fleet_records):
+        """Тестирование выбора формата заголовком Accept."""
+        response = authenticated_client.get('/api/v1/records/stream/', HTTP_ACCEPT='text/csv')
+
+        assert response['Content-Type'] == 'text/csv; charset=utf-8'
+
+    def test_stream_unknown_field(self, authenticated_client, fleet_records):
+        """Тестирование неизвестного поля."""
+        response = authenticated_client.get('/api/v1/records/stream/', {'fields': 'unknown'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_stream_requires_authentication(self, api_client):
+        """Тестирование доступа без аутентификации."""
+        response = api_client.get('/api/v1/records/stream/')
+
+        assert response.status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
@@ -39,6 +39,23 @@ class TestDepotSerializer:
         assert data['trains_count'] == 2
         assert data['active_trains_count'] == 1
     
+    def test_depot_serialization_annotated(self, django_assert_num_queries):
+        """Тестирование сериализации депо со счетчиками из аннотаций."""
+        depot = Depot.objects.create(name="Тестовое депо")
+        Train.objects.create(name="Поезд 1", type="Ласточка", depot=depot, is_manual_mileage=True)
+        Train.objects.create(name="Поезд 2", type="Финист", depot=depot, is_active=False)
+        
+        annotated = Depot.with_train_counts().get(id=depot.id)
+        with django_assert_num_queries(0):
+            data = DepotSerializer(annotated).data
+        
+        assert data['trains_count'] == 2
+        assert data['active_trains_count'] == 1
+        assert data['manual_trains_count'] == 1
+        assert data['automatic_trains_count'] == 1
+        assert data['trains_by_type'] == {'Ласточка': 1, 'Финист': 1, 'Сапсан': 0}
+        assert DepotSerializer(depot).data == data
+    
     def test_depot_validation_empty_name(self):
         """Тестирование валидации пустого названия."""
         serializer = DepotSerializer(data={'name': ''})
@@ -358,12 +375,12 @@ class TestExcelExportSerializer:
     def test_format_choices(self):
         """Тестирование выбора формата."""
         # Тест валидного формата
-        for format_choice in ['xlsx', 'xls']:
+        for format_choice in ['xlsx', 'xls', 'csv', 'parquet']:
             serializer = ExcelExportSerializer(data={'format': format_choice})
             assert serializer.is_valid()
         
         # Тест неверного формата
-        serializer = ExcelExportSerializer(data={'format': 'csv'})
+        serializer = ExcelExportSerializer(data={'format': 'pdf'})
         assert not serializer.is_valid()
         assert 'format' in serializer.errors
 